@@ -8,9 +8,96 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_RECORD_QUERIES = True
 
+    # Monitor de queries lentas (utils/query_monitor.py)
+    QUERY_MONITOR_ENABLED = os.environ.get('QUERY_MONITOR_ENABLED', 'True').lower() == 'true'
+    SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 500))
+    # Percentual das demais queries registradas para análise offline
+    QUERY_SAMPLE_PERCENT = float(os.environ.get('QUERY_SAMPLE_PERCENT', 0))
+
     # Upload settings
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
+    # Limite da requisição inteira (vários anexos); cada arquivo continua limitado a 16MB
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH_MB', 64)) * 1024 * 1024
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'uploads'
+    # Validação de anexos em processo isolado (utils/file_validation.py)
+    FILE_VALIDATION_TIMEOUT = float(os.environ.get('FILE_VALIDATION_TIMEOUT', 5))
+    FILE_VALIDATION_MEMORY_MB = int(os.environ.get('FILE_VALIDATION_MEMORY_MB', 256))
+    # Vários anexos por registro: validação e upload em paralelo
+    MAX_ANEXOS_POR_REGISTRO = int(os.environ.get('MAX_ANEXOS_POR_REGISTRO', 10))
+    UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 4))
+    # Storage dos anexos (services/storage_service.py): auto, blob ou local
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'auto')
+    # Pasta do backend local (padrão: uploads/anexos, servida pelo X-Accel-Redirect)
+    LOCAL_STORAGE_DIR = os.environ.get('LOCAL_STORAGE_DIR')
+    # Upload retomável em partes (routes/uploads.py); o spool deve ser compartilhado entre workers
+    CHUNKED_UPLOAD_DIR = os.environ.get('CHUNKED_UPLOAD_DIR')
+    CHUNKED_UPLOAD_CHUNK_MB = int(os.environ.get('CHUNKED_UPLOAD_CHUNK_MB', 5))
+    CHUNKED_UPLOAD_MAX_MB = int(os.environ.get('CHUNKED_UPLOAD_MAX_MB', 200))
+    CHUNKED_UPLOAD_TTL_HOURS = int(os.environ.get('CHUNKED_UPLOAD_TTL_HOURS', 24))
+
+    # Download de anexos (services/download_service.py): proxy, redirect ou accel
+    DOWNLOAD_MODE = os.environ.get('DOWNLOAD_MODE', 'proxy')
+    DOWNLOAD_URL_TTL = int(os.environ.get('DOWNLOAD_URL_TTL', 300))
+    # URL base do location com secure_link no nginx e o segredo compartilhado
+    DOWNLOAD_SIGNED_BASE_URL = os.environ.get('DOWNLOAD_SIGNED_BASE_URL')
+    DOWNLOAD_SIGNING_SECRET = os.environ.get('DOWNLOAD_SIGNING_SECRET')
+    DOWNLOAD_ACCEL_BLOB_PREFIX = os.environ.get('DOWNLOAD_ACCEL_BLOB_PREFIX', '/_protected/blob')
+    DOWNLOAD_ACCEL_LOCAL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_LOCAL_PREFIX', '/_protected/uploads')
+    # Anexos em LOCAL_STORAGE_DIR fora da pasta de uploads
+    DOWNLOAD_ACCEL_STORAGE_PREFIX = os.environ.get('DOWNLOAD_ACCEL_STORAGE_PREFIX', '/_protected/anexos')
+    # Cache em disco dos blobs no modo proxy (0 desativa)
+    ATTACHMENT_CACHE_DIR = os.environ.get('ATTACHMENT_CACHE_DIR')
+    ATTACHMENT_CACHE_MAX_MB = int(os.environ.get('ATTACHMENT_CACHE_MAX_MB', 512))
+    # Miniaturas de anexos geradas em segundo plano (services/preview_service.py)
+    PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', 2))
+    PREVIEW_MAX_PENDING = int(os.environ.get('PREVIEW_MAX_PENDING', 20))
+    PREVIEW_TIMEOUT = float(os.environ.get('PREVIEW_TIMEOUT', 20))
+    # Download em lote (ZIP): limite de arquivos e buscas simultâneas no storage
+    ZIP_MAX_FILES = int(os.environ.get('ZIP_MAX_FILES', 500))
+    ZIP_FETCH_WORKERS = int(os.environ.get('ZIP_FETCH_WORKERS', 4))
+    # Contagens por faceta na pesquisa avançada (?facets=): valores por faceta e cache
+    FACET_COUNTS_LIMIT = int(os.environ.get('FACET_COUNTS_LIMIT', 50))
+    FACET_COUNTS_CACHE_TTL = int(os.environ.get('FACET_COUNTS_CACHE_TTL', 60))
+    # Cache das listas de ids da pesquisa avançada (services/search_cache.py)
+    SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 30))
+    SEARCH_CACHE_MAX_IDS = int(os.environ.get('SEARCH_CACHE_MAX_IDS', 5000))
+    SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get('SEARCH_CACHE_MAX_ENTRIES', 256))
+
+    # Backup (utils/backup.py, scripts/backup.py): dump do banco e anexos incrementais
+    BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backups')
+    BACKUP_RETENTION_DAYS = int(os.environ.get('BACKUP_RETENTION_DAYS', 30))
+    BACKUP_WORKERS = int(os.environ.get('BACKUP_WORKERS', 4))
+    BACKUP_COMPRESSION_LEVEL = int(os.environ.get('BACKUP_COMPRESSION_LEVEL', 6))
+    # Taxas de referência (MB/s por worker) da estimativa do restore (scripts/restore.py)
+    RESTORE_DB_MB_PER_SEC = float(os.environ.get('RESTORE_DB_MB_PER_SEC', 20))
+    RESTORE_FILES_MB_PER_SEC = float(os.environ.get('RESTORE_FILES_MB_PER_SEC', 10))
+
+    # Trilha de auditoria gravada em lote (services/audit_service.py)
+    AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 100))
+    AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 2))
+    AUDIT_MAX_PENDING = int(os.environ.get('AUDIT_MAX_PENDING', 10000))
+    AUDIT_ENQUEUE_TIMEOUT = float(os.environ.get('AUDIT_ENQUEUE_TIMEOUT', 0.05))
+    # Partições mensais e retenção (services/audit_partitions.py); 0 = sem retenção
+    AUDIT_RETENTION_MONTHS = int(os.environ.get('AUDIT_RETENTION_MONTHS', 24))
+    AUDIT_PARTITIONS_AHEAD = int(os.environ.get('AUDIT_PARTITIONS_AHEAD', 3))
+
+    # Snapshot das configurações do sistema (services/config_service.py):
+    # intervalo, em segundos, para cada worker conferir se houve alteração
+    CONFIG_CACHE_CHECK_INTERVAL = float(os.environ.get('CONFIG_CACHE_CHECK_INTERVAL', 5))
+
+    # Rate limiting / bloqueios (utils/rate_limit_storage.py)
+    # memory (um worker), database (tabela rate_limit_counters) ou redis
+    REDIS_URL = os.environ.get('REDIS_URL')
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_SWEEP_INTERVAL = int(os.environ.get('RATE_LIMIT_SWEEP_INTERVAL', 300))
+    # Limite de clientes rastreados no backend em memória (remoção LRU)
+    RATE_LIMIT_MAX_ENTRIES = int(os.environ.get('RATE_LIMIT_MAX_ENTRIES', 100000))
+    # Storage do Flask-Limiter (não suporta SQL - usar Redis quando disponível)
+    RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI') or \
+        os.environ.get('REDIS_URL') or 'memory://'
+
+    # Cache de tokens CSRF já verificados (utils/security.py)
+    CSRF_CACHE_TTL = int(os.environ.get('CSRF_CACHE_TTL', 300))
+    CSRF_CACHE_MAX_ENTRIES = int(os.environ.get('CSRF_CACHE_MAX_ENTRIES', 1024))
 
     # Session settings
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
@@ -67,7 +154,11 @@ class TestingConfig(Config):
 class ProductionConfig(Config):
     """Configuração de produção"""
     DEBUG = False
-    
+
+    # Gravação de queries do Flask-SQLAlchemy é cara; usar o monitor de queries lentas
+    SQLALCHEMY_RECORD_QUERIES = False
+    QUERY_SAMPLE_PERCENT = float(os.environ.get('QUERY_SAMPLE_PERCENT', 1))
+
     # Configuração inteligente do banco de dados
     DATABASE_URL = os.environ.get('DATABASE_URL')
     if DATABASE_URL:
@@ -88,6 +179,10 @@ class ProductionConfig(Config):
         SQLALCHEMY_DATABASE_URI = 'sqlite:///' + \
             os.path.join(os.path.dirname(__file__), 'database', 'app.db')
 
+    # Estado de rate limiting compartilhado entre os workers
+    RATE_LIMIT_BACKEND = os.environ.get(
+        'RATE_LIMIT_BACKEND', 'redis' if os.environ.get('REDIS_URL') else 'database')
+
     # Configurações de segurança para produção
     SESSION_COOKIE_SECURE = True  # Requer HTTPS
     SESSION_COOKIE_HTTPONLY = os.environ.get('SESSION_COOKIE_HTTPONLY', 'True').lower() == 'true'
@@ -1,4 +1,6 @@
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
+# O storage é definido por RATELIMIT_STORAGE_URI (config.py); em produção com
+# vários workers use Redis para que os limites sejam compartilhados
 limiter = Limiter(key_func=get_remote_address, default_limits=["200 per day", "50 per hour"]) 
\ No newline at end of file
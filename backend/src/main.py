@@ -10,25 +10,44 @@ from routes.configuracoes import configuracoes_bp, init_configuracoes
 from routes.importacao import importacao_bp
 from routes.password_reset import password_reset_bp
 from routes.classificacoes import classificacoes_bp
+from routes.uploads import uploads_bp
+from routes.auditoria import auditoria_bp
 from models.configuracao_workflow import ConfiguracaoWorkflow
 from models.configuracao import Configuracao, ConfiguracaoUsuario
 from models.registro import Registro
+from models.anexo import Anexo
+from models.registro_anexo import RegistroAnexo
+from models.upload_session import UploadSession
+from models.registro_faceta import RegistroFaceta
 from models.tipo_registro import TipoRegistro
 from models.obra import Obra
 from models.user import db, User
 from models.password_reset import PasswordResetToken
 from models.audit_log import AuditLog
 from models.classificacao import Classificacao
+from models.rate_limit import RateLimitCounter
 from config import config
 from flask_cors import CORS
-from flask import Flask, send_from_directory, request, jsonify
+from flask import Flask, send_from_directory, request, jsonify, g
 from sqlalchemy import text
 import os
 import sys
 import logging
+import time
 from extensions import limiter
 from flask_limiter.util import get_remote_address
-from utils.security import validate_csrf_token
+from utils.security import validate_csrf_token, security_manager
+from utils.query_monitor import init_query_monitor
+from services.attachment_cache import attachment_cache
+from services.preview_service import preview_service
+from services.chunked_upload_service import chunked_upload_service
+from services.storage_service import storage_service
+from services.facetas_service import facetas_service
+from services.search_cache import search_cache
+from services.audit_service import audit_service
+from services.audit_partitions import audit_partitions
+from services.config_service import config_service
+from services.registro_query import INDICES
 
 # Configurar logging estruturado
 logging.basicConfig(
@@ -78,8 +97,8 @@ def create_app(config_name=None):
              supports_credentials=True,
              methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
              allow_headers=["Content-Type",
-                            "Authorization", "X-Requested-With", "X-CSRFToken"],
-             expose_headers=["Content-Range", "X-Content-Range"])
+                            "Authorization", "X-Requested-With", "X-CSRFToken", "Range"],
+             expose_headers=["Content-Range", "X-Content-Range", "Accept-Ranges", "ETag"])
     else:
         # Desenvolvimento - mais permissivo
         logger.info("🌐 CORS configurado para desenvolvimento")
@@ -89,11 +108,22 @@ def create_app(config_name=None):
              supports_credentials=True,
              methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
              allow_headers=["Content-Type",
-                            "Authorization", "X-Requested-With", "X-CSRFToken"],
-             expose_headers=["Content-Range", "X-Content-Range"])
+                            "Authorization", "X-Requested-With", "X-CSRFToken", "Range"],
+             expose_headers=["Content-Range", "X-Content-Range", "Accept-Ranges", "ETag"])
 
     # Inicializar extensões
     db.init_app(app)
+    init_query_monitor(app, db)
+    security_manager.init_app(app)
+    attachment_cache.init_app(app)
+    preview_service.init_app(app, db)
+    chunked_upload_service.init_app(app)
+    storage_service.init_app(app)
+    facetas_service.init_app(app)
+    search_cache.init_app(app, db)
+    audit_service.init_app(app)
+    audit_partitions.init_app(app)
+    config_service.init_app(app)
 
     # Registrar blueprints
     app.register_blueprint(user_bp, url_prefix='/api/users')
@@ -109,6 +139,8 @@ def create_app(config_name=None):
     app.register_blueprint(importacao_bp, url_prefix='/api/importacao')
     app.register_blueprint(workflow_bp, url_prefix='/api/workflow')
     app.register_blueprint(classificacoes_bp, url_prefix='/api/classificacoes')
+    app.register_blueprint(uploads_bp, url_prefix='/api/uploads')
+    app.register_blueprint(auditoria_bp, url_prefix='/api/auditoria')
 
     # Middleware CORS manual para casos especiais
     @app.before_request
@@ -131,7 +163,7 @@ def create_app(config_name=None):
                     headers['Access-Control-Allow-Origin'] = origin
 
             headers['Access-Control-Allow-Methods'] = 'GET,POST,PUT,DELETE,OPTIONS'
-            headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization,X-Requested-With,X-CSRFToken'
+            headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization,X-Requested-With,X-CSRFToken,Range'
             headers['Access-Control-Allow-Credentials'] = 'true'
             headers['Access-Control-Max-Age'] = '86400'
 
@@ -158,11 +190,17 @@ def create_app(config_name=None):
                 
                 # Headers CORS adicionais
                 response.headers['Access-Control-Allow-Methods'] = 'GET,POST,PUT,DELETE,OPTIONS'
-                response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization,X-Requested-With,X-CSRFToken'
+                response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization,X-Requested-With,X-CSRFToken,Range'
+                # Downloads parciais/condicionais (cache de anexos)
+                response.headers['Access-Control-Expose-Headers'] = 'Content-Range,X-Content-Range,Accept-Ranges,ETag'
         except Exception as e:
             # Se houver erro, apenas log e continue
             logger.debug(f"Erro ao processar headers CORS: {e}")
 
+        # Tempo gasto na verificação CSRF (visível no DevTools do navegador)
+        if 'csrf_check_ms' in g:
+            response.headers['Server-Timing'] = f"csrf;dur={g.csrf_check_ms:.3f}"
+
         # Headers de segurança apenas em produção
         if config_name == 'production':
             response.headers['X-Content-Type-Options'] = 'nosniff'
@@ -246,7 +284,10 @@ def create_app(config_name=None):
             if request.endpoint in public_endpoints:
                 return
             token = request.headers.get('X-CSRFToken') or request.cookies.get('csrf_token')
-            if not token or not validate_csrf_token(token):
+            started = time.perf_counter()
+            valid = bool(token) and validate_csrf_token(token)
+            g.csrf_check_ms = (time.perf_counter() - started) * 1000
+            if not valid:
                 return jsonify({'message': 'CSRF token missing or invalid'}), 400
 
     limiter.init_app(app)
@@ -347,6 +388,102 @@ def migrate_classificacao_columns():
         return False
 
 
+def migrate_anexo_columns():
+    """Migração automática das colunas de anexos deduplicados e miniaturas"""
+    try:
+        # Verificar se a coluna já existe
+        result = db.session.execute(text("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name = 'registros' 
+            AND column_name = 'anexo_id'
+        """))
+
+        existing_columns = [row[0] for row in result.fetchall()]
+
+        # Adicionar anexo_id se não existir
+        if 'anexo_id' not in existing_columns:
+            logger.info("➕ Adicionando coluna anexo_id...")
+            db.session.execute(text("""
+                ALTER TABLE registros 
+                ADD COLUMN anexo_id INTEGER REFERENCES anexos(id)
+            """))
+            logger.info("✅ Coluna anexo_id adicionada")
+
+        # Colunas de miniatura na tabela anexos
+        result = db.session.execute(text("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name = 'anexos' 
+            AND column_name IN ('preview_blob_url', 'preview_blob_pathname', 'preview_caminho')
+        """))
+
+        existing_columns = [row[0] for row in result.fetchall()]
+
+        for column in ('preview_blob_url', 'preview_blob_pathname', 'preview_caminho'):
+            if column not in existing_columns:
+                logger.info(f"➕ Adicionando coluna {column}...")
+                db.session.execute(text(f"""
+                    ALTER TABLE anexos 
+                    ADD COLUMN {column} VARCHAR(500)
+                """))
+                logger.info(f"✅ Coluna {column} adicionada")
+
+        # Commit das alterações
+        db.session.commit()
+        logger.info("🎉 Migração da coluna de Anexos concluída!")
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Erro na migração de Anexos: {str(e)}")
+        db.session.rollback()
+        return False
+
+
+def migrate_registro_indices():
+    """Cria os índices de registros usados pelos filtros (services/registro_query.py)"""
+    try:
+        for nome, colunas in INDICES.items():
+            db.session.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {nome} ON registros ({', '.join(colunas)})"))
+        db.session.commit()
+        logger.info(f"✅ Índices de registros verificados ({len(INDICES)})")
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Erro ao criar índices de registros: {str(e)}")
+        db.session.rollback()
+        return False
+
+
+def migrate_registro_facetas():
+    """Preenche a tabela de facetas de pesquisa na primeira execução"""
+    try:
+        if RegistroFaceta.query.first() is not None or Registro.query.first() is None:
+            return True
+
+        logger.info("📊 Calculando facetas de pesquisa dos registros existentes...")
+        facetas_service.rebuild(db.session)
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Erro ao calcular facetas de pesquisa: {str(e)}")
+        db.session.rollback()
+        return False
+
+
+def migrate_audit_logs():
+    """Índices da auditoria e, no Postgres, partições mensais (services/audit_partitions.py)"""
+    try:
+        if audit_partitions.migrate():
+            logger.info("✅ Auditoria particionada por mês verificada")
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Erro na migração da auditoria: {str(e)}")
+        return False
+
+
 def check_database_integrity():
     """Verificar integridade do banco de dados"""
     try:
@@ -519,6 +656,12 @@ with app.app_context():
     # NOVO: Executar migração das colunas de Classificação
     migrate_classificacao_columns()
 
+    # NOVO: Executar migração da coluna de Anexos deduplicados
+    migrate_anexo_columns()
+    migrate_registro_indices()
+    migrate_registro_facetas()
+    migrate_audit_logs()
+
     if create_default_data():
         logger.info("📊 Dados padrão inicializados")
         logger.info("✅ Sistema GEDO CIMCOP inicializado com sucesso!")
@@ -0,0 +1,129 @@
+from datetime import datetime
+from models.user import db
+
+
+class AnexoIndisponivel(ValueError):
+    """O anexo foi removido (última referência liberada) antes de ser vinculado"""
+
+    def __init__(self, anexo_id):
+        super().__init__('Anexo não está mais disponível - envie o arquivo novamente')
+        self.anexo_id = anexo_id
+
+
+class Anexo(db.Model):
+    """Conteúdo de anexo endereçado pelo SHA-256, compartilhado entre registros
+
+    Arquivos idênticos (mesmo hash) são armazenados uma única vez; ref_count
+    indica quantos detentores apontam para o conteúdo: registros, anexos
+    adicionais e sessões de upload concluídas (que ainda não foram vinculadas
+    a um registro). O arquivo no storage só é removido quando a contagem
+    chega a zero.
+    """
+    __tablename__ = 'anexos'
+
+    id = db.Column(db.Integer, primary_key=True)
+    hash_sha256 = db.Column(db.String(64), nullable=False, unique=True, index=True)
+
+    # Localização do conteúdo (Vercel Blob ou sistema local)
+    blob_url = db.Column(db.String(500), nullable=True)
+    blob_pathname = db.Column(db.String(500), nullable=True)
+    caminho_anexo = db.Column(db.String(500), nullable=True)
+
+    formato_arquivo = db.Column(db.String(20), nullable=True)
+    tamanho_arquivo = db.Column(db.Integer, nullable=True)
+    content_type = db.Column(db.String(100), nullable=True)
+
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Miniatura gerada em segundo plano (services/preview_service.py)
+    preview_blob_url = db.Column(db.String(500), nullable=True)
+    preview_blob_pathname = db.Column(db.String(500), nullable=True)
+    preview_caminho = db.Column(db.String(500), nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __init__(self, hash_sha256, blob_url=None, blob_pathname=None,
+                 caminho_anexo=None, formato_arquivo=None, tamanho_arquivo=None,
+                 content_type=None, ref_count=0):
+        self.hash_sha256 = hash_sha256
+        self.blob_url = blob_url
+        self.blob_pathname = blob_pathname
+        self.caminho_anexo = caminho_anexo
+        self.formato_arquivo = formato_arquivo
+        self.tamanho_arquivo = tamanho_arquivo
+        self.content_type = content_type
+        self.ref_count = ref_count
+
+    @classmethod
+    def adicionar_referencia(cls, anexo_id):
+        """Incrementa a contagem de referências (UPDATE atômico no banco)
+
+        Levanta AnexoIndisponivel se o anexo já foi removido por uma liberação
+        concorrente: o detentor não pode ficar apontando para ele.
+        """
+        if not anexo_id:
+            return
+        result = db.session.execute(
+            db.update(cls)
+            .where(cls.id == anexo_id)
+            .values(ref_count=cls.ref_count + 1))
+        if result.rowcount == 0:
+            raise AnexoIndisponivel(anexo_id)
+
+    @classmethod
+    def remover_referencia(cls, anexo_id):
+        """Decrementa a contagem e retorna o anexo se não houver mais referências
+
+        O anexo órfão é removido da sessão; cabe ao chamador apagar o arquivo
+        do storage depois do commit.
+        """
+        if not anexo_id:
+            return None
+        db.session.execute(
+            db.update(cls)
+            .where(cls.id == anexo_id, cls.ref_count > 0)
+            .values(ref_count=cls.ref_count - 1))
+
+        anexo = db.session.get(cls, anexo_id, populate_existing=True)
+        if anexo and anexo.ref_count <= 0:
+            db.session.delete(anexo)
+            return anexo
+        return None
+
+    def tem_conteudo(self):
+        return bool(self.blob_url or self.caminho_anexo)
+
+    def tem_preview(self):
+        return bool(self.preview_blob_url or self.preview_caminho)
+
+    def arquivos_armazenados(self):
+        """Arquivos a remover do storage quando o anexo deixa de ser usado"""
+        return {
+            'blob_pathname': self.blob_pathname,
+            'caminho_anexo': self.caminho_anexo,
+            'preview_blob_pathname': self.preview_blob_pathname,
+            'preview_caminho': self.preview_caminho
+        }
+
+    def to_file_info(self):
+        """Campos de arquivo copiados para o registro"""
+        return {
+            'anexo_id': self.id,
+            'blob_url': self.blob_url,
+            'blob_pathname': self.blob_pathname,
+            'caminho_anexo': self.caminho_anexo,
+            'formato_arquivo': self.formato_arquivo,
+            'tamanho_arquivo': self.tamanho_arquivo
+        }
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'hash_sha256': self.hash_sha256,
+            'formato_arquivo': self.formato_arquivo,
+            'tamanho_arquivo': self.tamanho_arquivo,
+            'content_type': self.content_type,
+            'ref_count': self.ref_count,
+            'tem_preview': self.tem_preview(),
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -1,24 +1,52 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Text
-from sqlalchemy.ext.declarative import declarative_base
+from models.user import db
 
-Base = declarative_base()
 
+class AuditLog(db.Model):
+    """Evento de auditoria (login, usuários, registros)
 
-class AuditLog(Base):
+    Gravado em lotes por services/audit_service.py, fora do caminho da
+    requisição. old_values/new_values guardam JSON já sanitizado.
+
+    No Postgres a tabela é particionada por mês em timestamp
+    (services/audit_partitions.py); a chave primária física é (id, timestamp).
+    """
     __tablename__ = 'audit_logs'
+    __table_args__ = (
+        db.Index('ix_audit_logs_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_audit_logs_table_record', 'table_name', 'record_id'),
+        db.Index('ix_audit_logs_obra_timestamp', 'obra_id', 'timestamp'),
+        db.Index('ix_audit_logs_timestamp_id', 'timestamp', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    username = db.Column(db.String(100), nullable=True)
+    action = db.Column(db.String(100), nullable=False)
+    table_name = db.Column(db.String(100), nullable=True)
+    record_id = db.Column(db.Integer, nullable=True)
+    obra_id = db.Column(db.Integer, nullable=True)
+    old_values = db.Column(db.Text, nullable=True)
+    new_values = db.Column(db.Text, nullable=True)
+    ip_address = db.Column(db.String(45), nullable=True)
+    user_agent = db.Column(db.Text, nullable=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, nullable=True)
-    username = Column(String(100), nullable=True)
-    action = Column(String(100), nullable=False)
-    table_name = Column(String(100), nullable=True)
-    record_id = Column(Integer, nullable=True)
-    old_values = Column(Text, nullable=True)
-    new_values = Column(Text, nullable=True)
-    ip_address = Column(String(45), nullable=True)
-    user_agent = Column(Text, nullable=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'username': self.username,
+            'action': self.action,
+            'table_name': self.table_name,
+            'record_id': self.record_id,
+            'obra_id': self.obra_id,
+            'old_values': self.old_values,
+            'new_values': self.new_values,
+            'ip_address': self.ip_address,
+            'user_agent': self.user_agent,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None
+        }
 
     def __repr__(self):
         return f'<AuditLog {self.action} by {self.username} at {self.timestamp}>'
@@ -1,7 +1,29 @@
+import json
 from datetime import datetime
 from models.user import db
 
 
+def converter_valor(tipo, valor):
+    """Converte o valor armazenado (texto) para o tipo da configuração"""
+    if valor is None:
+        return None
+
+    if tipo == 'boolean':
+        return valor.lower() in ('true', '1', 'yes', 'on')
+    elif tipo == 'integer':
+        try:
+            return int(valor)
+        except (ValueError, TypeError):
+            return 0
+    elif tipo == 'json':
+        try:
+            return json.loads(valor)
+        except (ValueError, TypeError):
+            return {}
+    else:
+        return valor
+
+
 class Configuracao(db.Model):
     __tablename__ = 'configuracoes'
 
@@ -42,31 +64,13 @@ class Configuracao(db.Model):
 
     def get_valor_tipado(self):
         """Retorna o valor convertido para o tipo correto"""
-        if self.valor is None:
-            return None
-
-        if self.tipo == 'boolean':
-            return self.valor.lower() in ('true', '1', 'yes', 'on')
-        elif self.tipo == 'integer':
-            try:
-                return int(self.valor)
-            except (ValueError, TypeError):
-                return 0
-        elif self.tipo == 'json':
-            try:
-                import json
-                return json.loads(self.valor)
-            except (ValueError, TypeError):
-                return {}
-        else:
-            return self.valor
+        return converter_valor(self.tipo, self.valor)
 
     def set_valor_tipado(self, valor):
         """Define o valor convertendo para string"""
         if valor is None:
             self.valor = None
         elif self.tipo == 'json':
-            import json
             self.valor = json.dumps(valor)
         else:
             self.valor = str(valor)
@@ -0,0 +1,25 @@
+from models.user import db
+
+
+class RateLimitCounter(db.Model):
+    """Contadores de rate limiting/bloqueio compartilhados entre workers"""
+    __tablename__ = 'rate_limit_counters'
+
+    id = db.Column(db.Integer, primary_key=True)
+    chave = db.Column(db.String(255), nullable=False, unique=True)
+    valor = db.Column(db.Float, nullable=False, default=0)
+    # Timestamp (epoch) de expiração - usado pela limpeza periódica
+    expira_em = db.Column(db.Float, nullable=False, index=True)
+
+    def __init__(self, chave, valor, expira_em):
+        self.chave = chave
+        self.valor = valor
+        self.expira_em = expira_em
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'chave': self.chave,
+            'valor': self.valor,
+            'expira_em': self.expira_em
+        }
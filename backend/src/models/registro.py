@@ -2,6 +2,8 @@ from datetime import datetime
 from models.user import db
 from models.obra import Obra
 from models.tipo_registro import TipoRegistro
+from models.anexo import Anexo
+from models.registro_anexo import RegistroAnexo
 
 # NOVO: Importar serviço de criptografia
 from services.encryption_service import encryption_service
@@ -12,16 +14,21 @@ class Registro(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     titulo = db.Column(db.String(200), nullable=False)
-    tipo_registro = db.Column(db.String(50), nullable=False)
-    data_registro = db.Column(
-        db.DateTime, nullable=False, default=datetime.utcnow)
+    # active_history nas colunas das facetas de pesquisa: o valor anterior é
+    # carregado antes da troca mesmo com o atributo expirado (após um commit),
+    # para services/facetas_service.py descontar a faceta antiga
+    tipo_registro = db.column_property(
+        db.Column(db.String(50), nullable=False), active_history=True)
+    data_registro = db.column_property(
+        db.Column(db.DateTime, nullable=False, default=datetime.utcnow), active_history=True)
     codigo_numero = db.Column(db.String(50), nullable=True)
 
     # MANTIDO: Campo descrição original para compatibilidade total
     descricao = db.Column(db.Text, nullable=False)
 
     # NOVO: Campos de classificação
-    classificacao_grupo = db.Column(db.String(100), nullable=True)
+    classificacao_grupo = db.column_property(
+        db.Column(db.String(100), nullable=True), active_history=True)
     classificacao_subgrupo = db.Column(db.String(100), nullable=True)
     classificacao_id = db.Column(db.Integer, db.ForeignKey(
         'classificacoes.id'), nullable=True)
@@ -32,6 +39,8 @@ class Registro(db.Model):
     blob_url = db.Column(db.String(500), nullable=True)  # URL do Vercel Blob
     # Pathname para deletar
     blob_pathname = db.Column(db.String(500), nullable=True)
+    # NOVO: Conteúdo deduplicado por SHA-256 (tabela anexos)
+    anexo_id = db.Column(db.Integer, db.ForeignKey('anexos.id'), nullable=True)
 
     # MANTIDO: Nome do arquivo original para compatibilidade total
     nome_arquivo_original = db.Column(db.String(200), nullable=True)
@@ -39,12 +48,15 @@ class Registro(db.Model):
     formato_arquivo = db.Column(db.String(20), nullable=True)
     tamanho_arquivo = db.Column(db.Integer, nullable=True)
 
-    autor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    obra_id = db.Column(db.Integer, db.ForeignKey('obras.id'), nullable=False)
+    autor_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False), active_history=True)
+    obra_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey('obras.id'), nullable=False), active_history=True)
     tipo_registro_id = db.Column(db.Integer, db.ForeignKey(
         'tipos_registro.id'), nullable=True)
 
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.column_property(
+        db.Column(db.DateTime, default=datetime.utcnow), active_history=True)
     updated_at = db.Column(
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -53,12 +65,18 @@ class Registro(db.Model):
     tipo_registro_rel = db.relationship(
         'TipoRegistro', overlaps="registros,tipo_registro_obj")
     classificacao_rel = db.relationship('Classificacao', backref='registros')
+    anexo = db.relationship('Anexo', lazy='joined')
+    # Anexos além do primeiro (o primeiro continua nas colunas acima)
+    anexos_adicionais = db.relationship(
+        'RegistroAnexo', lazy='selectin', order_by='RegistroAnexo.ordem',
+        cascade='all, delete-orphan', passive_deletes=True)
 
     def __init__(self, titulo, tipo_registro, descricao, autor_id, obra_id,
                  data_registro=None, codigo_numero=None, caminho_anexo=None,
                  nome_arquivo_original=None, formato_arquivo=None, tamanho_arquivo=None,
                  tipo_registro_id=None, blob_url=None, blob_pathname=None,
-                 classificacao_grupo=None, classificacao_subgrupo=None, classificacao_id=None):
+                 classificacao_grupo=None, classificacao_subgrupo=None, classificacao_id=None,
+                 anexo_id=None):
         self.titulo = titulo
         self.tipo_registro = tipo_registro
         self.set_descricao(descricao)  # NOVO: Usar método que criptografa
@@ -69,6 +87,7 @@ class Registro(db.Model):
         self.caminho_anexo = caminho_anexo
         self.blob_url = blob_url
         self.blob_pathname = blob_pathname
+        self.anexo_id = anexo_id
         # NOVO: Usar método que criptografa
         self.set_nome_arquivo_original(nome_arquivo_original)
         self.formato_arquivo = formato_arquivo
@@ -123,6 +142,9 @@ class Registro(db.Model):
             'formato_arquivo': self.formato_arquivo,
             'tamanho_arquivo': self.tamanho_arquivo,
             'tem_anexo': bool(self.blob_url or self.caminho_anexo),
+            'preview_url': f"/api/registros/{self.id}/preview?v={self.anexo.hash_sha256[:12]}"
+            if self.anexo and self.anexo.tem_preview() else None,
+            'anexos_adicionais': [anexo.to_dict() for anexo in self.anexos_adicionais],
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
@@ -0,0 +1,70 @@
+from datetime import datetime
+from models.user import db
+from services.encryption_service import encryption_service
+
+
+class RegistroAnexo(db.Model):
+    """Anexos adicionais de um registro (o primeiro fica nas colunas do registro)
+
+    Expõe os mesmos atributos de arquivo do Registro, de modo que o serviço
+    de download trate os dois da mesma forma.
+    """
+    __tablename__ = 'registro_anexos'
+
+    id = db.Column(db.Integer, primary_key=True)
+    registro_id = db.Column(db.Integer, db.ForeignKey(
+        'registros.id', ondelete='CASCADE'), nullable=False, index=True)
+    anexo_id = db.Column(db.Integer, db.ForeignKey('anexos.id'), nullable=False)
+    nome_arquivo_original = db.Column(db.String(200), nullable=True)
+    ordem = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    anexo = db.relationship('Anexo', lazy='joined')
+
+    def __init__(self, anexo_id, nome_arquivo_original=None, ordem=0):
+        self.anexo_id = anexo_id
+        self.ordem = ordem
+        self.set_nome_arquivo_original(nome_arquivo_original)
+
+    def set_nome_arquivo_original(self, nome_value):
+        """Define nome do arquivo com criptografia automática"""
+        if nome_value:
+            self.nome_arquivo_original = encryption_service.encrypt(nome_value)
+        else:
+            self.nome_arquivo_original = nome_value
+
+    def get_nome_arquivo_original(self):
+        """Obtém nome do arquivo descriptografado"""
+        return encryption_service.decrypt(self.nome_arquivo_original) if self.nome_arquivo_original else None
+
+    # Atributos de arquivo vindos do anexo deduplicado
+    @property
+    def blob_url(self):
+        return self.anexo.blob_url if self.anexo else None
+
+    @property
+    def blob_pathname(self):
+        return self.anexo.blob_pathname if self.anexo else None
+
+    @property
+    def caminho_anexo(self):
+        return self.anexo.caminho_anexo if self.anexo else None
+
+    @property
+    def formato_arquivo(self):
+        return self.anexo.formato_arquivo if self.anexo else None
+
+    @property
+    def tamanho_arquivo(self):
+        return self.anexo.tamanho_arquivo if self.anexo else None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'nome_arquivo_original': self.get_nome_arquivo_original(),
+            'formato_arquivo': self.formato_arquivo,
+            'tamanho_arquivo': self.tamanho_arquivo,
+            'anexo_url': f"/api/registros/{self.registro_id}/anexos/{self.id}/download",
+            'preview_url': f"/api/registros/{self.registro_id}/anexos/{self.id}/preview?v={self.anexo.hash_sha256[:12]}"
+            if self.anexo and self.anexo.tem_preview() else None
+        }
@@ -0,0 +1,35 @@
+from models.user import db
+
+
+class RegistroFaceta(db.Model):
+    """Resumo por obra dos valores presentes nos registros (painel de filtros)
+
+    Cada linha conta quantos registros da obra têm o valor na faceta:
+    tipo_registro, autor, classificacao_grupo, data_registro e criacao (datas
+    por dia, YYYY-MM-DD). Mantida a cada escrita de registro por
+    services/facetas_service.py.
+    """
+    __tablename__ = 'registro_facetas'
+    __table_args__ = (
+        db.UniqueConstraint('obra_id', 'faceta', 'valor', name='uq_registro_faceta'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    obra_id = db.Column(db.Integer, db.ForeignKey('obras.id'), nullable=False, index=True)
+    faceta = db.Column(db.String(30), nullable=False)
+    valor = db.Column(db.String(200), nullable=False)
+    contagem = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, obra_id, faceta, valor, contagem=0):
+        self.obra_id = obra_id
+        self.faceta = faceta
+        self.valor = valor
+        self.contagem = contagem
+
+    def to_dict(self):
+        return {
+            'obra_id': self.obra_id,
+            'faceta': self.faceta,
+            'valor': self.valor,
+            'contagem': self.contagem
+        }
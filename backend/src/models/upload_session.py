@@ -0,0 +1,77 @@
+import uuid
+from datetime import datetime, timedelta
+from models.user import db
+
+
+class UploadSession(db.Model):
+    """Upload de anexo em partes (retomável)
+
+    O conteúdo recebido fica em um arquivo temporário (spool) até o
+    complete; o estado fica no banco para que qualquer worker aceite a
+    próxima parte.
+    """
+    __tablename__ = 'upload_sessions'
+
+    id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+
+    nome_arquivo = db.Column(db.String(200), nullable=False)
+    mimetype = db.Column(db.String(100), nullable=True)
+    detected_type = db.Column(db.String(100), nullable=True)
+
+    tamanho_total = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    bytes_recebidos = db.Column(db.BigInteger, nullable=False, default=0)
+    chunks_recebidos = db.Column(db.Integer, nullable=False, default=0)
+
+    # em_andamento -> completo (anexo_id preenchido)
+    status = db.Column(db.String(20), nullable=False, default='em_andamento')
+    hash_sha256 = db.Column(db.String(64), nullable=True)
+    anexo_id = db.Column(db.Integer, db.ForeignKey('anexos.id'), nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    anexo = db.relationship('Anexo')
+
+    def __init__(self, user_id, nome_arquivo, tamanho_total, chunk_size,
+                 mimetype=None, ttl_hours=24):
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.nome_arquivo = nome_arquivo
+        self.mimetype = mimetype
+        self.tamanho_total = tamanho_total
+        self.chunk_size = chunk_size
+        self.bytes_recebidos = 0
+        self.chunks_recebidos = 0
+        self.status = 'em_andamento'
+        self.expires_at = datetime.utcnow() + timedelta(hours=ttl_hours)
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.tamanho_total // self.chunk_size))
+
+    def tamanho_esperado(self, chunk_index):
+        """Tamanho que a parte `chunk_index` deve ter"""
+        if not 0 <= chunk_index < self.total_chunks:
+            raise ValueError(f"Parte {chunk_index} fora do intervalo (0-{self.total_chunks - 1})")
+        if chunk_index < self.total_chunks - 1:
+            return self.chunk_size
+        return self.tamanho_total - self.chunk_size * (self.total_chunks - 1)
+
+    def is_expired(self):
+        return datetime.utcnow() > self.expires_at
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'nome_arquivo': self.nome_arquivo,
+            'status': self.status,
+            'tamanho_total': self.tamanho_total,
+            'chunk_size': self.chunk_size,
+            'total_chunks': self.total_chunks,
+            'bytes_recebidos': self.bytes_recebidos,
+            'proximo_chunk': self.chunks_recebidos if self.status == 'em_andamento' else None,
+            'anexo_id': self.anexo_id,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
@@ -0,0 +1,111 @@
+"""
+Consulta da trilha de auditoria (apenas administradores)
+
+Paginação por cursor (keyset) em (timestamp, id), do mais recente para o
+mais antigo: cada página continua do último evento da anterior, com custo
+constante em qualquer profundidade. Os filtros usam os índices de
+models/audit_log.py e, no Postgres, o intervalo de datas limita as
+partições lidas.
+"""
+import base64
+import json
+from datetime import datetime, time
+from flask import Blueprint, request, jsonify
+from sqlalchemy import tuple_
+from models.audit_log import AuditLog
+from routes.auth import token_required, admin_required
+
+auditoria_bp = Blueprint('auditoria', __name__)
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 200
+
+
+class ParametroInvalido(ValueError):
+    """Parâmetro de consulta inválido (a mensagem vai para a resposta 400)"""
+
+
+def _inteiro(nome):
+    valor = request.args.get(nome, '').strip()
+    if not valor:
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise ParametroInvalido(f'{nome} deve ser um número inteiro')
+
+
+def _data(nome):
+    valor = request.args.get(nome, '').strip()
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        raise ParametroInvalido(f'Formato de {nome} inválido (use YYYY-MM-DD)')
+
+
+def encode_cursor(evento):
+    payload = json.dumps([evento.timestamp.isoformat(), evento.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, evento_id = json.loads(payload)
+        return datetime.fromisoformat(timestamp), int(evento_id)
+    except (ValueError, TypeError):
+        raise ParametroInvalido('Cursor inválido')
+
+
+@auditoria_bp.route('/', methods=['GET'])
+@token_required
+@admin_required
+def listar_eventos(current_user):
+    """Eventos de auditoria filtrados, do mais recente para o mais antigo
+
+    Filtros: user_id, obra_id, table_name + record_id, action,
+    data_inicio/data_fim (YYYY-MM-DD, inclusivos). Paginação: limit e o
+    next_cursor da página anterior em cursor.
+    """
+    try:
+        query = AuditLog.query
+        for nome in ('user_id', 'obra_id', 'record_id'):
+            valor = _inteiro(nome)
+            if valor is not None:
+                query = query.filter(getattr(AuditLog, nome) == valor)
+        for nome in ('table_name', 'action'):
+            valor = request.args.get(nome, '').strip()
+            if valor:
+                query = query.filter(getattr(AuditLog, nome) == valor)
+
+        data_inicio, data_fim = _data('data_inicio'), _data('data_fim')
+        if data_inicio:
+            query = query.filter(AuditLog.timestamp >= datetime.combine(data_inicio, time.min))
+        if data_fim:
+            query = query.filter(AuditLog.timestamp <= datetime.combine(data_fim, time.max))
+
+        cursor = request.args.get('cursor', '').strip()
+        if cursor:
+            query = query.filter(
+                tuple_(AuditLog.timestamp, AuditLog.id) < tuple_(*decode_cursor(cursor)))
+
+        limite = _inteiro('limit') or LIMITE_PADRAO
+        limite = max(1, min(limite, LIMITE_MAXIMO))
+
+        # Um evento a mais indica se existe próxima página, sem COUNT
+        eventos = query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()) \
+            .limit(limite + 1).all()
+        proxima = eventos[limite - 1] if len(eventos) > limite else None
+
+        return jsonify({
+            'eventos': [evento.to_dict() for evento in eventos[:limite]],
+            'limit': limite,
+            'next_cursor': encode_cursor(proxima) if proxima else None
+        }), 200
+
+    except ParametroInvalido as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
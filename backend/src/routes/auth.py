@@ -3,7 +3,8 @@ from werkzeug.security import check_password_hash
 from models.user import User, db
 from models.obra import Obra
 from utils.validators import ValidationError, validar_email, validar_senha, validar_username, validar_role, validar_json_data
-from utils.security import audit_log, security_manager, generate_csrf_token, security_check_decorator
+from utils.security import (audit_log, security_manager, generate_csrf_token, security_check_decorator,
+                            csrf_metrics)
 from functools import wraps
 import jwt
 import os
@@ -121,29 +122,6 @@ def sanitize_log_data(data):
     else:
         return data
 
-# Atualizar a função audit_log para usar sanitização
-
-
-def audit_log(action, user_id=None, details=None):
-    """Registra eventos de auditoria com sanitização"""
-    try:
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'action': action,
-            'user_id': user_id,
-            'ip': request.remote_addr if request else 'unknown',
-            'user_agent_hash': hashlib.sha256(request.headers.get('User-Agent', '').encode()).hexdigest()[:16] if request else 'unknown',
-            'details': sanitize_log_data(details or {}),
-            'request_id': uuid.uuid4().hex[:8]
-        }
-
-        logger.info(f"AUDIT: {log_entry}")
-        return log_entry
-    except Exception as e:
-        logger.error(f"Erro ao registrar log de auditoria: {e}")
-        return None
-
-
 @auth_bp.route('/login', methods=['POST'])
 @security_check_decorator  # Adicionar esta linha
 @limiter.limit("3 per minute;10 per hour")
@@ -189,7 +167,8 @@ def login():
                 'email_hash': hashlib.sha256(email.encode()).hexdigest()[:16],
                 'ip': ip_address,
                 'reason': 'authentication_failed'
-            })
+            }, table_name='users', record_id=user.id, username=user.username,
+                include_security_status=True)
             return jsonify({'message': 'Credenciais inválidas'}), 401
 
         # Verificar se usuário está ativo
@@ -210,7 +189,7 @@ def login():
         audit_log('LOGIN_SUCCESS', user.id, {
             'ip': ip_address,
             'user_agent_hash': hashlib.sha256(request.headers.get('User-Agent', '').encode()).hexdigest()[:16]
-        })
+        }, table_name='users', record_id=user.id, username=user.username)
 
         # Atualizar último login
         user.ultimo_login = datetime.utcnow()
@@ -537,3 +516,11 @@ def get_csrf_token():
     response = jsonify({'csrf_token': token})
     response.set_cookie('csrf_token', token, httponly=False, samesite='Lax')
     return response
+
+
+@csrf_bp.route('/csrf-metrics', methods=['GET'])
+@token_required
+@admin_required
+def get_csrf_metrics(current_user):
+    """Métricas de validação de CSRF deste worker (apenas admin)"""
+    return jsonify({'csrf_metrics': csrf_metrics.snapshot()}), 200
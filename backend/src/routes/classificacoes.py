@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from models.classificacao import Classificacao, db
 from routes.auth import token_required
+from services.reference_cache import reference_cache
 from sqlalchemy import or_
 
 classificacoes_bp = Blueprint('classificacoes', __name__)
@@ -10,29 +11,32 @@ classificacoes_bp = Blueprint('classificacoes', __name__)
 @token_required
 def listar_classificacoes(current_user):
     try:
-        # Buscar todas as classificações ativas
-        classificacoes = Classificacao.query.filter_by(ativo=True).order_by(
-            Classificacao.grupo, Classificacao.subgrupo
-        ).all()
+        # Buscar todas as classificações ativas (cacheado por versão, com ETag)
+        def build():
+            classificacoes = Classificacao.query.filter_by(ativo=True).order_by(
+                Classificacao.grupo, Classificacao.subgrupo
+            ).all()
 
-        # Organizar por grupo e subgrupo
-        grupos = {}
-        for classificacao in classificacoes:
-            if classificacao.grupo not in grupos:
-                grupos[classificacao.grupo] = {}
+            # Organizar por grupo e subgrupo
+            grupos = {}
+            for classificacao in classificacoes:
+                if classificacao.grupo not in grupos:
+                    grupos[classificacao.grupo] = {}
 
-            if classificacao.subgrupo not in grupos[classificacao.grupo]:
-                grupos[classificacao.grupo][classificacao.subgrupo] = []
+                if classificacao.subgrupo not in grupos[classificacao.grupo]:
+                    grupos[classificacao.grupo][classificacao.subgrupo] = []
 
-            grupos[classificacao.grupo][classificacao.subgrupo].append({
-                'id': classificacao.id,
-                'subgrupo': classificacao.subgrupo
-            })
+                grupos[classificacao.grupo][classificacao.subgrupo].append({
+                    'id': classificacao.id,
+                    'subgrupo': classificacao.subgrupo
+                })
 
-        return jsonify({
-            'classificacoes': grupos,
-            'total': len(classificacoes)
-        }), 200
+            return {
+                'classificacoes': grupos,
+                'total': len(classificacoes)
+            }
+
+        return reference_cache.response('classificacoes:ativas', ('classificacoes',), build)
 
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -42,10 +46,9 @@ def listar_classificacoes(current_user):
 @token_required
 def listar_grupos(current_user):
     try:
-        grupos = Classificacao.get_grupos()
-        return jsonify({
-            'grupos': grupos
-        }), 200
+        return reference_cache.response(
+            'classificacoes:grupos', ('classificacoes',),
+            lambda: {'grupos': Classificacao.get_grupos()})
 
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -55,10 +58,10 @@ def listar_grupos(current_user):
 @token_required
 def listar_subgrupos_por_grupo(current_user, grupo):
     try:
-        subgrupos = Classificacao.get_subgrupos_por_grupo(grupo)
-        return jsonify({
-            'subgrupos': subgrupos
-        }), 200
+        return reference_cache.response(
+            'classificacoes:subgrupos', ('classificacoes',),
+            lambda: {'subgrupos': Classificacao.get_subgrupos_por_grupo(grupo)},
+            scope=grupo)
 
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -93,6 +96,7 @@ def criar_classificacao(current_user):
 
         db.session.add(nova_classificacao)
         db.session.commit()
+        reference_cache.bump('classificacoes')
 
         return jsonify({
             'message': 'Classificação criada com sucesso',
@@ -125,6 +129,7 @@ def atualizar_classificacao(current_user, classificacao_id):
             classificacao.ativo = data['ativo']
 
         db.session.commit()
+        reference_cache.bump('classificacoes')
 
         return jsonify({
             'message': 'Classificação atualizada com sucesso',
@@ -150,6 +155,7 @@ def deletar_classificacao(current_user, classificacao_id):
         # Soft delete - apenas marcar como inativo
         classificacao.ativo = False
         db.session.commit()
+        reference_cache.bump('classificacoes')
 
         return jsonify({
             'message': 'Classificação desativada com sucesso'
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from models.configuracao import Configuracao, ConfiguracaoUsuario, db
 from routes.auth import token_required, admin_required
+from services.config_service import config_service
 import json
 
 configuracoes_bp = Blueprint('configuracoes', __name__)
@@ -36,8 +37,8 @@ def inicializar_configuracoes_padrao():
         # Configurações de Sistema
         {
             'chave': 'max_tamanho_arquivo',
-            'valor': '50',
-            'descricao': 'Tamanho máximo de arquivo em MB',
+            'valor': '16',
+            'descricao': 'Tamanho máximo de arquivo em MB (até 16)',
             'tipo': 'integer',
             'categoria': 'sistema',
             'editavel_usuario': False
@@ -139,31 +140,23 @@ def inicializar_configuracoes_padrao():
 def listar_configuracoes(current_user):
     """Lista configurações baseado no perfil do usuário"""
     try:
-        if current_user.role == 'administrador':
-            # Admin vê todas as configurações
-            configuracoes = Configuracao.query.all()
-        else:
-            # Usuário comum vê apenas configurações editáveis
-            configuracoes = Configuracao.query.filter_by(
-                editavel_usuario=True).all()
-
-        # Buscar configurações personalizadas do usuário
-        configs_usuario = ConfiguracaoUsuario.query.filter_by(
-            user_id=current_user.id).all()
-        configs_usuario_dict = {
-            config.chave: config.valor for config in configs_usuario}
+        # Admin vê todas as configurações; usuário comum apenas as editáveis
+        configuracoes = config_service.snapshot().entradas(
+            somente_editaveis=current_user.role != 'administrador')
+
+        # Configurações personalizadas do usuário (já convertidas pelo tipo)
+        configs_usuario_dict = config_service.user_overrides(current_user.id)
 
         # Organizar por categoria
         resultado = {}
-        for config in configuracoes:
-            categoria = config.categoria
+        for config_dict in configuracoes:
+            categoria = config_dict['categoria']
             if categoria not in resultado:
                 resultado[categoria] = []
 
-            config_dict = config.to_dict()
             # Sobrescrever com configuração personalizada do usuário se existir
-            if config.chave in configs_usuario_dict:
-                config_dict['valor'] = configs_usuario_dict[config.chave]
+            if config_dict['chave'] in configs_usuario_dict:
+                config_dict['valor'] = configs_usuario_dict[config_dict['chave']]
                 config_dict['personalizada'] = True
             else:
                 config_dict['personalizada'] = False
@@ -226,6 +219,7 @@ def atualizar_configuracoes(current_user):
                         db.session.add(config_usuario)
 
         db.session.commit()
+        config_service.invalidate()
         return jsonify({'message': 'Configurações atualizadas com sucesso'}), 200
 
     except Exception as e:
@@ -246,6 +240,7 @@ def resetar_configuracoes(current_user):
         inicializar_configuracoes_padrao()
 
         db.session.commit()
+        config_service.invalidate()
         return jsonify({'message': 'Configurações resetadas para valores padrão'}), 200
 
     except Exception as e:
@@ -5,6 +5,7 @@ from models.obra import Obra
 from models.tipo_registro import TipoRegistro
 from models.classificacao import Classificacao
 from routes.auth import token_required, obra_access_required
+from services.registro_query import RegistroQuerySpec, FiltroInvalido
 from sqlalchemy import func, and_, or_
 from datetime import datetime, timedelta
 import calendar
@@ -17,17 +18,9 @@ dashboard_bp = Blueprint('dashboard', __name__)
 @obra_access_required
 def get_estatisticas(current_user):
     try:
-        # Parâmetros de filtro
-        obra_id = request.args.get('obra_id', type=int)
-
-        # Query base
-        query = Registro.query
-
-        # Aplicar filtros de acesso baseado no usuário
-        if current_user.role == 'usuario_padrao':
-            query = query.filter_by(obra_id=current_user.obra_id)
-        elif obra_id:
-            query = query.filter_by(obra_id=obra_id)
+        # Filtros compartilhados com a pesquisa (services/registro_query.py)
+        spec = RegistroQuerySpec.from_args(request.args, current_user)
+        query = spec.apply(Registro.query)
 
         # Total de registros
         total_registros = query.count()
@@ -49,36 +42,20 @@ def get_estatisticas(current_user):
         registros_sem_anexo = total_registros - registros_com_anexo
 
         # Registros por tipo
-        registros_por_tipo_query = db.session.query(
+        registros_por_tipo_query = spec.apply(db.session.query(
             Registro.tipo_registro,
             func.count(Registro.id).label('count')
-        )
-
-        # Aplicar mesmo filtro de obra
-        if current_user.role == 'usuario_padrao':
-            registros_por_tipo_query = registros_por_tipo_query.filter_by(
-                obra_id=current_user.obra_id)
-        elif obra_id:
-            registros_por_tipo_query = registros_por_tipo_query.filter_by(
-                obra_id=obra_id)
+        ))
 
         registros_por_tipo = registros_por_tipo_query.group_by(
             Registro.tipo_registro
         ).order_by(func.count(Registro.id).desc()).all()
 
         # Registros por classificação (grupo)
-        registros_por_classificacao_query = db.session.query(
+        registros_por_classificacao_query = spec.apply(db.session.query(
             Registro.classificacao_grupo,
             func.count(Registro.id).label('count')
-        ).filter(Registro.classificacao_grupo.isnot(None))
-
-        # Aplicar mesmo filtro de obra
-        if current_user.role == 'usuario_padrao':
-            registros_por_classificacao_query = registros_por_classificacao_query.filter_by(
-                obra_id=current_user.obra_id)
-        elif obra_id:
-            registros_por_classificacao_query = registros_por_classificacao_query.filter_by(
-                obra_id=obra_id)
+        ).filter(Registro.classificacao_grupo.isnot(None)))
 
         registros_por_classificacao = registros_por_classificacao_query.group_by(
             Registro.classificacao_grupo
@@ -86,12 +63,12 @@ def get_estatisticas(current_user):
 
         # Registros por obra (apenas para admin e quando não há filtro de obra específica)
         registros_por_obra = []
-        if current_user.role == 'administrador' and not obra_id:
-            registros_por_obra_query = db.session.query(
+        if current_user.role == 'administrador' and not spec.obra_id:
+            registros_por_obra_query = spec.apply(db.session.query(
                 Registro.obra_id,
                 Obra.nome.label('obra_nome'),
                 func.count(Registro.id).label('count')
-            ).join(Obra, Registro.obra_id == Obra.id).group_by(
+            ).join(Obra, Registro.obra_id == Obra.id)).group_by(
                 Registro.obra_id, Obra.nome
             ).order_by(func.count(Registro.id).desc()).all()
 
@@ -122,6 +99,8 @@ def get_estatisticas(current_user):
             'registros_por_obra': registros_por_obra
         }), 200
 
+    except FiltroInvalido as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
@@ -132,19 +111,13 @@ def get_estatisticas(current_user):
 def get_atividades_recentes(current_user):
     try:
         limit = request.args.get('limit', 5, type=int)
-        obra_id = request.args.get('obra_id', type=int)
+        spec = RegistroQuerySpec.from_args(request.args, current_user)
 
         # Query base
         query = db.session.query(Registro).join(
             User, Registro.autor_id == User.id)
 
-        # Aplicar filtros de acesso baseado no usuário
-        if current_user.role == 'usuario_padrao':
-            query = query.filter(Registro.obra_id == current_user.obra_id)
-        elif obra_id:
-            query = query.filter(Registro.obra_id == obra_id)
-
-        atividades = query.order_by(
+        atividades = spec.apply(query).order_by(
             Registro.created_at.desc()).limit(limit).all()
 
         return jsonify({
@@ -163,6 +136,8 @@ def get_atividades_recentes(current_user):
             ]
         }), 200
 
+    except FiltroInvalido as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
@@ -172,22 +147,16 @@ def get_atividades_recentes(current_user):
 @obra_access_required
 def get_timeline(current_user, dias):
     try:
-        obra_id = request.args.get('obra_id', type=int)
+        spec = RegistroQuerySpec.from_args(request.args, current_user)
 
         # Calcular data limite
         data_limite = datetime.utcnow() - timedelta(days=dias)
 
         # Query base
-        query = db.session.query(
+        query = spec.apply(db.session.query(
             func.date(Registro.created_at).label('data'),
             func.count(Registro.id).label('count')
-        ).filter(Registro.created_at >= data_limite)
-
-        # Aplicar filtros de acesso baseado no usuário
-        if current_user.role == 'usuario_padrao':
-            query = query.filter(Registro.obra_id == current_user.obra_id)
-        elif obra_id:
-            query = query.filter(Registro.obra_id == obra_id)
+        ).filter(Registro.created_at >= data_limite))
 
         timeline_data = query.group_by(
             func.date(Registro.created_at)
@@ -208,6 +177,8 @@ def get_timeline(current_user, dias):
             'timeline': resultado_timeline
         }), 200
 
+    except FiltroInvalido as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
@@ -217,22 +188,16 @@ def get_timeline(current_user, dias):
 @obra_access_required
 def get_resumo_mensal(current_user):
     try:
-        obra_id = request.args.get('obra_id', type=int)
+        spec = RegistroQuerySpec.from_args(request.args, current_user)
 
         # Obter ano atual
         ano_atual = datetime.utcnow().year
 
         # Query base
-        query = db.session.query(
+        query = spec.apply(db.session.query(
             func.extract('month', Registro.created_at).label('mes'),
             func.count(Registro.id).label('count')
-        ).filter(func.extract('year', Registro.created_at) == ano_atual)
-
-        # Aplicar filtros de acesso baseado no usuário
-        if current_user.role == 'usuario_padrao':
-            query = query.filter(Registro.obra_id == current_user.obra_id)
-        elif obra_id:
-            query = query.filter(Registro.obra_id == obra_id)
+        ).filter(func.extract('year', Registro.created_at) == ano_atual))
 
         dados_mensais = query.group_by(
             func.extract('month', Registro.created_at)
@@ -258,5 +223,7 @@ def get_resumo_mensal(current_user):
             'ano': ano_atual
         }), 200
 
+    except FiltroInvalido as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -1,10 +1,15 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 from models.registro import Registro, db
 from models.obra import Obra
 from models.tipo_registro import TipoRegistro
 from models.classificacao import Classificacao
+from models.anexo import Anexo
+from models.upload_session import UploadSession
 from routes.auth import token_required, obra_access_required
+from services.reference_cache import reference_cache, user_scope
+from services.download_service import content_disposition
+from services.chunked_upload_service import chunked_upload_service
 from datetime import datetime
 import pandas as pd
 import os
@@ -28,94 +33,96 @@ def allowed_file(filename):
 def download_template(current_user):
     """Gera e retorna template Excel para importação"""
     try:
-        # Buscar dados para o template
-        if current_user.role == 'administrador':
-            obras = Obra.query.all()
-        else:
-            obras = Obra.query.filter_by(id=current_user.obra_id).all()
-
-        tipos_registro = TipoRegistro.query.all()
-        classificacoes = Classificacao.query.all()
-
-        # Criar DataFrame com exemplo
-        template_data = {
-            'titulo': ['Exemplo - Contrato Principal', 'Exemplo - ART do Projeto'],
-            'tipo_registro': ['Contrato', 'ART'],
-            'tipo_registro_id': [1, 2],  # IDs dos tipos
-            'data_registro': ['2024-01-15', '2024-01-20'],
-            'codigo_numero': ['CONT-001', 'ART-001'],
-            'descricao': [
-                'Contrato principal da obra com especificações técnicas detalhadas',
-                'Anotação de Responsabilidade Técnica do projeto estrutural'
-            ],
-            'obra_id': [obras[0].id if obras else 1, obras[0].id if obras else 1],
-            'obra_nome': [obras[0].nome if obras else 'Obra Exemplo', obras[0].nome if obras else 'Obra Exemplo'],
-            'classificacao_grupo': ['Atividades em Campo', 'Planejamento, Documentos e Licenças'],
-            'classificacao_subgrupo': ['Início de Atividade', 'Entrega de Documentação/Plano/Projeto'],
-            'classificacao_id': [1, 25]  # IDs das classificações
-        }
-
-        # Criar arquivo Excel
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # Aba principal com dados
-            df_template = pd.DataFrame(template_data)
-            df_template.to_excel(writer, sheet_name='Registros', index=False)
-
-            # Aba com obras disponíveis
-            df_obras = pd.DataFrame([{
-                'id': obra.id,
-                'nome': obra.nome,
-                'codigo': obra.codigo
-            } for obra in obras])
-            df_obras.to_excel(
-                writer, sheet_name='Obras_Disponíveis', index=False)
-
-            # Aba com tipos de registro
-            df_tipos = pd.DataFrame([{
-                'id': tipo.id,
-                'nome': tipo.nome,
-                'descricao': tipo.descricao
-            } for tipo in tipos_registro])
-            df_tipos.to_excel(writer, sheet_name='Tipos_Registro', index=False)
-
-            # Aba com classificações
-            df_classificacoes = pd.DataFrame([{
-                'id': classificacao.id,
-                'grupo': classificacao.grupo,
-                'subgrupo': classificacao.subgrupo
-            } for classificacao in classificacoes])
-            df_classificacoes.to_excel(
-                writer, sheet_name='Classificações', index=False)
-
-            # Aba com instruções
-            instrucoes = pd.DataFrame({
-                'Campo': [
-                    'titulo', 'tipo_registro', 'tipo_registro_id', 'data_registro',
-                    'codigo_numero', 'descricao', 'obra_id', 'obra_nome',
-                    'classificacao_grupo', 'classificacao_subgrupo', 'classificacao_id'
-                ],
-                'Obrigatório': ['Sim', 'Sim', 'Sim', 'Sim', 'Sim', 'Sim', 'Sim', 'Não', 'Sim', 'Sim', 'Sim'],
-                'Formato': [
-                    'Texto livre', 'Nome do tipo', 'ID numérico', 'YYYY-MM-DD',
-                    'Código único', 'Texto livre', 'ID numérico', 'Apenas referência',
-                    'Nome do grupo', 'Nome do subgrupo', 'ID da classificação'
+        # Template montado uma vez por versão de obras/tipos/classificações
+        def build():
+            # Buscar dados para o template
+            if current_user.role == 'administrador':
+                obras = Obra.query.all()
+            else:
+                obras = Obra.query.filter_by(id=current_user.obra_id).all()
+
+            tipos_registro = TipoRegistro.query.all()
+            classificacoes = Classificacao.query.all()
+
+            # Criar DataFrame com exemplo
+            template_data = {
+                'titulo': ['Exemplo - Contrato Principal', 'Exemplo - ART do Projeto'],
+                'tipo_registro': ['Contrato', 'ART'],
+                'tipo_registro_id': [1, 2],  # IDs dos tipos
+                'data_registro': ['2024-01-15', '2024-01-20'],
+                'codigo_numero': ['CONT-001', 'ART-001'],
+                'descricao': [
+                    'Contrato principal da obra com especificações técnicas detalhadas',
+                    'Anotação de Responsabilidade Técnica do projeto estrutural'
                 ],
-                'Exemplo': [
-                    'Contrato Principal', 'Contrato', '1', '2024-01-15',
-                    'CONT-001', 'Descrição detalhada...', '1', 'Obra Exemplo',
-                    'Atividades em Campo', 'Início de Atividade', '1'
-                ]
-            })
-            instrucoes.to_excel(writer, sheet_name='Instruções', index=False)
-
-        output.seek(0)
-
-        return send_file(
-            BytesIO(output.read()),
+                'obra_id': [obras[0].id if obras else 1, obras[0].id if obras else 1],
+                'obra_nome': [obras[0].nome if obras else 'Obra Exemplo', obras[0].nome if obras else 'Obra Exemplo'],
+                'classificacao_grupo': ['Atividades em Campo', 'Planejamento, Documentos e Licenças'],
+                'classificacao_subgrupo': ['Início de Atividade', 'Entrega de Documentação/Plano/Projeto'],
+                'classificacao_id': [1, 25]  # IDs das classificações
+            }
+
+            # Criar arquivo Excel
+            output = BytesIO()
+            with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                # Aba principal com dados
+                df_template = pd.DataFrame(template_data)
+                df_template.to_excel(writer, sheet_name='Registros', index=False)
+
+                # Aba com obras disponíveis
+                df_obras = pd.DataFrame([{
+                    'id': obra.id,
+                    'nome': obra.nome,
+                    'codigo': obra.codigo
+                } for obra in obras])
+                df_obras.to_excel(
+                    writer, sheet_name='Obras_Disponíveis', index=False)
+
+                # Aba com tipos de registro
+                df_tipos = pd.DataFrame([{
+                    'id': tipo.id,
+                    'nome': tipo.nome,
+                    'descricao': tipo.descricao
+                } for tipo in tipos_registro])
+                df_tipos.to_excel(writer, sheet_name='Tipos_Registro', index=False)
+
+                # Aba com classificações
+                df_classificacoes = pd.DataFrame([{
+                    'id': classificacao.id,
+                    'grupo': classificacao.grupo,
+                    'subgrupo': classificacao.subgrupo
+                } for classificacao in classificacoes])
+                df_classificacoes.to_excel(
+                    writer, sheet_name='Classificações', index=False)
+
+                # Aba com instruções
+                instrucoes = pd.DataFrame({
+                    'Campo': [
+                        'titulo', 'tipo_registro', 'tipo_registro_id', 'data_registro',
+                        'codigo_numero', 'descricao', 'obra_id', 'obra_nome',
+                        'classificacao_grupo', 'classificacao_subgrupo', 'classificacao_id'
+                    ],
+                    'Obrigatório': ['Sim', 'Sim', 'Sim', 'Sim', 'Sim', 'Sim', 'Sim', 'Não', 'Sim', 'Sim', 'Sim'],
+                    'Formato': [
+                        'Texto livre', 'Nome do tipo', 'ID numérico', 'YYYY-MM-DD',
+                        'Código único', 'Texto livre', 'ID numérico', 'Apenas referência',
+                        'Nome do grupo', 'Nome do subgrupo', 'ID da classificação'
+                    ],
+                    'Exemplo': [
+                        'Contrato Principal', 'Contrato', '1', '2024-01-15',
+                        'CONT-001', 'Descrição detalhada...', '1', 'Obra Exemplo',
+                        'Atividades em Campo', 'Início de Atividade', '1'
+                    ]
+                })
+                instrucoes.to_excel(writer, sheet_name='Instruções', index=False)
+            return output.getvalue()
+
+        return reference_cache.response(
+            'importacao:template', ('obras', 'tipos_registro', 'classificacoes'), build,
+            scope=user_scope(current_user),
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'template_importacao_registros_{datetime.now().strftime("%Y%m%d")}.xlsx'
+            headers={'Content-Disposition': content_disposition(
+                f'template_importacao_registros_{datetime.now().strftime("%Y%m%d")}.xlsx')}
         )
 
     except Exception as e:
@@ -281,42 +288,50 @@ def finalizar_importacao(current_user):
 
         registros_criados = []
         erros = []
+        arquivos_removidos = []
 
         for registro_data in registros_data:
             try:
-                # Verificar se tem anexo
-                if not (registro_data.get('anexo_path') or registro_data.get('blob_url')):
+                # O anexo vem do upload_id devolvido por /upload-anexo, que
+                # pertence ao usuário e mantém uma referência ao conteúdo
+                upload_id = registro_data.get('upload_id')
+                upload = UploadSession.query.filter_by(
+                    id=upload_id, user_id=current_user.id, status='completo'
+                ).first() if upload_id else None
+                if not upload or not upload.anexo:
                     erros.append({
                         'id_temp': registro_data.get('id_temp'),
-                        'erro': 'Anexo é obrigatório'
+                        'erro': 'Anexo é obrigatório (envie o arquivo novamente)'
                     })
                     continue
 
-                # Criar registro
-                registro = Registro(
-                    titulo=registro_data['titulo'],
-                    tipo_registro=registro_data['tipo_registro'],
-                    descricao=registro_data['descricao'],
-                    autor_id=current_user.id,
-                    obra_id=registro_data['obra_id'],
-                    data_registro=datetime.strptime(
-                        registro_data['data_registro'], '%Y-%m-%d'),
-                    codigo_numero=registro_data.get('codigo_numero'),
-                    tipo_registro_id=registro_data['tipo_registro_id'],
-                    caminho_anexo=registro_data.get('anexo_path'),
-                    blob_url=registro_data.get('blob_url'),
-                    blob_pathname=registro_data.get('blob_pathname'),
-                    nome_arquivo_original=registro_data.get('nome_arquivo_original'),
-                    formato_arquivo=registro_data.get('formato_arquivo'),
-                    tamanho_arquivo=registro_data.get('tamanho_arquivo'),
-                    # Campos de classificação
-                    classificacao_id=registro_data.get('classificacao_id'),
-                    classificacao_grupo=registro_data.get('classificacao_grupo'),
-                    classificacao_subgrupo=registro_data.get('classificacao_subgrupo')
-                )
-
-                db.session.add(registro)
-                db.session.flush()  # Para obter o ID
+                file_info = upload.anexo.to_file_info()
+                file_info['nome_arquivo_original'] = upload.nome_arquivo
+
+                # Savepoint por registro: uma linha com erro não desfaz as demais
+                with db.session.begin_nested():
+                    registro = Registro(
+                        titulo=registro_data['titulo'],
+                        tipo_registro=registro_data['tipo_registro'],
+                        descricao=registro_data['descricao'],
+                        autor_id=current_user.id,
+                        obra_id=registro_data['obra_id'],
+                        data_registro=datetime.strptime(
+                            registro_data['data_registro'], '%Y-%m-%d'),
+                        codigo_numero=registro_data.get('codigo_numero'),
+                        tipo_registro_id=registro_data['tipo_registro_id'],
+                        # Campos de classificação
+                        classificacao_id=registro_data.get('classificacao_id'),
+                        classificacao_grupo=registro_data.get('classificacao_grupo'),
+                        classificacao_subgrupo=registro_data.get('classificacao_subgrupo'),
+                        **file_info
+                    )
+
+                    db.session.add(registro)
+                    db.session.flush()  # Para obter o ID
+                    # O registro toma a sua referência antes de a sessão liberar a dela
+                    Anexo.adicionar_referencia(registro.anexo_id)
+                    arquivos_removidos.append(chunked_upload_service.release(db.session, upload))
 
                 registros_criados.append({
                     'id_temp': registro_data.get('id_temp'),
@@ -332,6 +347,9 @@ def finalizar_importacao(current_user):
 
         if registros_criados:
             db.session.commit()
+            from routes.registros import delete_stored_file
+            for arquivos in arquivos_removidos:
+                delete_stored_file(arquivos)
 
             # Processar workflows para cada registro criado
             try:
@@ -374,26 +392,54 @@ def upload_anexo_temp(current_user):
         if not ('.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS):
             return jsonify({'message': 'Formato de arquivo não permitido'}), 400
 
+        # Sessões expiradas liberam os anexos que reservavam
+        chunked_upload_service.cleanup_expired(db.session)
+
         # Usar save_file (prioriza Blob, fallback local)
         from routes.registros import save_file
         file_data = save_file(file)
         if not file_data:
             return jsonify({'message': 'Erro ao salvar arquivo (Blob ou local)'}), 500
 
+        # Sessão de upload concluída: reserva o anexo (uma referência) até a
+        # finalização da importação ou a expiração
+        tamanho = file_data.get('tamanho_arquivo') or 0
+        upload = UploadSession(
+            user_id=current_user.id,
+            nome_arquivo=file_data.get('nome_arquivo_original') or secure_filename(file.filename),
+            tamanho_total=tamanho,
+            chunk_size=max(1, tamanho),
+            mimetype=file.mimetype,
+            ttl_hours=chunked_upload_service.ttl_hours
+        )
+        upload.detected_type = file_data.get('detected_type')
+        upload.bytes_recebidos = tamanho
+        upload.chunks_recebidos = 1
+        db.session.add(upload)
+        chunked_upload_service.hold(db.session, upload, db.session.get(Anexo, file_data['anexo_id']))
+        db.session.commit()
+
         # Compatibilidade: se for local, retorna anexo_path; se for Blob, retorna blob_url
         response_data = {
             'message': 'Arquivo enviado com sucesso',
             'nome_arquivo_original': file_data.get('nome_arquivo_original'),
             'formato_arquivo': file_data.get('formato_arquivo'),
             'tamanho_arquivo': file_data.get('tamanho_arquivo'),
+            'anexo_id': file_data.get('anexo_id'),
+            'upload_id': upload.id,
+            'expires_at': upload.expires_at.isoformat(),
         }
-        if 'blob_url' in file_data:
+        if file_data.get('blob_url'):
             response_data['blob_url'] = file_data['blob_url']
             response_data['blob_pathname'] = file_data.get('blob_pathname')
-        if 'caminho_anexo' in file_data:
+        if file_data.get('caminho_anexo'):
             response_data['anexo_path'] = file_data['caminho_anexo']
 
         return jsonify(response_data), 200
 
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from models.obra import Obra, db
 from models.user import User  # ✅ importado no topo
 from routes.auth import token_required, admin_required, obra_access_required
+from services.reference_cache import reference_cache, user_scope
 from datetime import datetime
 
 obras_bp = Blueprint('obras', __name__)
@@ -13,12 +14,15 @@ obras_bp.strict_slashes = False  # ✅ aceita rota com ou sem barra final
 @obra_access_required
 def list_obras(current_user):
     try:
-        if current_user.role == 'administrador':
-            obras = Obra.query.all()
-        else:
-            obras = Obra.query.filter_by(id=current_user.obra_id).all()
+        def build():
+            if current_user.role == 'administrador':
+                obras = Obra.query.all()
+            else:
+                obras = Obra.query.filter_by(id=current_user.obra_id).all()
+            return {'obras': [obra.to_dict() for obra in obras]}
 
-        return jsonify({'obras': [obra.to_dict() for obra in obras]}), 200
+        return reference_cache.response('obras:lista', ('obras',), build,
+                                        scope=user_scope(current_user))
 
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -88,6 +92,7 @@ def create_obra(current_user):
 
         db.session.add(obra)
         db.session.commit()
+        reference_cache.bump('obras')
 
         return jsonify({'message': 'Obra criada com sucesso', 'obra': obra.to_dict()}), 201
 
@@ -143,6 +148,7 @@ def update_obra(current_user, obra_id):
             obra.status = data['status']
 
         db.session.commit()
+        reference_cache.bump('obras')
 
         return jsonify({'message': 'Obra atualizada com sucesso', 'obra': obra.to_dict()}), 200
 
@@ -166,6 +172,7 @@ def delete_obra(current_user, obra_id):
 
         db.session.delete(obra)
         db.session.commit()
+        reference_cache.bump('obras')
 
         return jsonify({'message': 'Obra deletada com sucesso'}), 200
 
@@ -4,9 +4,9 @@ from models.password_reset import PasswordResetToken
 from services.email_service import enviar_email_reset_senha
 import re
 import logging
-from datetime import datetime, timedelta
 from flask_limiter.util import get_remote_address
 from extensions import limiter
+from utils.security import security_manager
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -14,9 +14,6 @@ logger = logging.getLogger(__name__)
 
 password_reset_bp = Blueprint('password_reset', __name__)
 
-# Rate limiting simples (em produção, use Redis)
-reset_attempts = {}
-
 
 def validar_email(email):
     """Valida formato do email"""
@@ -47,24 +44,14 @@ def validar_senha(senha):
 
 def verificar_rate_limit(ip_address, max_attempts=5, window_minutes=15):
     """Verifica rate limiting para tentativas de reset"""
-    now = datetime.utcnow()
-    window_start = now - timedelta(minutes=window_minutes)
-
-    if ip_address not in reset_attempts:
-        reset_attempts[ip_address] = []
-
-    # Limpar tentativas antigas
-    reset_attempts[ip_address] = [
-        attempt for attempt in reset_attempts[ip_address]
-        if attempt > window_start
-    ]
+    # Contador compartilhado entre workers (ver utils/rate_limit_storage.py)
+    attempts = security_manager.storage.incr(
+        f"password_reset:{ip_address}", window_minutes * 60)
 
     # Verificar se excedeu o limite
-    if len(reset_attempts[ip_address]) >= max_attempts:
+    if attempts > max_attempts:
         return False, f"Muitas tentativas. Tente novamente em {window_minutes} minutos."
 
-    # Registrar nova tentativa
-    reset_attempts[ip_address].append(now)
     return True, "OK"
 
 
@@ -1,10 +1,17 @@
-from flask import Blueprint, request, jsonify, send_file, redirect, Response
-from models.registro import Registro, db
+from flask import Blueprint, request, jsonify, send_file, redirect, Response, current_app
+from models.registro import Registro
 from models.obra import Obra
 from models.tipo_registro import TipoRegistro
 from routes.auth import token_required, obra_access_required
 from services.blob_service import blob_service
-from sqlalchemy import or_, and_, func
+from services.download_service import download_service
+from services.zip_service import build_zip_entries, stream_zip
+from extensions import limiter
+from services.reference_cache import reference_cache, user_scope
+from services.facetas_service import facetas_service, parse_facetas
+from services.search_cache import search_cache
+from services.registro_query import RegistroQuerySpec, FiltroInvalido
+from sqlalchemy import or_
 from datetime import datetime
 import os
 import requests
@@ -20,152 +27,64 @@ pesquisa_bp = Blueprint('pesquisa', __name__)
 @obra_access_required
 def pesquisa_avancada(current_user):
     try:
-        # Parâmetros de busca
-        palavra_chave = request.args.get('palavra_chave', '').strip()
-        obra_id = request.args.get('obra_id', type=int)
-        tipo_registro = request.args.get('tipo_registro', '').strip()
-        tipo_registro_id = request.args.get('tipo_registro_id', type=int)
-        codigo_numero = request.args.get('codigo_numero', '').strip()
-        autor_id = request.args.get('autor_id', type=int)
-        data_inicio = request.args.get('data_inicio')
-        data_fim = request.args.get('data_fim')
-        data_registro_inicio = request.args.get('data_registro_inicio')
-        data_registro_fim = request.args.get('data_registro_fim')
-        classificacao_grupo = request.args.get(
-            'classificacao_grupo', '').strip()
+        # Filtros validados uma única vez (services/registro_query.py)
+        spec = RegistroQuerySpec.from_args(request.args, current_user)
 
         # Parâmetros de paginação
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
-
-        # Query base
-        query = Registro.query
-
-        # Aplicar filtros de acesso baseado no usuário
-        if current_user.role == 'usuario_padrao':
-            query = query.filter_by(obra_id=current_user.obra_id)
-        elif obra_id:
-            query = query.filter_by(obra_id=obra_id)
-
-        # Filtro por palavra-chave (busca em título e descrição)
-        if palavra_chave:
-            query = query.filter(
-                or_(
-                    Registro.titulo.ilike(f'%{palavra_chave}%'),
-                    Registro.descricao.ilike(f'%{palavra_chave}%')
-                )
-            )
-
-        # Filtro por tipo de registro
-        if tipo_registro:
-            query = query.filter_by(tipo_registro=tipo_registro)
-
-        if tipo_registro_id:
-            query = query.filter_by(tipo_registro_id=tipo_registro_id)
-
-        # NOVO: Filtro por classificação
-        if classificacao_grupo:
-            query = query.filter_by(classificacao_grupo=classificacao_grupo)
-
-        # Filtro por código/número
-        if codigo_numero:
-            query = query.filter(
-                Registro.codigo_numero.ilike(f'%{codigo_numero}%'))
-
-        # Filtro por autor
-        if autor_id:
-            query = query.filter_by(autor_id=autor_id)
-
-        # Filtros por data de criação
-        if data_inicio:
-            try:
-                data_inicio_dt = datetime.strptime(data_inicio, '%Y-%m-%d')
-                query = query.filter(Registro.created_at >= data_inicio_dt)
-            except ValueError:
-                return jsonify({'message': 'Formato de data_inicio inválido (use YYYY-MM-DD)'}), 400
-
-        if data_fim:
-            try:
-                data_fim_dt = datetime.strptime(data_fim, '%Y-%m-%d')
-                # Adicionar 1 dia para incluir todo o dia final
-                data_fim_dt = data_fim_dt.replace(
-                    hour=23, minute=59, second=59)
-                query = query.filter(Registro.created_at <= data_fim_dt)
-            except ValueError:
-                return jsonify({'message': 'Formato de data_fim inválido (use YYYY-MM-DD)'}), 400
-
-        # Filtros por data do registro
-        if data_registro_inicio:
-            try:
-                data_registro_inicio_dt = datetime.strptime(
-                    data_registro_inicio, '%Y-%m-%d')
-                data_registro_fim_dt = data_registro_inicio_dt.replace(
-                    hour=23, minute=59, second=59)
-                query = query.filter(
-                    Registro.data_registro >= data_registro_inicio_dt,
-                    Registro.data_registro <= data_registro_fim_dt)
-            except ValueError:
-                return jsonify({'message': 'Formato de data_registro_inicio inválido (use YYYY-MM-DD)'}), 400
-
-        if data_registro_fim:
-            try:
-                data_registro_fim_dt = datetime.strptime(
-                    data_registro_fim, '%Y-%m-%d')
-                data_registro_fim_dt = data_registro_fim_dt.replace(
-                    hour=23, minute=59, second=59)
-                query = query.filter(
-                    Registro.data_registro <= data_registro_fim_dt)
-            except ValueError:
-                return jsonify({'message': 'Formato de data_registro_fim inválido (use YYYY-MM-DD)'}), 400
-
-        # Ordenação
-        ordenacao = request.args.get('ordenacao', 'data_desc')
-        if ordenacao == 'data_asc':
-            query = query.order_by(Registro.created_at.asc())
-        elif ordenacao == 'data_desc':
-            query = query.order_by(Registro.created_at.desc())
-        elif ordenacao == 'titulo_asc':
-            query = query.order_by(Registro.titulo.asc())
-        elif ordenacao == 'titulo_desc':
-            query = query.order_by(Registro.titulo.desc())
-        elif ordenacao == 'data_registro_asc':
-            query = query.order_by(Registro.data_registro.asc())
-        elif ordenacao == 'data_registro_desc':
-            query = query.order_by(Registro.data_registro.desc())
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = max(request.args.get('per_page', 20, type=int), 1)
+
+        # Contagens por faceta (opcional): ?facets=tipo,classificacao_grupo,obra,autor
+        facetas = parse_facetas(request.args.get('facets'))
+        if facetas is None:
+            return jsonify({'message': 'Parâmetro facets inválido (use tipo, classificacao_grupo, obra ou autor)'}), 400
+
+        query = spec.query()
+
+        # Paginação: a lista de ids do filtro fica em cache (a troca de
+        # página só busca os registros da página pela chave primária)
+        def buscar_ids(limite):
+            return [registro_id for (registro_id,) in
+                    query.with_entities(Registro.id).limit(limite).all()]
+
+        ids = search_cache.ids(spec.cache_key(), spec.obra_id, buscar_ids)
+        if ids is not None:
+            inicio = (page - 1) * per_page
+            ids_pagina = list(ids[inicio:inicio + per_page])
+            por_id = {registro.id: registro for registro in
+                      Registro.query.filter(Registro.id.in_(ids_pagina)).all()} if ids_pagina else {}
+            itens = [por_id[registro_id] for registro_id in ids_pagina if registro_id in por_id]
+            total = len(ids)
         else:
-            query = query.order_by(Registro.created_at.desc())
+            registros_paginados = query.paginate(
+                page=page, per_page=per_page, error_out=False
+            )
+            itens = registros_paginados.items
+            total = registros_paginados.total
+        pages = (total + per_page - 1) // per_page
 
-        # Paginação
-        registros_paginados = query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Mesma transação da página: contagens consistentes com o total
+        contagens = None
+        if facetas:
+            contagens = facetas_service.contagens(
+                query, facetas, spec.cache_key(include_order=False))
 
         return jsonify({
-            'registros': [registro.to_dict() for registro in registros_paginados.items],
+            'registros': [registro.to_dict() for registro in itens],
+            'facetas': contagens,
             'pagination': {
                 'page': page,
                 'per_page': per_page,
-                'total': registros_paginados.total,
-                'pages': registros_paginados.pages,
-                'has_next': registros_paginados.has_next,
-                'has_prev': registros_paginados.has_prev
+                'total': total,
+                'pages': pages,
+                'has_next': page < pages,
+                'has_prev': page > 1
             },
-            'filtros_aplicados': {
-                'palavra_chave': palavra_chave,
-                'obra_id': obra_id,
-                'tipo_registro': tipo_registro,
-                'tipo_registro_id': tipo_registro_id,
-                'codigo_numero': codigo_numero,
-                'autor_id': autor_id,
-                'data_inicio': data_inicio,
-                'data_fim': data_fim,
-                'data_registro_inicio': data_registro_inicio,
-                'data_registro_fim': data_registro_fim,
-                'classificacao_grupo': classificacao_grupo,
-                'ordenacao': ordenacao
-            }
+            'filtros_aplicados': spec.to_dict()
         }), 200
 
+    except FiltroInvalido as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
@@ -175,69 +94,38 @@ def pesquisa_avancada(current_user):
 @obra_access_required
 def get_filtros_disponiveis(current_user):
     try:
-        # Obras disponíveis
-        obras = []
-        if current_user.role == 'administrador':
-            obras = Obra.query.all()
-        else:
-            obra = Obra.query.get(current_user.obra_id)
-            if obra:
-                obras = [obra]
-
-        # Tipos de registro disponíveis
-        tipos_registro = TipoRegistro.query.filter_by(ativo=True).all()
-
-        # Tipos de registro únicos nos registros existentes
-        query = db.session.query(Registro.tipo_registro).distinct()
-        if current_user.role == 'usuario_padrao':
-            query = query.filter_by(obra_id=current_user.obra_id)
-
-        tipos_registro_existentes = [tipo[0]
-                                     for tipo in query.all() if tipo[0]]
-
-        # NOVO: Grupos de classificação disponíveis
-        from models.classificacao import Classificacao
-        grupos_classificacao = Classificacao.get_grupos()
-
-        # Autores (usuários que criaram registros)
-        from models.user import User
-        autores_query = db.session.query(User.id, User.username, User.email)\
-            .join(Registro, User.id == Registro.autor_id).distinct()
-
-        if current_user.role == 'usuario_padrao':
-            autores_query = autores_query.filter(
-                Registro.obra_id == current_user.obra_id)
-
-        autores = autores_query.all()
-
-        # Faixas de data disponíveis
-        data_query = db.session.query(
-            func.min(Registro.created_at).label('data_min'),
-            func.max(Registro.created_at).label('data_max'),
-            func.min(Registro.data_registro).label('data_registro_min'),
-            func.max(Registro.data_registro).label('data_registro_max')
-        )
+        # Catálogos (obras, tipos e grupos) cacheados por versão
+        def build_catalogo():
+            if current_user.role == 'administrador':
+                obras = Obra.query.all()
+            else:
+                obra = Obra.query.get(current_user.obra_id)
+                obras = [obra] if obra else []
+
+            from models.classificacao import Classificacao
+            return {
+                'obras': [obra.to_dict() for obra in obras],
+                'tipos_registro': [tipo.to_dict() for tipo in TipoRegistro.query.filter_by(ativo=True).all()],
+                'grupos_classificacao': Classificacao.get_grupos()
+            }
 
-        if current_user.role == 'usuario_padrao':
-            data_query = data_query.filter_by(obra_id=current_user.obra_id)
+        catalogo, _versao = reference_cache.get(
+            'pesquisa:filtros', ('obras', 'tipos_registro', 'classificacoes'),
+            build_catalogo, scope=user_scope(current_user))
 
-        datas = data_query.first()
+        # Valores presentes nos registros: tabela de facetas por obra
+        # (mantida a cada escrita de registro - services/facetas_service.py)
+        obra_ids = [current_user.obra_id] if current_user.role == 'usuario_padrao' else None
+        facetas = facetas_service.resumo(obra_ids)
 
         return jsonify({
-            'obras': [obra.to_dict() for obra in obras],
-            'tipos_registro': [tipo.to_dict() for tipo in tipos_registro],
-            'tipos_registro_existentes': tipos_registro_existentes,
-            'grupos_classificacao': grupos_classificacao,
-            'autores': [
-                {'id': autor_id, 'username': username, 'email': email}
-                for autor_id, username, email in autores
-            ],
-            'faixas_data': {
-                'criacao_min': datas.data_min.isoformat() if datas.data_min else None,
-                'criacao_max': datas.data_max.isoformat() if datas.data_max else None,
-                'registro_min': datas.data_registro_min.isoformat() if datas.data_registro_min else None,
-                'registro_max': datas.data_registro_max.isoformat() if datas.data_registro_max else None
-            },
+            'obras': catalogo['obras'],
+            'tipos_registro': catalogo['tipos_registro'],
+            'tipos_registro_existentes': facetas['tipos_registro'],
+            'grupos_classificacao': catalogo['grupos_classificacao'],
+            'grupos_classificacao_existentes': facetas['grupos_classificacao'],
+            'autores': facetas['autores'],
+            'faixas_data': facetas['faixas_data'],
             'opcoes_ordenacao': [
                 {'value': 'data_desc',
                     'label': 'Data de Criação (Mais Recente)'},
@@ -256,6 +144,14 @@ def get_filtros_disponiveis(current_user):
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
 
+def aplicar_filtros_exportacao(data, current_user):
+    """Filtros da pesquisa avançada recebidos em JSON (exportação e ZIP)
+
+    Levanta FiltroInvalido se algum parâmetro for inválido.
+    """
+    return RegistroQuerySpec.from_args(data, current_user).query()
+
+
 @pesquisa_bp.route('/exportar', methods=['POST'])
 @token_required
 @obra_access_required
@@ -264,59 +160,7 @@ def exportar_resultados(current_user):
         data = request.get_json()
 
         # Aplicar os mesmos filtros da pesquisa avançada (sem paginação)
-        query = Registro.query
-
-        # Aplicar filtros de acesso baseado no usuário
-        if current_user.role == 'usuario_padrao':
-            query = query.filter_by(obra_id=current_user.obra_id)
-        elif data.get('obra_id'):
-            query = query.filter_by(obra_id=data['obra_id'])
-
-        # Aplicar filtros recebidos
-        if data.get('palavra_chave'):
-            query = query.filter(
-                or_(
-                    Registro.titulo.ilike(f'%{data["palavra_chave"]}%'),
-                    Registro.descricao.ilike(f'%{data["palavra_chave"]}%')
-                )
-            )
-
-        if data.get('tipo_registro_id'):
-            query = query.filter_by(tipo_registro_id=data['tipo_registro_id'])
-
-        if data.get('classificacao_grupo'):
-            query = query.filter_by(
-                classificacao_grupo=data['classificacao_grupo'])
-
-        if data.get('codigo_numero'):
-            query = query.filter(
-                Registro.codigo_numero.ilike(f'%{data["codigo_numero"]}%'))
-
-        if data.get('data_registro_inicio'):
-            data_inicio_dt = datetime.strptime(
-                data['data_registro_inicio'], '%Y-%m-%d')
-            query = query.filter(Registro.data_registro >= data_inicio_dt)
-
-        if data.get('data_registro_fim'):
-            data_fim_dt = datetime.strptime(
-                data['data_registro_fim'], '%Y-%m-%d')
-            data_fim_dt = data_fim_dt.replace(hour=23, minute=59, second=59)
-            query = query.filter(Registro.data_registro <= data_fim_dt)
-
-        # Ordenação
-        ordenacao = data.get('ordenacao', 'data_desc')
-        if ordenacao == 'data_asc':
-            query = query.order_by(Registro.created_at.asc())
-        elif ordenacao == 'titulo_asc':
-            query = query.order_by(Registro.titulo.asc())
-        elif ordenacao == 'titulo_desc':
-            query = query.order_by(Registro.titulo.desc())
-        elif ordenacao == 'data_registro_asc':
-            query = query.order_by(Registro.data_registro.asc())
-        elif ordenacao == 'data_registro_desc':
-            query = query.order_by(Registro.data_registro.desc())
-        else:
-            query = query.order_by(Registro.created_at.desc())
+        query = aplicar_filtros_exportacao(data, current_user)
 
         # Buscar todos os registros
         registros = query.all()
@@ -421,10 +265,73 @@ def exportar_resultados(current_user):
             download_name=filename
         )
 
+    except FiltroInvalido as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': f'Erro ao exportar: {str(e)}'}), 500
 
 
+@pesquisa_bp.route('/anexos-zip', methods=['POST'])
+@limiter.limit("10 per minute")
+@token_required
+@obra_access_required
+def download_anexos_zip(current_user):
+    """Baixa os anexos de uma lista de ids ou de um filtro em um único ZIP"""
+    try:
+        data = request.get_json() or {}
+        ids = data.get('ids')
+
+        if ids:
+            if not isinstance(ids, list):
+                return jsonify({'message': 'ids deve ser uma lista'}), 400
+            try:
+                ids = [int(registro_id) for registro_id in ids]
+            except (ValueError, TypeError):
+                return jsonify({'message': 'IDs inválidos fornecidos'}), 400
+
+            query = Registro.query.filter(Registro.id.in_(ids))
+            if current_user.role == 'usuario_padrao':
+                query = query.filter_by(obra_id=current_user.obra_id)
+        else:
+            query = aplicar_filtros_exportacao(data, current_user)
+
+        query = query.filter(or_(Registro.blob_url.isnot(None),
+                                 Registro.caminho_anexo.isnot(None)))
+
+        max_arquivos = current_app.config.get('ZIP_MAX_FILES', 500)
+        registros = query.limit(max_arquivos + 1).all()
+        if not registros:
+            return jsonify({'message': 'Nenhum anexo encontrado'}), 404
+        if len(registros) > max_arquivos:
+            return jsonify({'message': f'Limite de {max_arquivos} anexos por download excedido'}), 400
+
+        # Manter a ordem da lista recebida
+        if ids:
+            posicao = {registro_id: i for i, registro_id in enumerate(ids)}
+            registros.sort(key=lambda registro: posicao[registro.id])
+
+        entries = build_zip_entries(registros)
+        if len(entries) > max_arquivos:
+            return jsonify({'message': f'Limite de {max_arquivos} anexos por download excedido'}), 400
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+        return Response(
+            stream_zip(entries,
+                       max_workers=current_app.config.get('ZIP_FETCH_WORKERS', 4)),
+            headers={
+                'Content-Type': 'application/zip',
+                'Content-Disposition': f'attachment; filename="anexos_{timestamp}.zip"',
+                'Cache-Control': 'no-store',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+
+    except ValueError as e:
+        return jsonify({'message': f'Filtro inválido: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({'message': f'Erro ao gerar ZIP: {str(e)}'}), 500
+
+
 @pesquisa_bp.route('/<int:registro_id>/visualizar', methods=['GET'])
 @token_required
 @obra_access_required
@@ -471,6 +378,17 @@ def download_anexo(current_user, registro_id):
             return jsonify({'message': 'Acesso negado a este registro'}), 403
 
         print(f"✅ DOWNLOAD: Permissões OK")
+
+        # Redirect/X-Accel-Redirect: o worker não transmite os bytes
+        direct_response = download_service.direct_response(registro)
+        if direct_response is not None:
+            return direct_response
+
+        # Blob servido do cache em disco (Range/ETag/304 via send_file)
+        cached_response = download_service.cached_response(registro)
+        if cached_response is not None:
+            return cached_response
+
         print(f"   - Tem blob_url: {bool(registro.blob_url)}")
         print(f"   - Tem caminho_anexo: {bool(registro.caminho_anexo)}")
 
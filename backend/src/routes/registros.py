@@ -1,10 +1,20 @@
-from flask import Blueprint, request, jsonify, send_file, redirect, Response
+from flask import Blueprint, request, jsonify, send_file, Response, current_app
 from werkzeug.utils import secure_filename
 from models.registro import Registro, db
+from models.anexo import Anexo
+from models.registro_anexo import RegistroAnexo
+from models.upload_session import UploadSession
 from models.obra import Obra
 from models.tipo_registro import TipoRegistro
 from routes.auth import token_required, admin_required, obra_access_required
-from services.blob_service import blob_service
+from services.download_service import (download_service, resolve_content_type,
+                                       resolve_download_name, content_disposition)
+from services.attachment_cache import attachment_cache
+from services.preview_service import preview_service
+from services.storage_service import storage_service, file_extension
+from services.chunked_upload_service import chunked_upload_service
+from services.registro_query import RegistroQuerySpec, FiltroInvalido
+from services.config_service import config_service
 from datetime import datetime
 import os
 import uuid
@@ -17,16 +27,21 @@ from flask_limiter import Limiter
 import bleach
 import logging
 import hashlib
-from PIL import Image
-import PyPDF2
+import codecs
+from io import BytesIO
 from extensions import limiter
+from utils.file_validation import validate_pdf, validate_image
+from utils.security import audit_log
+from sqlalchemy.exc import IntegrityError
+from concurrent.futures import ThreadPoolExecutor
 
 registros_bp = Blueprint('registros', __name__)
 registros_bp.strict_slashes = False
 
-# Configurações para upload de arquivos - MANTIDO para compatibilidade
-UPLOAD_FOLDER = os.path.join(os.path.dirname(
-    os.path.dirname(__file__)), 'uploads')
+# Configurações para upload de arquivos. Extensões e tamanho máximo vêm das
+# configurações do sistema (tipos_arquivo_permitidos e max_tamanho_arquivo,
+# via services/config_service.py); as constantes são o valor padrão.
+# MAX_FILE_SIZE também é o teto: max_tamanho_arquivo só reduz o limite
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg',
                       'jpeg', 'gif', 'doc', 'docx', 'xls', 'xlsx'}
 ALLOWED_MIMETYPES = {
@@ -35,16 +50,14 @@ ALLOWED_MIMETYPES = {
     'application/vnd.ms-excel', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 }
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAGIC_HEADER_SIZE = 1024
 
 logger = logging.getLogger("gedo.registros")
 
-def validate_file_magic_bytes(file):
-    """Valida arquivo usando magic bytes"""
+def validate_file_magic_bytes(header):
+    """Valida arquivo usando magic bytes (cabeçalho já lido)"""
     try:
-        file.seek(0)
-        header = file.read(1024)
-        file.seek(0)
-        
         # Detectar tipo real do arquivo
         file_type = magic.from_buffer(header, mime=True)
         
@@ -66,50 +79,54 @@ def validate_file_magic_bytes(file):
         logger.error(f"Erro na validação magic bytes: {str(e)}")
         return None, False
 
-def validate_file_content(file, file_type):
-    """Valida conteúdo específico do arquivo"""
+SUSPICIOUS_TEXT_PATTERNS = ('<script', '<?php', '<%', 'javascript:', 'vbscript:')
+
+
+def is_safe_text(stream):
+    """Texto UTF-8 sem padrões suspeitos, lido em blocos (memória constante)"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    overlap = max(len(pattern) for pattern in SUSPICIOUS_TEXT_PATTERNS) - 1
+    tail = ''
     try:
-        file.seek(0)
-        
-        if file_type == 'application/pdf':
-            # Validar PDF
-            try:
-                pdf_reader = PyPDF2.PdfReader(file)
-                # Verificar se tem pelo menos uma página
-                if len(pdf_reader.pages) == 0:
-                    return False
-                # Verificar se não está corrompido
-                for page in pdf_reader.pages[:3]:  # Verificar primeiras 3 páginas
-                    page.extract_text()
-                return True
-            except Exception:
+        for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b""):
+            # O fim do bloco anterior cobre padrões divididos entre blocos
+            text = tail + decoder.decode(chunk).lower()
+            if any(pattern in text for pattern in SUSPICIOUS_TEXT_PATTERNS):
                 return False
+            tail = text[-overlap:]
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def validate_file_content(upload, file_type):
+    """Valida conteúdo específico do arquivo (sobre o buffer já lido)"""
+    file = upload.stream()
+    try:
+        if file_type == 'application/pdf':
+            # Validar PDF: estrutura (cabeçalho, xref/trailer) e contagem de
+            # páginas em processo isolado, com limite de tempo e memória
+            # Spool do upload em partes: o processo isolado lê pelo caminho
+            is_valid, reason = validate_pdf(
+                getattr(upload, 'path', None) or upload.data,
+                timeout=current_app.config.get('FILE_VALIDATION_TIMEOUT', 5),
+                memory_mb=current_app.config.get('FILE_VALIDATION_MEMORY_MB', 256))
+            if not is_valid:
+                logger.warning(f"⚠️ PDF rejeitado: {reason}")
+            return is_valid
                 
         elif file_type.startswith('image/'):
-            # Validar imagem
-            try:
-                with Image.open(file) as img:
-                    img.verify()  # Verificar integridade
-                    # Verificar dimensões razoáveis
-                    if img.size[0] > 10000 or img.size[1] > 10000:
-                        return False
-                return True
-            except Exception:
-                return False
+            # Validar imagem pelo cabeçalho (sem decodificar pixels)
+            is_valid, reason = validate_image(
+                file, file_type,
+                memory_mb=current_app.config.get('FILE_VALIDATION_MEMORY_MB', 256))
+            if not is_valid:
+                logger.warning(f"⚠️ Imagem rejeitada: {reason}")
+            return is_valid
                 
         elif file_type == 'text/plain':
-            # Validar texto
-            try:
-                content = file.read().decode('utf-8')
-                # Verificar se não contém caracteres suspeitos
-                suspicious_patterns = ['<script', '<?php', '<%', 'javascript:', 'vbscript:']
-                content_lower = content.lower()
-                for pattern in suspicious_patterns:
-                    if pattern in content_lower:
-                        return False
-                return True
-            except Exception:
-                return False
+            return is_safe_text(file)
         
         # Para outros tipos, validação básica
         return True
@@ -118,20 +135,57 @@ def validate_file_content(file, file_type):
         logger.error(f"Erro na validação de conteúdo: {str(e)}")
         return False
     finally:
-        file.seek(0)
+        # Spool de upload em partes: arquivo aberto a cada stream()
+        file.close()
+
+class UploadBuffer:
+    """Conteúdo do upload lido uma única vez (hash e tamanho calculados na leitura)"""
+
+    def __init__(self, data, file_hash):
+        self.data = data
+        self.file_hash = file_hash
+        self.size = len(data)
+
+    @property
+    def header(self):
+        """Primeiros bytes usados na detecção por magic bytes"""
+        return self.data[:MAGIC_HEADER_SIZE]
+
+    def stream(self):
+        """Novo stream em memória sobre o mesmo buffer (sem reler o upload)"""
+        return BytesIO(self.data)
+
+
+def max_file_size():
+    """Tamanho máximo por arquivo (max_tamanho_arquivo, em bytes, até MAX_FILE_SIZE)
+
+    O arquivo é lido inteiro em memória (read_upload): o limite de 16MB por
+    arquivo não é ampliado pela configuração.
+    """
+    return min(config_service.max_upload_bytes(MAX_FILE_SIZE), MAX_FILE_SIZE)
+
+
+def allowed_extensions():
+    """Extensões aceitas (tipos_arquivo_permitidos)"""
+    return config_service.allowed_extensions(ALLOWED_EXTENSIONS)
+
+
+def read_upload(file, max_size=None):
+    """Lê o upload em uma única passada, calculando o SHA-256 e o tamanho"""
+    max_size = max_size or max_file_size()
+    file.seek(0)
+    hash_sha256 = hashlib.sha256()
+    chunks = []
+    size = 0
+    for chunk in iter(lambda: file.read(UPLOAD_CHUNK_SIZE), b""):
+        size += len(chunk)
+        if size > max_size:
+            raise ValueError(f'Arquivo muito grande (máximo {max_size/1024/1024:.1f}MB)')
+        hash_sha256.update(chunk)
+        chunks.append(chunk)
+    file.seek(0)
+    return UploadBuffer(b"".join(chunks), hash_sha256.hexdigest())
 
-def calculate_file_hash(file):
-    """Calcula hash SHA-256 do arquivo"""
-    try:
-        file.seek(0)
-        hash_sha256 = hashlib.sha256()
-        for chunk in iter(lambda: file.read(4096), b""):
-            hash_sha256.update(chunk)
-        file.seek(0)
-        return hash_sha256.hexdigest()
-    except Exception as e:
-        logger.error(f"Erro no cálculo de hash: {str(e)}")
-        return None
 
 def secure_filename_advanced(filename):
     """Sanitização avançada de nome de arquivo"""
@@ -163,7 +217,7 @@ def allowed_file(filename, mimetype=None):
         return False
     
     # Validação por extensão (mantida)
-    ext_ok = '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    ext_ok = '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions()
     
     if mimetype:
         mime_ok = mimetype in ALLOWED_MIMETYPES
@@ -180,28 +234,24 @@ def validate_file_security(file):
     if not allowed_file(file.filename, file.mimetype):
         raise ValueError('Tipo de arquivo não permitido')
     
-    # 2. Verificar tamanho
-    file.seek(0, 2)
-    size = file.tell()
-    file.seek(0)
-    
-    if size > MAX_FILE_SIZE:
-        raise ValueError(f'Arquivo muito grande (máximo {MAX_FILE_SIZE/1024/1024:.1f}MB)')
+    # 2. Leitura única: tamanho, hash e cabeçalho saem da mesma passada
+    upload = read_upload(file)
+    size = upload.size
     
     if size == 0:
         raise ValueError('Arquivo vazio')
     
     # 3. Validação por magic bytes
-    detected_type, is_valid_type = validate_file_magic_bytes(file)
+    detected_type, is_valid_type = validate_file_magic_bytes(upload.header)
     if not is_valid_type:
         raise ValueError(f'Tipo de arquivo não permitido: {detected_type}')
     
-    # 4. Validação de conteúdo
-    if not validate_file_content(file, detected_type):
+    # 4. Validação de conteúdo (sobre o buffer já lido)
+    if not validate_file_content(upload, detected_type):
         raise ValueError('Conteúdo do arquivo inválido ou corrompido')
     
-    # 5. Calcular hash para integridade
-    file_hash = calculate_file_hash(file)
+    # 5. Hash para integridade (calculado na leitura)
+    file_hash = upload.file_hash
     
     # 6. Sanitizar nome do arquivo
     safe_filename = secure_filename_advanced(file.filename)
@@ -212,65 +262,110 @@ def validate_file_security(file):
         'file_hash': file_hash,
         'safe_filename': safe_filename,
         'original_filename': file.filename,
-        'file_size': size
+        'file_size': size,
+        'upload': upload
     }
 
 
-def ensure_upload_folder():
-    """Garantir que a pasta de uploads existe - MANTIDO para compatibilidade"""
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        logger.info(f"📁 Pasta de uploads criada: {UPLOAD_FOLDER}")
+def find_anexo(file_hash):
+    """Busca conteúdo já armazenado com o mesmo SHA-256"""
+    anexo = Anexo.query.filter_by(hash_sha256=file_hash).first()
+    if anexo and anexo.tem_conteudo():
+        return anexo
+    return None
 
 
-def save_file_legacy(file):
-    """MANTIDO: Salva arquivo localmente (sistema antigo)"""
-    if file and allowed_file(file.filename, file.mimetype):
-        ensure_upload_folder()
-        filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-        file.seek(0, 2)
-        size = file.tell()
-        file.seek(0)
-        if size > MAX_FILE_SIZE:
-            raise ValueError('Arquivo muito grande (máximo 16MB)')
-        file.save(file_path)
-        return {
-            'caminho_anexo': file_path,
-            'nome_arquivo_original': filename,
-            'formato_arquivo': filename.rsplit('.', 1)[1].lower(),
-            'tamanho_arquivo': os.path.getsize(file_path)
-        }
+def register_anexo(file_data, validation_result):
+    """Registra o conteúdo recém-salvo na tabela anexos
+
+    Se outro upload do mesmo conteúdo gravou o hash antes (corrida), o arquivo
+    recém-enviado é descartado e o anexo existente é reaproveitado. Retorna
+    (anexo, criado).
+    """
+    anexo = Anexo(
+        hash_sha256=validation_result['file_hash'],
+        blob_url=file_data.get('blob_url'),
+        blob_pathname=file_data.get('blob_pathname'),
+        caminho_anexo=file_data.get('caminho_anexo'),
+        formato_arquivo=file_data.get('formato_arquivo'),
+        tamanho_arquivo=file_data.get('tamanho_arquivo'),
+        content_type=validation_result['detected_type']
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(anexo)
+        return anexo, True
+    except IntegrityError:
+        existing = find_anexo(validation_result['file_hash'])
+        if not existing:
+            raise
+        logger.info("♻️ Conteúdo gravado por upload concorrente - descartando cópia")
+        # Anexos antigos do storage local (nome = hash) podem ser o mesmo arquivo
+        if not storage_service.same_location(file_data, existing):
+            delete_stored_file(file_data)
+        return existing, False
+
+
+def delete_stored_file(stored):
+    """Remove o arquivo (e a miniatura) do storage - erros apenas logados"""
+    storage_service.delete(stored)
+
+
+def release_attachment(anexo_id=None, blob_pathname=None, caminho_anexo=None):
+    """Libera a referência de um registro ao seu arquivo
+
+    Retorna o que deve ser removido do storage depois do commit: o anexo
+    compartilhado só quando a contagem de referências chega a zero; arquivos
+    antigos (sem anexo_id) sempre.
+    """
+    if anexo_id:
+        anexo = Anexo.remover_referencia(anexo_id)
+        if anexo:
+            return anexo.arquivos_armazenados()
+        return None
+    if blob_pathname or caminho_anexo:
+        return {'blob_pathname': blob_pathname, 'caminho_anexo': caminho_anexo}
     return None
 
 
-def save_file_blob(file):
-    """NOVO: Salva arquivo no Vercel Blob"""
-    if not file or not allowed_file(file.filename, file.mimetype):
+def upload_security_info(validation_result):
+    """Metadados da validação devolvidos junto com os campos de arquivo"""
+    return {
+        'file_hash': validation_result['file_hash'],
+        'detected_type': validation_result['detected_type'],
+        'nome_arquivo_original': validation_result['safe_filename']  # Usar nome sanitizado
+    }
+
+
+def store_upload(file, validation_result):
+    """Grava o conteúdo validado no storage (Vercel Blob, fallback local)
+
+    Não acessa o banco de dados: pode rodar nas threads do pool de upload.
+    """
+    # O mesmo buffer validado é enviado ao storage (sem nova leitura)
+    upload = validation_result['upload']
+    filename = secure_filename(file.filename)
+    stored = storage_service.save(
+        upload.data, validation_result['file_hash'], filename,
+        content_type=validation_result['detected_type'], size=upload.size)
+    if not stored:
         return None
-    file.seek(0, 2)
-    size = file.tell()
-    file.seek(0)
-    if size > MAX_FILE_SIZE:
-        raise ValueError('Arquivo muito grande (máximo 16MB)')
-    try:
-        blob_data = blob_service.upload_file(file)
-        if blob_data:
-            return {
-                'blob_url': blob_data['url'],
-                'blob_pathname': blob_data['pathname'],
-                'nome_arquivo_original': secure_filename(blob_data['filename']),
-                'formato_arquivo': blob_data.get('file_extension', blob_data['filename'].rsplit('.', 1)[1].lower() if '.' in blob_data['filename'] else None),
-                'tamanho_arquivo': blob_data['size']
-            }
-    except Exception as e:
-        logger.error(f"❌ Erro no upload para Blob: {str(e)}")
-    return None
+    stored.update({
+        'nome_arquivo_original': filename,
+        'formato_arquivo': file_extension(filename),
+        'tamanho_arquivo': upload.size
+    })
+    return stored
 
 
 def save_file(file):
-    """Função principal: validação segura + salvamento"""
+    """Função principal: validação segura + salvamento
+
+    O conteúdo é deduplicado pelo SHA-256: se já existir na tabela anexos, o
+    upload para o storage é ignorado e o anexo existente é reaproveitado. O
+    chamador deve incrementar a referência (Anexo.adicionar_referencia) ao
+    vincular o anexo_id retornado a um registro e fazer o commit.
+    """
     if not file or not file.filename or file.filename.strip() == '':
         return None
     
@@ -283,28 +378,30 @@ def save_file(file):
         logger.info(f"   - Hash: {validation_result['file_hash'][:16]}...")
         logger.info(f"   - Tamanho: {validation_result['file_size']} bytes")
         
+        security_info = upload_security_info(validation_result)
+        
+        # Conteúdo idêntico já armazenado: sem novo upload
+        existing = find_anexo(validation_result['file_hash'])
+        if existing:
+            logger.info(f"♻️ Conteúdo já armazenado (anexo {existing.id}) - upload ignorado")
+            result = existing.to_file_info()
+            result.update(security_info)
+            return result
+        
         # Tentar Vercel Blob primeiro
-        blob_result = save_file_blob(file)
-        if blob_result:
-            # Adicionar informações de segurança
-            blob_result.update({
-                'file_hash': validation_result['file_hash'],
-                'detected_type': validation_result['detected_type'],
-                'nome_arquivo_original': validation_result['safe_filename']  # Usar nome sanitizado
-            })
-            logger.info(f"✅ Arquivo salvo no Vercel Blob com segurança")
-            return blob_result
+        result = store_upload(file, validation_result)
+        if not result:
+            return None
         
-        # Fallback para sistema local
-        logger.warning("⚠️ Fallback para sistema local")
-        local_result = save_file_legacy(file)
-        if local_result:
-            local_result.update({
-                'file_hash': validation_result['file_hash'],
-                'detected_type': validation_result['detected_type'],
-                'nome_arquivo_original': validation_result['safe_filename']
-            })
-        return local_result
+        anexo, _created = register_anexo(result, validation_result)
+        result.update(anexo.to_file_info())
+
+        # Miniatura gerada em segundo plano após o commit
+        if not anexo.tem_preview():
+            preview_service.schedule(db.session, anexo.id, validation_result['upload'].data,
+                                     validation_result['detected_type'])
+        result.update(security_info)
+        return result
         
     except ValueError as e:
         logger.error(f"❌ Validação de arquivo falhou: {str(e)}")
@@ -314,6 +411,161 @@ def save_file(file):
         raise ValueError("Erro interno no processamento do arquivo")
 
 
+def run_upload_tasks(func, items):
+    """Executa func(item) no pool de upload, preservando a ordem dos itens
+
+    Retorna [(resultado, exceção)]. Todas as tarefas terminam antes do
+    retorno, para que o chamador possa desfazer as que tiveram sucesso.
+    """
+    if len(items) <= 1:
+        outcomes = []
+        for item in items:
+            try:
+                outcomes.append((func(item), None))
+            except Exception as e:
+                outcomes.append((None, e))
+        return outcomes
+
+    app = current_app._get_current_object()
+    max_workers = min(app.config.get('UPLOAD_WORKERS', 4), len(items))
+
+    def run(item):
+        with app.app_context():
+            return func(item)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers),
+                            thread_name_prefix='gedo-upload') as pool:
+        futures = [pool.submit(run, item) for item in items]
+
+    return [(None, future.exception()) if future.exception() else (future.result(), None)
+            for future in futures]
+
+
+def upload_error_message(file, error):
+    nome = secure_filename_advanced(file.filename)
+    if isinstance(error, ValueError):
+        return f"{nome}: {str(error)}"
+    logger.error(f"❌ Erro no processamento do arquivo {nome}: {str(error)}")
+    return f"{nome}: erro interno no processamento do arquivo"
+
+
+def save_files(files):
+    """Validação e salvamento de vários anexos em paralelo (tudo ou nada)
+
+    Validação e upload rodam em um pool limitado (UPLOAD_WORKERS), então o
+    tempo total se aproxima do maior arquivo. Conteúdos já armazenados ou
+    repetidos na própria requisição não são enviados de novo. Se qualquer
+    arquivo falhar, os uploads já feitos são removidos e ValueError é lançado.
+
+    Retorna (file_infos na ordem recebida, arquivos novos no storage). Os
+    arquivos novos devem ser removidos com delete_stored_file se o commit
+    do registro falhar.
+    """
+    files = [file for file in files if file and file.filename and file.filename.strip() != '']
+    if not files:
+        return [], []
+
+    max_anexos = current_app.config.get('MAX_ANEXOS_POR_REGISTRO', 10)
+    if len(files) > max_anexos:
+        raise ValueError(f"Máximo de {max_anexos} anexos por registro")
+
+    # 1. Validação em paralelo
+    outcomes = run_upload_tasks(validate_file_security, files)
+    erros = [upload_error_message(file, error)
+             for file, (_result, error) in zip(files, outcomes) if error]
+    if erros:
+        logger.error(f"❌ Validação de arquivos falhou: {erros}")
+        raise ValueError(f"Arquivo rejeitado: {'; '.join(erros)}")
+    validations = [result for result, _error in outcomes]
+
+    # 2. Deduplicação: uma consulta para todos os hashes
+    hashes = {validation['file_hash'] for validation in validations}
+    anexos = {anexo.hash_sha256: anexo
+              for anexo in Anexo.query.filter(Anexo.hash_sha256.in_(hashes)).all()
+              if anexo.tem_conteudo()}
+    pendentes = {}
+    for index, validation in enumerate(validations):
+        if validation['file_hash'] not in anexos:
+            pendentes.setdefault(validation['file_hash'], index)
+
+    logger.info(f"📤 {len(files)} arquivo(s) validado(s) - {len(pendentes)} upload(s) necessário(s)")
+
+    # 3. Upload em paralelo apenas do conteúdo novo
+    indices = list(pendentes.values())
+    outcomes = run_upload_tasks(
+        lambda index: store_upload(files[index], validations[index]), indices)
+    armazenados = {}
+    erros = []
+    for index, (result, error) in zip(indices, outcomes):
+        if result and not error:
+            armazenados[validations[index]['file_hash']] = result
+        else:
+            erros.append(upload_error_message(
+                files[index], error or ValueError('falha no upload')))
+
+    if erros:
+        logger.error(f"❌ Upload de arquivos falhou - desfazendo {len(armazenados)} upload(s)")
+        for stored in armazenados.values():
+            delete_stored_file(stored)
+        raise ValueError(f"Erro no upload: {'; '.join(erros)}")
+
+    # 4. Registro na tabela anexos (thread da requisição)
+    novos = []
+    try:
+        for file_hash, stored in list(armazenados.items()):
+            validation = validations[pendentes[file_hash]]
+            anexo, created = register_anexo(stored, validation)
+            del armazenados[file_hash]
+            anexos[file_hash] = anexo
+            if created:
+                novos.append(stored)
+                if not anexo.tem_preview():
+                    preview_service.schedule(db.session, anexo.id, validation['upload'].data,
+                                             validation['detected_type'])
+    except Exception:
+        for stored in novos + list(armazenados.values()):
+            delete_stored_file(stored)
+        raise
+
+    results = []
+    for validation in validations:
+        result = anexos[validation['file_hash']].to_file_info()
+        result.update(upload_security_info(validation))
+        results.append(result)
+    return results, novos
+
+
+def claim_uploads(current_user, upload_ids):
+    """Anexos de uploads em partes já concluídos pelo usuário
+
+    Retorna (file_infos na ordem dos ids, sessões). As sessões devem ser
+    liberadas (chunked_upload_service.release) no mesmo commit que vincula os
+    anexos ao registro.
+    """
+    max_anexos = current_app.config.get('MAX_ANEXOS_POR_REGISTRO', 10)
+    if len(upload_ids) > max_anexos:
+        raise ValueError(f"Máximo de {max_anexos} anexos por registro")
+
+    sessions = UploadSession.query.filter(
+        UploadSession.id.in_(upload_ids),
+        UploadSession.user_id == current_user.id,
+        UploadSession.status == 'completo'
+    ).all()
+    por_id = {upload.id: upload for upload in sessions}
+    if len(por_id) != len(upload_ids):
+        raise ValueError('Upload não encontrado ou não concluído')
+
+    file_infos = []
+    for upload_id in upload_ids:
+        upload = por_id[upload_id]
+        if upload.anexo is None:
+            raise ValueError('Anexo do upload não está mais disponível - envie o arquivo novamente')
+        file_info = upload.anexo.to_file_info()
+        file_info['nome_arquivo_original'] = upload.nome_arquivo
+        file_infos.append(file_info)
+    return file_infos, sessions
+
+
 def validate_registro_data(data, files):
     """Valida dados do registro"""
     errors = []
@@ -332,16 +584,22 @@ def validate_registro_data(data, files):
         if not obra_id or str(obra_id).strip() == '':
             errors.append('Campo obra_id é obrigatório')
 
-    if 'anexo' in files and files['anexo'].filename != '':
-        file = files['anexo']
+    anexos = [file for file in files.getlist('anexo') if file.filename != '']
+    max_anexos = current_app.config.get('MAX_ANEXOS_POR_REGISTRO', 10)
+    if len(anexos) > max_anexos:
+        errors.append(f'Máximo de {max_anexos} anexos por registro')
+
+    max_size = max_file_size()
+    for file in anexos:
         file.seek(0, 2)
         size = file.tell()
         file.seek(0)
 
-        if size > 16 * 1024 * 1024:
-            errors.append('Arquivo muito grande (máximo 16MB)')
+        if size > max_size:
+            errors.append(f'Arquivo muito grande (máximo {max_size // (1024 * 1024)}MB): '
+                          f'{secure_filename_advanced(file.filename)}')
         if not allowed_file(file.filename, file.mimetype):
-            errors.append('Tipo de arquivo não permitido')
+            errors.append(f'Tipo de arquivo não permitido: {secure_filename_advanced(file.filename)}')
 
     return errors
 
@@ -419,6 +677,17 @@ def download_anexo(current_user, registro_id):
             return jsonify({'message': 'Acesso negado a este registro'}), 403
 
         logger.info(f"✅ DOWNLOAD: Permissões OK")
+
+        # Redirect/X-Accel-Redirect: o worker não transmite os bytes
+        direct_response = download_service.direct_response(registro)
+        if direct_response is not None:
+            return direct_response
+
+        # Blob servido do cache em disco (Range/ETag/304 via send_file)
+        cached_response = download_service.cached_response(registro)
+        if cached_response is not None:
+            return cached_response
+
         logger.info(f"   - Tem blob_url: {bool(registro.blob_url)}")
         logger.info(f"   - Tem caminho_anexo: {bool(registro.caminho_anexo)}")
 
@@ -603,43 +872,159 @@ def download_anexo(current_user, registro_id):
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
 
-@registros_bp.route('/', methods=['GET'])
+@registros_bp.route('/<int:registro_id>/preview', methods=['GET'])
 @token_required
 @obra_access_required
-def list_registros(current_user):
+def preview_anexo(current_user, registro_id):
+    """Miniatura do anexo (imutável por conteúdo - cacheável pelo navegador)"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
-        obra_id = request.args.get('obra_id', type=int)
-        tipo_registro = request.args.get('tipo_registro')
-        data_inicio = request.args.get('data_inicio')
-        data_fim = request.args.get('data_fim')
+        registro = Registro.query.get(registro_id)
+        if not registro:
+            return jsonify({'message': 'Registro não encontrado'}), 404
 
-        query = Registro.query
+        if current_user.role == 'usuario_padrao' and registro.obra_id != current_user.obra_id:
+            return jsonify({'message': 'Acesso negado a este registro'}), 403
 
-        if current_user.role == 'usuario_padrao':
-            query = query.filter_by(obra_id=current_user.obra_id)
-        elif obra_id:
-            query = query.filter_by(obra_id=obra_id)
+        return preview_response(registro.anexo)
 
-        if tipo_registro:
-            query = query.filter_by(tipo_registro=tipo_registro)
+    except Exception as e:
+        logger.error(f"❌ PREVIEW: Erro no registro {registro_id}: {str(e)}")
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
-        if data_inicio:
-            try:
-                data_inicio_dt = datetime.strptime(data_inicio, '%Y-%m-%d')
-                query = query.filter(Registro.data_registro >= data_inicio_dt)
-            except ValueError:
-                return jsonify({'message': 'Formato de data_inicio inválido (use YYYY-MM-DD)'}), 400
 
-        if data_fim:
-            try:
-                data_fim_dt = datetime.strptime(data_fim, '%Y-%m-%d')
-                query = query.filter(Registro.data_registro <= data_fim_dt)
-            except ValueError:
-                return jsonify({'message': 'Formato de data_fim inválido (use YYYY-MM-DD)'}), 400
+def preview_response(anexo):
+    """Resposta com a miniatura do anexo (ETag pelo conteúdo)"""
+    if not anexo or not anexo.tem_preview():
+        return jsonify({'message': 'Pré-visualização não disponível'}), 404
+
+    path = anexo.preview_caminho
+    if anexo.preview_blob_url:
+        path = attachment_cache.get_or_fetch(anexo.preview_blob_url, anexo.preview_blob_pathname)
+        if not path:
+            # Sem cache a miniatura passa pelo worker: a URL do Blob é
+            # pública e nunca vai para o cliente
+            return proxy_preview(anexo)
+    if not path or not os.path.exists(path):
+        return jsonify({'message': 'Pré-visualização não encontrada'}), 404
+
+    response = send_file(
+        path,
+        mimetype='image/jpeg',
+        conditional=True,
+        etag=f"preview-{anexo.hash_sha256}",
+        last_modified=anexo.created_at,
+        max_age=86400
+    )
+    response.headers['Cache-Control'] = 'private, max-age=86400, immutable'
+    return response
+
+
+def proxy_preview(anexo):
+    """Miniatura lida do Vercel Blob e repassada ao cliente (sem redirect)"""
+    try:
+        response = requests.get(anexo.preview_blob_url,
+                                headers={'User-Agent': 'GEDO-CIMCOP/1.0'}, timeout=30)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.error(f"❌ PREVIEW: Erro ao buscar miniatura do anexo {anexo.id}: {str(e)}")
+        return jsonify({'message': 'Pré-visualização indisponível no momento'}), 503
+
+    proxied = Response(response.content, mimetype='image/jpeg')
+    proxied.set_etag(f"preview-{anexo.hash_sha256}")
+    proxied.headers['Cache-Control'] = 'private, max-age=86400, immutable'
+    return proxied.make_conditional(request)
+
 
-        query = query.order_by(Registro.created_at.desc())
+def get_anexo_adicional(current_user, registro_id, anexo_adicional_id):
+    """Busca um anexo adicional verificando o acesso ao registro"""
+    registro = Registro.query.get(registro_id)
+    if not registro:
+        return None, (jsonify({'message': 'Registro não encontrado'}), 404)
+
+    if current_user.role == 'usuario_padrao' and registro.obra_id != current_user.obra_id:
+        return None, (jsonify({'message': 'Acesso negado a este registro'}), 403)
+
+    anexo_adicional = RegistroAnexo.query.filter_by(
+        id=anexo_adicional_id, registro_id=registro_id).first()
+    if not anexo_adicional:
+        return None, (jsonify({'message': 'Anexo não encontrado'}), 404)
+    return anexo_adicional, None
+
+
+@registros_bp.route('/<int:registro_id>/anexos/<int:anexo_adicional_id>/download', methods=['GET'])
+@token_required
+@obra_access_required
+def download_anexo_adicional(current_user, registro_id, anexo_adicional_id):
+    """Download de um anexo adicional do registro"""
+    try:
+        anexo_adicional, error = get_anexo_adicional(current_user, registro_id, anexo_adicional_id)
+        if error:
+            return error
+
+        direct_response = download_service.direct_response(anexo_adicional)
+        if direct_response is not None:
+            return direct_response
+
+        cached_response = download_service.cached_response(anexo_adicional)
+        if cached_response is not None:
+            return cached_response
+
+        # Cache desativado: proxy em streaming do Vercel Blob
+        if anexo_adicional.blob_url:
+            response = requests.get(anexo_adicional.blob_url, stream=True, timeout=60)
+            response.raise_for_status()
+            return Response(
+                response.iter_content(chunk_size=UPLOAD_CHUNK_SIZE),
+                mimetype=resolve_content_type(anexo_adicional),
+                headers={'Content-Disposition': content_disposition(
+                    resolve_download_name(anexo_adicional))}
+            )
+
+        if anexo_adicional.caminho_anexo and os.path.exists(anexo_adicional.caminho_anexo):
+            return send_file(
+                anexo_adicional.caminho_anexo,
+                mimetype=resolve_content_type(anexo_adicional),
+                as_attachment=True,
+                download_name=resolve_download_name(anexo_adicional),
+                conditional=True
+            )
+
+        return jsonify({'message': 'Arquivo não encontrado'}), 404
+
+    except Exception as e:
+        logger.error(f"❌ DOWNLOAD: Erro no anexo {anexo_adicional_id} do registro {registro_id}: {str(e)}")
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+
+@registros_bp.route('/<int:registro_id>/anexos/<int:anexo_adicional_id>/preview', methods=['GET'])
+@token_required
+@obra_access_required
+def preview_anexo_adicional(current_user, registro_id, anexo_adicional_id):
+    """Miniatura de um anexo adicional do registro"""
+    try:
+        anexo_adicional, error = get_anexo_adicional(current_user, registro_id, anexo_adicional_id)
+        if error:
+            return error
+        return preview_response(anexo_adicional.anexo)
+
+    except Exception as e:
+        logger.error(f"❌ PREVIEW: Erro no anexo {anexo_adicional_id} do registro {registro_id}: {str(e)}")
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+
+@registros_bp.route('/', methods=['GET'])
+@token_required
+@obra_access_required
+def list_registros(current_user):
+    try:
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+
+        # data_inicio/data_fim desta rota filtram pela data do registro
+        spec = RegistroQuerySpec.from_args(
+            request.args, current_user,
+            aliases={'data_inicio': 'data_registro_inicio', 'data_fim': 'data_registro_fim'})
+        query = spec.query()
         registros_paginados = query.paginate(
             page=page, per_page=per_page, error_out=False)
 
@@ -655,6 +1040,8 @@ def list_registros(current_user):
             }
         }), 200
 
+    except FiltroInvalido as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
 
@@ -772,24 +1159,47 @@ def create_registro(current_user):
                 return jsonify({'message': 'Formato de data_registro inválido (use YYYY-MM-DD)'}), 400
 
         # ← CORREÇÃO: Processamento de arquivo mais robusto
+        # Vários anexos: validação e upload em paralelo, tudo ou nada
         file_info = {}
-        if 'anexo' in request.files:
-            file = request.files['anexo']
-            if file and file.filename and file.filename.strip() != '':
+        anexos_adicionais = []
+        novos_uploads = []
+        saved_files = []
+        files = [file for file in request.files.getlist('anexo')
+                 if file and file.filename and file.filename.strip() != '']
+        if files:
+            logger.info(
+                f"📤 CREATE REGISTRO: Processando {len(files)} arquivo(s)")
+            try:
+                saved_files, novos_uploads = save_files(files)
                 logger.info(
-                    f"📤 CREATE REGISTRO: Processando arquivo {file.filename}")
-                try:
-                    file_data = save_file(file)
-                    if file_data:
-                        file_info = file_data
-                        logger.info(
-                            f"✅ CREATE REGISTRO: Arquivo processado: {file_data.get('nome_arquivo_original')}")
-                    else:
-                        logger.error(f"❌ CREATE REGISTRO: Falha no processamento do arquivo")
-                        return jsonify({'message': 'Formato de arquivo não permitido ou erro no upload'}), 400
-                except Exception as e:
-                    logger.error(f"❌ CREATE REGISTRO: Erro no upload: {str(e)}")
-                    return jsonify({'message': f'Erro no upload do arquivo: {str(e)}'}), 500
+                    f"✅ CREATE REGISTRO: Arquivo(s) processado(s): {[f.get('nome_arquivo_original') for f in saved_files]}")
+            except Exception as e:
+                logger.error(f"❌ CREATE REGISTRO: Erro no upload: {str(e)}")
+                return jsonify({'message': f'Erro no upload do arquivo: {str(e)}'}), 500
+
+        # Anexos enviados antes pelo upload em partes (routes/uploads.py)
+        upload_sessions = []
+        upload_ids = list(dict.fromkeys(request.form.getlist('upload_id')))
+        if upload_ids:
+            try:
+                uploaded_files, upload_sessions = claim_uploads(current_user, upload_ids)
+                saved_files += uploaded_files
+            except ValueError as e:
+                for stored in novos_uploads:
+                    delete_stored_file(stored)
+                db.session.rollback()
+                return jsonify({'message': str(e)}), 400
+
+        max_anexos = current_app.config.get('MAX_ANEXOS_POR_REGISTRO', 10)
+        if len(saved_files) > max_anexos:
+            for stored in novos_uploads:
+                delete_stored_file(stored)
+            db.session.rollback()
+            return jsonify({'message': f'Máximo de {max_anexos} anexos por registro'}), 400
+
+        if saved_files:
+            file_info = saved_files[0]
+            anexos_adicionais = saved_files[1:]
 
         # ← CORREÇÃO: Criação do registro com tratamento de erro
         try:
@@ -798,6 +1208,7 @@ def create_registro(current_user):
             for key in ['file_hash', 'detected_type']:
                 if key in file_info:
                     del file_info[key]
+            Anexo.adicionar_referencia(file_info.get('anexo_id'))
             registro = Registro(
                 titulo=titulo,
                 tipo_registro=tipo_registro,
@@ -812,12 +1223,31 @@ def create_registro(current_user):
                 classificacao_id=classificacao_id if classificacao_id else None,
                 **file_info
             )
+            for ordem, extra in enumerate(anexos_adicionais, start=1):
+                Anexo.adicionar_referencia(extra['anexo_id'])
+                registro.anexos_adicionais.append(RegistroAnexo(
+                    anexo_id=extra['anexo_id'],
+                    nome_arquivo_original=extra['nome_arquivo_original'],
+                    ordem=ordem
+                ))
 
             db.session.add(registro)
+            # O registro já tomou as suas referências: as sessões liberam as delas
+            arquivos_liberados = [chunked_upload_service.release(db.session, upload_session)
+                                  for upload_session in upload_sessions]
             db.session.commit()
+            for arquivos in arquivos_liberados:
+                delete_stored_file(arquivos)
 
             logger.info(
                 f"✅ CREATE REGISTRO: Registro criado com sucesso - ID {registro.id}")
+            audit_log('REGISTRO_CREATED', current_user.id, {
+                'titulo': registro.titulo,
+                'obra_id': registro.obra_id,
+                'tipo_registro': registro.tipo_registro,
+                'anexos': len(saved_files)
+            }, table_name='registros', record_id=registro.id, username=current_user.username,
+                obra_id=registro.obra_id)
             logger.info(f"   - Tem blob_url: {bool(registro.blob_url)}")
             logger.info(f"   - Tem caminho_anexo: {bool(registro.caminho_anexo)}")
             logger.info(f"   - Formato: {registro.formato_arquivo}")
@@ -827,6 +1257,9 @@ def create_registro(current_user):
         except Exception as e:
             logger.error(f"❌ CREATE REGISTRO: Erro ao salvar no banco: {str(e)}")
             db.session.rollback()
+            # Uploads desta requisição ficaram sem anexo no banco
+            for stored in novos_uploads:
+                delete_stored_file(stored)
             return jsonify({'message': f'Erro ao salvar registro: {str(e)}'}), 500
 
         # ← OPCIONAL: Workflow (não crítico)
@@ -864,6 +1297,11 @@ def update_registro(current_user, registro_id):
         if current_user.role != 'administrador' and registro.autor_id != current_user.id:
             return jsonify({'message': 'Apenas o autor ou administrador pode editar este registro'}), 403
 
+        campos_auditados = ('titulo', 'tipo_registro', 'codigo_numero', 'data_registro',
+                            'tipo_registro_id', 'classificacao_grupo', 'classificacao_subgrupo',
+                            'classificacao_id', 'anexo_id')
+        valores_anteriores = {campo: getattr(registro, campo) for campo in campos_auditados}
+
         if 'titulo' in request.form:
             registro.titulo = bleach.clean(request.form['titulo'])
         if 'tipo_registro' in request.form:
@@ -892,28 +1330,42 @@ def update_registro(current_user, registro_id):
                 'classificacao_id', type=int)
 
         # Processar novo arquivo
+        arquivo_removido = None
         if 'anexo' in request.files:
             file = request.files['anexo']
             if file.filename != '':
-                # Deletar arquivo anterior
-                if registro.blob_pathname:
-                    blob_service.delete_file(registro.blob_pathname)
-                elif registro.caminho_anexo and os.path.exists(registro.caminho_anexo):
-                    os.remove(registro.caminho_anexo)
-
                 file_data = save_file(file)
                 if file_data:
+                    anexo_anterior = (registro.anexo_id, registro.blob_pathname, registro.caminho_anexo)
+
                     # Limpar campos antigos
                     registro.caminho_anexo = file_data.get('caminho_anexo')
                     registro.blob_url = file_data.get('blob_url')
                     registro.blob_pathname = file_data.get('blob_pathname')
+                    registro.anexo_id = file_data.get('anexo_id')
                     registro.nome_arquivo_original = file_data['nome_arquivo_original']
                     registro.formato_arquivo = file_data['formato_arquivo']
                     registro.tamanho_arquivo = file_data['tamanho_arquivo']
+                    Anexo.adicionar_referencia(registro.anexo_id)
+
+                    # Liberar arquivo anterior (removido do storage só sem outras referências)
+                    db.session.flush()
+                    arquivo_removido = release_attachment(*anexo_anterior)
                 else:
                     return jsonify({'message': 'Formato de arquivo não permitido'}), 400
 
         db.session.commit()
+        delete_stored_file(arquivo_removido)
+
+        alterados = {campo: getattr(registro, campo) for campo in campos_auditados
+                     if getattr(registro, campo) != valores_anteriores[campo]}
+        if 'descricao' in request.form:
+            alterados['descricao'] = '(alterada)'
+        audit_log('REGISTRO_UPDATED', current_user.id, alterados,
+                  table_name='registros', record_id=registro.id, username=current_user.username,
+                  obra_id=registro.obra_id,
+                  old_values={campo: valores_anteriores[campo] for campo in alterados
+                              if campo in valores_anteriores})
         return jsonify({
             'message': 'Registro atualizado com sucesso',
             'registro': registro.to_dict()
@@ -939,15 +1391,25 @@ def delete_registro(current_user, registro_id):
         if current_user.role != 'administrador' and registro.autor_id != current_user.id:
             return jsonify({'message': 'Apenas o autor ou administrador pode deletar este registro'}), 403
 
-        # Deletar arquivo do Blob ou local
-        if registro.blob_pathname:
-            blob_service.delete_file(registro.blob_pathname)
-        elif registro.caminho_anexo and os.path.exists(registro.caminho_anexo):
-            os.remove(registro.caminho_anexo)
+        anexo_registro = (registro.anexo_id, registro.blob_pathname, registro.caminho_anexo)
+        anexos_adicionais = [extra.anexo_id for extra in registro.anexos_adicionais]
+        registro_auditado = {'titulo': registro.titulo, 'obra_id': registro.obra_id,
+                             'tipo_registro': registro.tipo_registro,
+                             'autor_id': registro.autor_id}
 
         db.session.delete(registro)
+        db.session.flush()
+
+        # Deletar arquivo do Blob ou local apenas se nenhum outro registro o usa
+        arquivos_removidos = [release_attachment(*anexo_registro)]
+        arquivos_removidos += [release_attachment(anexo_id) for anexo_id in anexos_adicionais]
         db.session.commit()
+        for arquivo_removido in arquivos_removidos:
+            delete_stored_file(arquivo_removido)
 
+        audit_log('REGISTRO_DELETED', current_user.id, table_name='registros',
+                  record_id=registro_id, username=current_user.username,
+                  obra_id=registro_auditado['obra_id'], old_values=registro_auditado)
         return jsonify({'message': 'Registro deletado com sucesso'}), 200
 
     except Exception as e:
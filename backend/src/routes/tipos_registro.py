@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from models.tipo_registro import TipoRegistro, db
 from routes.auth import token_required, admin_required
+from services.reference_cache import reference_cache
 
 tipos_registro_bp = Blueprint('tipos_registro', __name__)
 
@@ -9,12 +10,12 @@ tipos_registro_bp = Blueprint('tipos_registro', __name__)
 @token_required
 def list_tipos_registro(current_user):
     try:
-        # Buscar apenas tipos ativos
-        tipos = TipoRegistro.query.filter_by(ativo=True).all()
+        # Buscar apenas tipos ativos (cacheado por versão, com ETag)
+        def build():
+            tipos = TipoRegistro.query.filter_by(ativo=True).all()
+            return {'tipos_registro': [tipo.to_dict() for tipo in tipos]}
 
-        return jsonify({
-            'tipos_registro': [tipo.to_dict() for tipo in tipos]
-        }), 200
+        return reference_cache.response('tipos_registro:ativos', ('tipos_registro',), build)
 
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -26,11 +27,11 @@ def list_tipos_registro(current_user):
 def list_all_tipos_registro(current_user):
     try:
         # Buscar todos os tipos (incluindo inativos) - apenas para admin
-        tipos = TipoRegistro.query.all()
+        def build():
+            tipos = TipoRegistro.query.all()
+            return {'tipos_registro': [tipo.to_dict() for tipo in tipos]}
 
-        return jsonify({
-            'tipos_registro': [tipo.to_dict() for tipo in tipos]
-        }), 200
+        return reference_cache.response('tipos_registro:todos', ('tipos_registro',), build)
 
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
@@ -74,6 +75,7 @@ def create_tipo_registro(current_user):
 
         db.session.add(tipo)
         db.session.commit()
+        reference_cache.bump('tipos_registro')
 
         return jsonify({
             'message': 'Tipo de registro criado com sucesso',
@@ -111,6 +113,7 @@ def update_tipo_registro(current_user, tipo_id):
             tipo.ativo = data['ativo']
 
         db.session.commit()
+        reference_cache.bump('tipos_registro')
 
         return jsonify({
             'message': 'Tipo de registro atualizado com sucesso',
@@ -140,6 +143,7 @@ def delete_tipo_registro(current_user, tipo_id):
 
         db.session.delete(tipo)
         db.session.commit()
+        reference_cache.bump('tipos_registro')
 
         return jsonify({'message': 'Tipo de registro deletado com sucesso'}), 200
 
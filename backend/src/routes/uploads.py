@@ -0,0 +1,245 @@
+"""
+Upload retomável de anexos grandes
+
+Protocolo:
+1. POST /api/uploads                     - cria a sessão (nome, tamanho, mimetype)
+2. PUT  /api/uploads/<id>/chunks/<n>     - envia a parte n (corpo binário), em ordem
+3. GET  /api/uploads/<id>                - consulta o progresso (próxima parte)
+4. POST /api/uploads/<id>/complete       - valida, armazena e registra o anexo
+
+O upload_id concluído é enviado no campo `upload_id` ao criar o registro.
+Até lá a sessão mantém uma referência ao anexo; ao expirar, a referência é
+liberada (chunked_upload_service.cleanup_expired).
+"""
+import logging
+from flask import Blueprint, request, jsonify
+from werkzeug.utils import secure_filename
+from models.user import db
+from models.upload_session import UploadSession
+from routes.auth import token_required
+from routes.registros import (
+    allowed_file, secure_filename_advanced, validate_file_magic_bytes,
+    validate_file_content, find_anexo, register_anexo, delete_stored_file,
+    max_file_size, MAGIC_HEADER_SIZE
+)
+from services.storage_service import storage_service, file_extension
+from services.chunked_upload_service import chunked_upload_service
+from services.preview_service import preview_service
+from extensions import limiter
+
+uploads_bp = Blueprint('uploads', __name__)
+uploads_bp.strict_slashes = False
+
+logger = logging.getLogger("gedo.uploads")
+
+
+def get_upload_session(current_user, upload_id, lock=False):
+    """Sessão de upload do usuário (com lock da linha ao gravar partes)"""
+    query = UploadSession.query.filter_by(id=upload_id, user_id=current_user.id)
+    if lock:
+        query = query.with_for_update()
+    upload = query.first()
+    if not upload:
+        return None, (jsonify({'message': 'Upload não encontrado'}), 404)
+    if upload.status == 'em_andamento' and upload.is_expired():
+        return None, (jsonify({'message': 'Upload expirado'}), 410)
+    return upload, None
+
+
+def abort_upload(upload):
+    """Remove a sessão; se concluída, libera a referência ao anexo"""
+    arquivos = chunked_upload_service.release(db.session, upload)
+    db.session.commit()
+    delete_stored_file(arquivos)
+
+
+def store_spooled_upload(upload, spooled):
+    """Envia o conteúdo do spool ao storage em streaming (sem carregar em memória)"""
+    filename = secure_filename(upload.nome_arquivo)
+    with spooled.stream() as stream:
+        stored = storage_service.save(
+            stream, spooled.file_hash, filename,
+            content_type=upload.detected_type, size=spooled.size)
+    if not stored:
+        raise ValueError('Erro ao salvar arquivo no storage')
+    stored.update({
+        'formato_arquivo': file_extension(filename),
+        'tamanho_arquivo': spooled.size
+    })
+    return stored
+
+
+@uploads_bp.route('/', methods=['POST'])
+@limiter.limit("30 per hour")
+@token_required
+def init_upload(current_user):
+    """Cria uma sessão de upload em partes"""
+    try:
+        data = request.get_json() or {}
+        nome_arquivo = data.get('nome_arquivo', '')
+        mimetype = data.get('mimetype')
+        try:
+            tamanho = int(data.get('tamanho', 0))
+        except (TypeError, ValueError):
+            return jsonify({'message': 'Tamanho inválido'}), 400
+
+        if not allowed_file(nome_arquivo, mimetype):
+            return jsonify({'message': 'Tipo de arquivo não permitido'}), 400
+        if tamanho <= 0:
+            return jsonify({'message': 'Arquivo vazio'}), 400
+        if tamanho > chunked_upload_service.max_bytes:
+            return jsonify({'message': f'Arquivo muito grande (máximo {chunked_upload_service.max_bytes // (1024 * 1024)}MB)'}), 413
+
+        chunked_upload_service.cleanup_expired(db.session)
+
+        upload = UploadSession(
+            user_id=current_user.id,
+            nome_arquivo=secure_filename_advanced(nome_arquivo),
+            tamanho_total=tamanho,
+            chunk_size=chunked_upload_service.chunk_size,
+            mimetype=mimetype,
+            ttl_hours=chunked_upload_service.ttl_hours
+        )
+        db.session.add(upload)
+        db.session.commit()
+
+        logger.info(f"📤 UPLOAD: Sessão {upload.id} criada ({tamanho} bytes, {upload.total_chunks} partes)")
+        return jsonify(upload.to_dict()), 201
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"❌ UPLOAD: Erro ao criar sessão: {str(e)}")
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+
+@uploads_bp.route('/<upload_id>', methods=['GET'])
+@token_required
+def get_upload(current_user, upload_id):
+    """Progresso da sessão (para retomar a partir da próxima parte)"""
+    upload, error = get_upload_session(current_user, upload_id)
+    if error:
+        return error
+    return jsonify(upload.to_dict()), 200
+
+
+@uploads_bp.route('/<upload_id>/chunks/<int:chunk_index>', methods=['PUT'])
+@limiter.limit("1000 per hour")
+@token_required
+def upload_chunk(current_user, upload_id, chunk_index):
+    """Recebe uma parte; as partes devem chegar em ordem"""
+    try:
+        upload, error = get_upload_session(current_user, upload_id, lock=True)
+        if error:
+            return error
+        if upload.status != 'em_andamento':
+            return jsonify({'message': 'Upload já concluído', **upload.to_dict()}), 409
+
+        if chunk_index >= upload.total_chunks:
+            db.session.rollback()
+            return jsonify({'message': f'Parte inexistente (total de {upload.total_chunks} partes)',
+                            **upload.to_dict()}), 400
+
+        # Reenvio de parte já gravada (resposta perdida): nada a fazer
+        if chunk_index < upload.chunks_recebidos:
+            db.session.rollback()
+            return jsonify(upload.to_dict()), 200
+        if chunk_index != upload.chunks_recebidos:
+            db.session.rollback()
+            return jsonify({'message': 'Parte fora de ordem', **upload.to_dict()}), 409
+
+        data = request.get_data(cache=False)
+        esperado = upload.tamanho_esperado(chunk_index)
+        if len(data) != esperado:
+            db.session.rollback()
+            return jsonify({'message': f'Tamanho da parte inválido (esperado {esperado} bytes)'}), 400
+
+        # Primeira parte: tipo real pelos magic bytes antes de aceitar o resto
+        if chunk_index == 0:
+            detected_type, is_valid_type = validate_file_magic_bytes(data[:MAGIC_HEADER_SIZE])
+            if not is_valid_type:
+                logger.warning(f"⚠️ UPLOAD: Sessão {upload.id} rejeitada ({detected_type})")
+                abort_upload(upload)
+                return jsonify({'message': f'Tipo de arquivo não permitido: {detected_type}'}), 400
+            upload.detected_type = detected_type
+
+        chunked_upload_service.write_chunk(
+            upload.id, chunk_index * upload.chunk_size, data)
+        upload.chunks_recebidos = chunk_index + 1
+        upload.bytes_recebidos = chunk_index * upload.chunk_size + len(data)
+        db.session.commit()
+
+        return jsonify(upload.to_dict()), 200
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"❌ UPLOAD: Erro na parte {chunk_index} da sessão {upload_id}: {str(e)}")
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+
+@uploads_bp.route('/<upload_id>/complete', methods=['POST'])
+@limiter.limit("30 per hour")
+@token_required
+def complete_upload(current_user, upload_id):
+    """Valida o conteúdo completo, armazena e registra o anexo"""
+    stored = None
+    try:
+        upload, error = get_upload_session(current_user, upload_id, lock=True)
+        if error:
+            return error
+        if upload.status == 'completo':
+            db.session.rollback()
+            return jsonify(upload.to_dict()), 200
+        if upload.bytes_recebidos != upload.tamanho_total:
+            db.session.rollback()
+            return jsonify({'message': 'Upload incompleto', **upload.to_dict()}), 409
+
+        file_hash = chunked_upload_service.finish_hash(upload.id, upload.tamanho_total)
+        spooled = chunked_upload_service.open_spool(upload.id, file_hash, upload.tamanho_total)
+
+        if not validate_file_content(spooled, upload.detected_type):
+            logger.warning(f"⚠️ UPLOAD: Conteúdo inválido na sessão {upload.id}")
+            abort_upload(upload)
+            return jsonify({'message': 'Arquivo rejeitado: Conteúdo do arquivo inválido ou corrompido'}), 400
+
+        validation_result = {'file_hash': file_hash, 'detected_type': upload.detected_type}
+        anexo = find_anexo(file_hash)
+        if anexo:
+            logger.info(f"♻️ Conteúdo já armazenado (anexo {anexo.id}) - upload ignorado")
+        else:
+            stored = store_spooled_upload(upload, spooled)
+            anexo, created = register_anexo(stored, validation_result)
+            if not created:
+                stored = None
+            elif (preview_service.supports(upload.detected_type)
+                  and upload.tamanho_total <= max_file_size()):
+                preview_service.schedule(db.session, anexo.id, spooled.data, upload.detected_type)
+
+        # A sessão mantém uma referência ao anexo até ser vinculada a um registro
+        chunked_upload_service.hold(db.session, upload, anexo)
+        db.session.commit()
+        chunked_upload_service.discard(upload.id)
+
+        logger.info(f"✅ UPLOAD: Sessão {upload.id} concluída (anexo {anexo.id})")
+        return jsonify(upload.to_dict()), 200
+
+    except Exception as e:
+        db.session.rollback()
+        delete_stored_file(stored)
+        logger.error(f"❌ UPLOAD: Erro ao concluir sessão {upload_id}: {str(e)}")
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
+
+
+@uploads_bp.route('/<upload_id>', methods=['DELETE'])
+@token_required
+def cancel_upload(current_user, upload_id):
+    """Cancela a sessão e descarta as partes recebidas (ou o anexo reservado)"""
+    try:
+        upload = UploadSession.query.filter_by(id=upload_id, user_id=current_user.id).first()
+        if not upload:
+            return jsonify({'message': 'Upload não encontrado'}), 404
+        abort_upload(upload)
+        return jsonify({'message': 'Upload cancelado'}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Erro interno: {str(e)}'}), 500
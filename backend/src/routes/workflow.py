@@ -3,6 +3,7 @@ from models.configuracao_workflow import ConfiguracaoWorkflow, db
 from models.obra import Obra
 from models.tipo_registro import TipoRegistro
 from routes.auth import token_required, admin_required
+from services.reference_cache import reference_cache, user_scope
 import json
 
 workflow_bp = Blueprint('workflow', __name__)
@@ -208,19 +209,24 @@ def deletar_workflow(current_user, workflow_id):
 def obter_dados_auxiliares(current_user):
     """Obtém dados auxiliares para configuração de workflows"""
     try:
-        # Obras disponíveis
-        if current_user.role == 'administrador':
-            obras = Obra.query.all()
-        else:
-            obras = Obra.query.filter_by(id=current_user.obra_id).all()
-
-        # Tipos de registro
-        tipos_registro = TipoRegistro.query.all()
+        def build():
+            # Obras disponíveis
+            if current_user.role == 'administrador':
+                obras = Obra.query.all()
+            else:
+                obras = Obra.query.filter_by(id=current_user.obra_id).all()
+
+            # Tipos de registro
+            tipos_registro = TipoRegistro.query.all()
+
+            return {
+                'obras': [{'id': obra.id, 'nome': obra.nome, 'codigo': obra.codigo} for obra in obras],
+                'tipos_registro': [{'id': tipo.id, 'nome': tipo.nome} for tipo in tipos_registro]
+            }
 
-        return jsonify({
-            'obras': [{'id': obra.id, 'nome': obra.nome, 'codigo': obra.codigo} for obra in obras],
-            'tipos_registro': [{'id': tipo.id, 'nome': tipo.nome} for tipo in tipos_registro]
-        }), 200
+        return reference_cache.response(
+            'workflow:dados_auxiliares', ('obras', 'tipos_registro'), build,
+            scope=user_scope(current_user))
 
     except Exception as e:
         return jsonify({'message': f'Erro interno: {str(e)}'}), 500
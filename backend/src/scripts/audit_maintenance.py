@@ -0,0 +1,49 @@
+"""
+Manutenção da trilha de auditoria (partições mensais e retenção)
+
+Rodar diariamente (cron ou agendador da plataforma):
+    python scripts/audit_maintenance.py              # partições futuras + retenção
+    python scripts/audit_maintenance.py --dry-run    # mostra o que seria removido
+    python scripts/audit_maintenance.py --meses 36   # retenção diferente da configurada
+"""
+
+import sys
+import os
+import argparse
+import json
+import logging
+
+# ✅ Primeiro ajuste o sys.path ANTES de importar qualquer módulo
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# ✅ Agora os imports funcionarão
+from main import app
+from services.audit_partitions import audit_partitions
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manutenção da auditoria do GEDO CIMCOP')
+    parser.add_argument('--meses', type=int, default=None,
+                        help='meses de auditoria mantidos (padrão: AUDIT_RETENTION_MONTHS)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='apenas informa o que seria removido')
+    args = parser.parse_args()
+
+    with app.app_context():
+        audit_partitions.init_app(app)
+
+        if not args.dry_run:
+            audit_partitions.ensure_partitions()
+
+        resumo = audit_partitions.apply_retention(args.meses, dry_run=args.dry_run)
+        print(json.dumps(resumo, indent=2, ensure_ascii=False))
+        logger.info("🎉 Manutenção da auditoria concluída")
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Script de backup do sistema (banco + anexos incrementais)
+
+Uso:
+    python scripts/backup.py            # novo backup e limpeza pela retenção
+    python scripts/backup.py --list     # backups disponíveis
+
+Saída 1 se o backup falhou e 2 se ficou parcial (anexos não copiados).
+"""
+
+import sys
+import os
+import argparse
+import json
+import logging
+
+# ✅ Primeiro ajuste o sys.path ANTES de importar qualquer módulo
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# ✅ Agora os imports funcionarão
+from main import app
+from utils.backup import backup_manager, backup_completo
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backup do GEDO CIMCOP')
+    parser.add_argument('--list', action='store_true', help='lista os backups disponíveis')
+    parser.add_argument('--no-cleanup', action='store_true',
+                        help='não remove backups fora da retenção')
+    args = parser.parse_args()
+
+    with app.app_context():
+        backup_manager.init_app(app)
+
+        if args.list:
+            print(json.dumps(backup_manager.list_backups(), indent=2, ensure_ascii=False))
+            return 0
+
+        logger.info("💾 Iniciando backup...")
+        manifest = backup_manager.create_full_backup()
+        if not manifest:
+            logger.error("❌ Backup falhou")
+            return 1
+        if not backup_completo(manifest):
+            # Sem limpeza: o último backup completo continua sendo a referência
+            logger.error(f"❌ Backup {manifest['id']} parcial: "
+                         f"{len(manifest['falhas'])} anexo(s) não copiado(s)")
+            return 2
+
+        if not args.no_cleanup:
+            backup_manager.cleanup_old_backups()
+        logger.info(f"🎉 Backup {manifest['id']} concluído")
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
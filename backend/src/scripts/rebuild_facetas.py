@@ -0,0 +1,35 @@
+"""
+Recalcula as facetas de pesquisa (tabela registro_facetas) a partir dos registros
+
+A tabela é mantida a cada escrita de registro; rodar após importações feitas
+direto no banco ou se o painel de filtros mostrar valores que não existem mais:
+    python scripts/rebuild_facetas.py
+"""
+
+import sys
+import os
+import logging
+
+# ✅ Primeiro ajuste o sys.path ANTES de importar qualquer módulo
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# ✅ Agora os imports funcionarão
+from main import app
+from models.user import db
+from services.facetas_service import facetas_service
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    with app.app_context():
+        total = facetas_service.rebuild(db.session)
+        print(f"{total} valores de facetas recalculados")
+        logger.info("🎉 Facetas de pesquisa recalculadas")
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Script de restauração a partir de um backup (utils/backup.py)
+
+Uso:
+    python scripts/restore.py <backup_id> --dry-run   # verifica e estima o tempo
+    python scripts/restore.py <backup_id>             # restaura banco e anexos
+    python scripts/restore.py <backup_id> --somente-banco | --somente-anexos
+
+Execute com a aplicação parada: o conteúdo atual das tabelas é substituído.
+Antes de restaurar, um backup do estado atual é criado (--sem-backup-previo
+para pular).
+"""
+
+import sys
+import os
+import argparse
+import json
+import logging
+
+# ✅ Primeiro ajuste o sys.path ANTES de importar qualquer módulo
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# ✅ Agora os imports funcionarão
+from main import app
+from utils.backup import backup_manager, backup_completo
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Restauração do GEDO CIMCOP')
+    parser.add_argument('backup_id', help='pasta do backup (ex.: 20240131_020000)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='apenas verifica a integridade e estima o tempo')
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument('--somente-banco', action='store_true')
+    grupo.add_argument('--somente-anexos', action='store_true')
+    parser.add_argument('--sem-backup-previo', action='store_true',
+                        help='não cria backup do estado atual antes de restaurar')
+    args = parser.parse_args()
+
+    with app.app_context():
+        backup_manager.init_app(app)
+
+        if args.backup_id not in backup_manager.backup_ids():
+            logger.error(f"❌ Backup {args.backup_id} não encontrado")
+            return 1
+
+        if not args.dry_run and not args.sem_backup_previo:
+            logger.info("💾 Criando backup do estado atual antes de restaurar...")
+            if not backup_completo(backup_manager.create_full_backup()):
+                logger.error("❌ Backup prévio falhou ou ficou parcial - restauração cancelada")
+                return 1
+
+        try:
+            report = backup_manager.restore_backup(
+                args.backup_id,
+                dry_run=args.dry_run,
+                database=not args.somente_anexos,
+                files=not args.somente_banco)
+        except FileNotFoundError as e:
+            logger.error(f"❌ {e}")
+            return 1
+
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 0 if report['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Cache em disco dos anexos do Vercel Blob - Sistema GEDO CIMCOP
+
+Objetos são gravados uma única vez (o conteúdo de um blob_pathname nunca
+muda) e removidos por LRU quando o diretório passa de ATTACHMENT_CACHE_MAX_MB.
+O uso recente é marcado pelo mtime, então o cache é compartilhado entre
+workers que usem o mesmo diretório.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import requests
+
+logger = logging.getLogger(__name__)
+
+FETCH_CHUNK_SIZE = 64 * 1024
+
+
+class AttachmentCache:
+    """Cache LRU de blobs em disco, limitado por tamanho total"""
+
+    def __init__(self, directory=None, max_bytes=512 * 1024 * 1024):
+        self.directory = directory or os.path.join(
+            tempfile.gettempdir(), 'gedo-attachment-cache')
+        self.max_bytes = max_bytes
+        self._size = None  # Estimativa local; ressincronizada a cada limpeza
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = app.config.get('ATTACHMENT_CACHE_DIR') or self.directory
+        self.max_bytes = app.config.get('ATTACHMENT_CACHE_MAX_MB', 512) * 1024 * 1024
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def path_for(self, blob_pathname):
+        """Caminho no cache (diretórios com prefixo do hash da chave)"""
+        key = hashlib.sha256(blob_pathname.encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, blob_pathname):
+        """Retorna o caminho do objeto em cache (ou None), marcando o uso"""
+        path = self.path_for(blob_pathname)
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            return None
+
+    def fetch(self, blob_url, blob_pathname, timeout=60):
+        """Baixa o objeto para o cache (escrita atômica) e retorna o caminho"""
+        path = self.path_for(blob_pathname)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f, \
+                    requests.get(blob_url, headers={'User-Agent': 'GEDO-CIMCOP/1.0'},
+                                 stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=FETCH_CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        logger.info(f"📥 CACHE: {blob_pathname} armazenado ({size} bytes)")
+        self._account(size)
+        return path
+
+    def get_or_fetch(self, blob_url, blob_pathname):
+        """Caminho em cache do blob; None se o cache estiver desativado ou falhar"""
+        if not self.enabled or not blob_pathname:
+            return None
+        path = self.get(blob_pathname)
+        if path:
+            return path
+        try:
+            return self.fetch(blob_url, blob_pathname)
+        except Exception as e:
+            logger.error(f"❌ CACHE: Erro ao baixar {blob_pathname}: {e}")
+            return None
+
+    def invalidate(self, blob_pathname):
+        """Remove o objeto do cache (ex.: anexo apagado do storage)"""
+        try:
+            os.remove(self.path_for(blob_pathname))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"❌ CACHE: Erro ao remover {blob_pathname}: {e}")
+
+    def _account(self, added_bytes):
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += added_bytes
+            if self._size > self.max_bytes:
+                self._size = self._evict()
+
+    def _entries(self):
+        entries = []
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.part'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _mtime, size, _path in self._entries())
+
+    def _evict(self):
+        """Remove os objetos menos usados até ficar abaixo de 90% do limite"""
+        entries = sorted(self._entries())
+        total = sum(size for _mtime, size, _path in entries)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _mtime, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                total -= size
+        if removed:
+            logger.info(f"🧹 CACHE: {removed} anexos removidos (LRU)")
+        return total
+
+
+# Instância global
+attachment_cache = AttachmentCache()
@@ -0,0 +1,285 @@
+"""
+Armazenamento da trilha de auditoria - Sistema GEDO CIMCOP
+
+No Postgres a tabela audit_logs é particionada por mês (RANGE em
+timestamp): audit_logs_pAAAAMM guarda os eventos do mês e
+audit_logs_default recebe o que cair fora das partições existentes. As
+consultas com intervalo de datas leem só as partições do período, e a
+retenção descarta meses inteiros com DROP TABLE, sem DELETE em massa.
+
+- migrate(): na inicialização, converte a tabela criada pelo create_all
+  (ou por versões anteriores) em particionada, copiando os eventos
+- ensure_partitions(): cria as partições do mês atual e dos próximos
+  AUDIT_PARTITIONS_AHEAD meses, movendo eventos que estejam na default
+- apply_retention(): remove partições (ou, fora do Postgres, eventos)
+  anteriores a AUDIT_RETENTION_MONTHS meses; 0 desativa
+
+Os índices (user_id, timestamp), (table_name, record_id), (obra_id,
+timestamp) e (timestamp, id) são declarados em models/audit_log.py e, no
+Postgres, criados na tabela particionada (valem para todas as partições).
+A manutenção periódica roda por scripts/audit_maintenance.py.
+"""
+import logging
+import re
+from datetime import date, datetime
+from sqlalchemy import func, inspect, select, text
+
+logger = logging.getLogger(__name__)
+
+TABELA = 'audit_logs'
+PARTICAO_DEFAULT = 'audit_logs_default'
+PARTICAO_MENSAL = re.compile(r'^audit_logs_p(\d{4})(\d{2})$')
+
+
+def _mes(dia, delta=0):
+    """Primeiro dia do mês de dia deslocado em delta meses"""
+    indice = dia.year * 12 + dia.month - 1 + delta
+    return date(indice // 12, indice % 12 + 1, 1)
+
+
+def _nome_particao(mes):
+    return f"audit_logs_p{mes.year:04d}{mes.month:02d}"
+
+
+class AuditPartitions:
+    """Partições mensais e retenção da tabela audit_logs"""
+
+    def __init__(self, retention_months=24, partitions_ahead=3, delete_batch_size=5000):
+        self.retention_months = retention_months
+        self.partitions_ahead = partitions_ahead
+        self.delete_batch_size = delete_batch_size
+
+    def init_app(self, app):
+        self.retention_months = app.config.get('AUDIT_RETENTION_MONTHS', self.retention_months)
+        self.partitions_ahead = app.config.get('AUDIT_PARTITIONS_AHEAD', self.partitions_ahead)
+
+    @staticmethod
+    def _engine():
+        from models.user import db
+        return db.engine
+
+    def is_postgres(self):
+        return self._engine().dialect.name == 'postgresql'
+
+    def is_partitioned(self, connection):
+        relkind = connection.execute(text(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass(:tabela)"),
+            {'tabela': TABELA}).scalar()
+        return relkind == 'p'
+
+    # ------------------------------------------------------------------
+    # Migração
+    # ------------------------------------------------------------------
+
+    def migrate(self):
+        """Coluna obra_id, conversão para tabela particionada e partições futuras"""
+        engine = self._engine()
+        colunas = {coluna['name'] for coluna in inspect(engine).get_columns(TABELA)}
+        with engine.begin() as connection:
+            if 'obra_id' not in colunas:
+                logger.info("➕ Adicionando coluna obra_id em audit_logs...")
+                connection.execute(text(f"ALTER TABLE {TABELA} ADD COLUMN obra_id INTEGER"))
+
+            postgres = engine.dialect.name == 'postgresql'
+            if postgres and not self.is_partitioned(connection):
+                self._convert(connection)
+            # Tabelas criadas antes dos índices
+            self._create_indexes(connection)
+
+        if postgres:
+            self.ensure_partitions()
+        return postgres
+
+    def _convert(self, connection):
+        """Troca a tabela comum por uma particionada com os mesmos eventos"""
+        from models.audit_log import AuditLog
+
+        logger.info("🗂️ AUDIT: Convertendo audit_logs em tabela particionada por mês...")
+        legado = f"{TABELA}_legacy"
+        sequencia = connection.execute(text(
+            "SELECT pg_get_serial_sequence(:tabela, 'id')"), {'tabela': TABELA}).scalar()
+
+        # Nomes de PK e índices ficam livres para a nova tabela
+        connection.execute(text(f"ALTER TABLE {TABELA} RENAME TO {legado}"))
+        pk = connection.execute(text(
+            "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:tabela) "
+            "AND contype = 'p'"), {'tabela': legado}).scalar()
+        if pk:
+            connection.execute(text(f'ALTER TABLE {legado} RENAME CONSTRAINT "{pk}" TO {legado}_pkey'))
+        for index in AuditLog.__table__.indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        if sequencia:
+            connection.execute(text(f"ALTER SEQUENCE {sequencia} OWNED BY NONE"))
+
+        connection.execute(text(
+            f"UPDATE {legado} SET \"timestamp\" = now() AT TIME ZONE 'utc' WHERE \"timestamp\" IS NULL"))
+        connection.execute(text(
+            f"CREATE TABLE {TABELA} (LIKE {legado} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE (\"timestamp\")"))
+        connection.execute(text(f"ALTER TABLE {TABELA} ALTER COLUMN \"timestamp\" SET NOT NULL"))
+        connection.execute(text(f"ALTER TABLE {TABELA} ADD PRIMARY KEY (id, \"timestamp\")"))
+        connection.execute(text(f"CREATE TABLE {PARTICAO_DEFAULT} PARTITION OF {TABELA} DEFAULT"))
+
+        # Partições de todos os meses com eventos, antes da cópia
+        primeiro = connection.execute(text(f"SELECT min(\"timestamp\") FROM {legado}")).scalar()
+        mes = _mes(primeiro or datetime.utcnow())
+        atual = _mes(datetime.utcnow())
+        while mes <= atual:
+            self._create_partition(connection, mes)
+            mes = _mes(mes, 1)
+
+        copiados = connection.execute(text(f"INSERT INTO {TABELA} SELECT * FROM {legado}")).rowcount
+        connection.execute(text(f"DROP TABLE {legado}"))
+        if sequencia:
+            connection.execute(text(f"ALTER SEQUENCE {sequencia} OWNED BY {TABELA}.id"))
+
+        self._create_indexes(connection)
+        logger.info(f"✅ AUDIT: audit_logs particionada ({copiados} eventos copiados)")
+
+    def _create_indexes(self, connection):
+        """Índices de models/audit_log.py (na particionada valem para todas as partições)"""
+        from models.audit_log import AuditLog
+
+        preparer = connection.dialect.identifier_preparer
+        for index in AuditLog.__table__.indexes:
+            colunas = ', '.join(preparer.quote(coluna.name) for coluna in index.columns)
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {index.name} ON {TABELA} ({colunas})"))
+
+    # ------------------------------------------------------------------
+    # Partições
+    # ------------------------------------------------------------------
+
+    def _partitions(self, connection):
+        """Partições mensais existentes: nome -> primeiro dia do mês"""
+        nomes = connection.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:tabela)"), {'tabela': TABELA}).scalars()
+        particoes = {}
+        for nome in nomes:
+            match = PARTICAO_MENSAL.match(nome)
+            if match:
+                particoes[nome] = date(int(match.group(1)), int(match.group(2)), 1)
+        return particoes
+
+    def _create_partition(self, connection, mes):
+        nome = _nome_particao(mes)
+        inicio, fim = mes.isoformat(), _mes(mes, 1).isoformat()
+        pendentes = connection.execute(text(
+            f"SELECT EXISTS (SELECT 1 FROM {PARTICAO_DEFAULT} "
+            f"WHERE \"timestamp\" >= :inicio AND \"timestamp\" < :fim)"),
+            {'inicio': inicio, 'fim': fim}).scalar()
+
+        if not pendentes:
+            connection.execute(text(
+                f"CREATE TABLE {nome} PARTITION OF {TABELA} "
+                f"FOR VALUES FROM ('{inicio}') TO ('{fim}')"))
+            return nome
+
+        # Eventos do mês que foram para a default mudam para a nova partição
+        connection.execute(text(f"CREATE TABLE {nome} (LIKE {TABELA} INCLUDING DEFAULTS)"))
+        movidos = connection.execute(text(
+            f"WITH movidos AS (DELETE FROM {PARTICAO_DEFAULT} "
+            f"WHERE \"timestamp\" >= :inicio AND \"timestamp\" < :fim RETURNING *) "
+            f"INSERT INTO {nome} SELECT * FROM movidos"),
+            {'inicio': inicio, 'fim': fim}).rowcount
+        connection.execute(text(
+            f"ALTER TABLE {TABELA} ATTACH PARTITION {nome} "
+            f"FOR VALUES FROM ('{inicio}') TO ('{fim}')"))
+        logger.info(f"📦 AUDIT: {movidos} eventos movidos da partição default para {nome}")
+        return nome
+
+    def ensure_partitions(self, ahead=None):
+        """Cria as partições do mês atual e dos próximos meses; retorna as criadas"""
+        if not self.is_postgres():
+            return []
+
+        ahead = self.partitions_ahead if ahead is None else ahead
+        atual = _mes(datetime.utcnow())
+        criadas = []
+        with self._engine().begin() as connection:
+            existentes = set(self._partitions(connection).values())
+            for delta in range(ahead + 1):
+                mes = _mes(atual, delta)
+                if mes not in existentes:
+                    criadas.append(self._create_partition(connection, mes))
+        if criadas:
+            logger.info(f"🗓️ AUDIT: Partições criadas: {', '.join(criadas)}")
+        return criadas
+
+    # ------------------------------------------------------------------
+    # Retenção
+    # ------------------------------------------------------------------
+
+    def cutoff(self, months=None):
+        """Início do período mantido (None = retenção desativada)"""
+        months = self.retention_months if months is None else months
+        if not months or months <= 0:
+            return None
+        return _mes(datetime.utcnow(), -months)
+
+    def apply_retention(self, months=None, dry_run=False):
+        """Remove eventos anteriores ao período de retenção
+
+        No Postgres descarta as partições inteiras do período (DETACH + DROP)
+        e apaga o que sobrou antigo na default; nos demais bancos apaga em
+        lotes. Retorna um resumo do que foi (ou seria, em dry_run) removido.
+        """
+        limite = self.cutoff(months)
+        if limite is None:
+            logger.info("ℹ️ AUDIT: Retenção desativada (AUDIT_RETENTION_MONTHS=0)")
+            return {'cutoff': None, 'partitions': [], 'rows': 0}
+
+        engine = self._engine()
+        if engine.dialect.name == 'postgresql':
+            with engine.connect() as connection:
+                particionada = self.is_partitioned(connection)
+        if engine.dialect.name != 'postgresql' or not particionada:
+            return {'cutoff': limite.isoformat(), 'partitions': [],
+                    'rows': self._delete_rows(engine, limite, dry_run)}
+
+        with engine.begin() as connection:
+            antigas = sorted(nome for nome, mes in self._partitions(connection).items()
+                             if _mes(mes, 1) <= limite)
+            parametros = {'limite': limite.isoformat()}
+            if dry_run:
+                linhas = connection.execute(text(
+                    f"SELECT count(*) FROM {PARTICAO_DEFAULT} WHERE \"timestamp\" < :limite"),
+                    parametros).scalar()
+            else:
+                for nome in antigas:
+                    connection.execute(text(f"ALTER TABLE {TABELA} DETACH PARTITION {nome}"))
+                    connection.execute(text(f"DROP TABLE {nome}"))
+                linhas = connection.execute(text(
+                    f"DELETE FROM {PARTICAO_DEFAULT} WHERE \"timestamp\" < :limite"),
+                    parametros).rowcount
+
+        logger.info(f"🧹 AUDIT: Retenção até {limite.isoformat()}: {len(antigas)} partições, "
+                    f"{linhas} eventos na default{' (simulação)' if dry_run else ''}")
+        return {'cutoff': limite.isoformat(), 'partitions': antigas, 'rows': linhas}
+
+    def _delete_rows(self, engine, limite, dry_run):
+        from models.audit_log import AuditLog
+
+        tabela = AuditLog.__table__
+        antigos = tabela.c.timestamp < datetime.combine(limite, datetime.min.time())
+        if dry_run:
+            with engine.connect() as connection:
+                return connection.execute(
+                    select(func.count()).select_from(tabela).where(antigos)).scalar()
+
+        total = 0
+        while True:
+            with engine.begin() as connection:
+                ids = connection.execute(select(tabela.c.id).where(antigos)
+                                         .limit(self.delete_batch_size)).scalars().all()
+                if not ids:
+                    break
+                connection.execute(tabela.delete().where(tabela.c.id.in_(ids)))
+            total += len(ids)
+        logger.info(f"🧹 AUDIT: {total} eventos anteriores a {limite.isoformat()} removidos")
+        return total
+
+
+# Instância global
+audit_partitions = AuditPartitions()
@@ -0,0 +1,145 @@
+"""
+Gravação da trilha de auditoria - Sistema GEDO CIMCOP
+
+audit_log() (utils/security.py) apenas coloca o evento em uma fila em
+memória; uma thread por worker grava os eventos na tabela audit_logs em
+lotes (AUDIT_BATCH_SIZE eventos ou a cada AUDIT_FLUSH_INTERVAL segundos, o
+que vier primeiro), em conexão própria, fora da db.session da requisição.
+
+Com a fila cheia (banco lento ou indisponível) a requisição espera no
+máximo AUDIT_ENQUEUE_TIMEOUT segundos; depois disso o evento vai apenas
+para o log da aplicação. Lotes que falham são tentados de novo algumas
+vezes antes de irem para o log. No encerramento do processo a fila é
+esvaziada.
+"""
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AuditService:
+    """Fila de eventos de auditoria com gravação em lote em segundo plano"""
+
+    def __init__(self, batch_size=100, flush_interval=2.0, max_pending=10000,
+                 enqueue_timeout=0.05, max_retries=3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self.app = None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.dropped = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('AUDIT_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('AUDIT_FLUSH_INTERVAL', self.flush_interval)
+        self.max_pending = app.config.get('AUDIT_MAX_PENDING', self.max_pending)
+        self.enqueue_timeout = app.config.get('AUDIT_ENQUEUE_TIMEOUT', self.enqueue_timeout)
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        atexit.register(self.shutdown)
+
+    def enqueue(self, event):
+        """Coloca o evento na fila (chamado no caminho da requisição)"""
+        if not self.app:
+            logger.info(f"AUDIT: {json.dumps(event, default=str)}")
+            return False
+
+        self._ensure_thread()
+        try:
+            self._queue.put(event, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"⚠️ AUDIT: Fila cheia - evento apenas no log: "
+                           f"{json.dumps(event, default=str)}")
+            return False
+
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def _ensure_thread(self):
+        # Iniciada no primeiro evento: cada worker (após o fork) tem a sua
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='gedo-audit', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ AUDIT: Erro na thread de gravação: {e}")
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        """Grava tudo o que está na fila; retorna o número de eventos gravados"""
+        total = 0
+        with self._flush_lock:
+            while True:
+                batch = self._drain()
+                if not batch:
+                    return total
+                if not self._write(batch):
+                    return total
+                total += len(batch)
+
+    def _write(self, batch):
+        from models.audit_log import AuditLog
+        from models.user import db
+
+        for tentativa in range(1, self.max_retries + 1):
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as connection:
+                        connection.execute(AuditLog.__table__.insert(), batch)
+                return True
+            except Exception as e:
+                logger.error(f"❌ AUDIT: Erro ao gravar {len(batch)} eventos "
+                             f"(tentativa {tentativa}/{self.max_retries}): {e}")
+                if self._stopping.is_set():
+                    break
+                time.sleep(min(2 ** tentativa, 10))
+
+        for event in batch:
+            logger.warning(f"AUDIT (não gravado): {json.dumps(event, default=str)}")
+        return False
+
+    def shutdown(self, timeout=5):
+        """Para a thread e grava os eventos pendentes"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+        if self.app:
+            self.flush()
+
+
+# Instância global
+audit_service = AuditService()
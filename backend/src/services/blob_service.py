@@ -13,8 +13,12 @@ class BlobService:
         self.blob_token = os.getenv('BLOB_READ_WRITE_TOKEN')
         self.base_url = 'https://blob.vercel-storage.com'
 
-    def upload_file(self, file, folder='uploads'):
-        """Upload de arquivo para Vercel Blob"""
+    def upload_file(self, file, folder='uploads', data=None):
+        """Upload de arquivo para Vercel Blob
+
+        Se `data` for informado (conteúdo já lido na validação), o arquivo
+        não é lido novamente.
+        """
         if not self.blob_token:
             raise Exception("BLOB_READ_WRITE_TOKEN não configurado")
 
@@ -29,9 +33,12 @@ class BlobService:
 
         try:
             # ← CORREÇÃO CRÍTICA: Ler arquivo corretamente
-            file.seek(0)  # Garantir que estamos no início
-            file_data = file.read()
-            file.seek(0)  # Reset para outras operações
+            if data is not None:
+                file_data = data
+            else:
+                file.seek(0)  # Garantir que estamos no início
+                file_data = file.read()
+                file.seek(0)  # Reset para outras operações
 
             # ← CORREÇÃO: Detectar Content-Type correto
             content_type = file.content_type
@@ -91,6 +98,39 @@ class BlobService:
             current_app.logger.error(f"❌ UPLOAD EXCEPTION: {str(e)}")
             return None
 
+    def upload_data(self, data, pathname, content_type='application/octet-stream',
+                    size=None, timeout=60):
+        """Upload de conteúdo para um pathname fixo (ex.: miniaturas)
+
+        `data` pode ser um arquivo aberto (enviado em streaming); nesse caso
+        informe `size`.
+        """
+        if not self.blob_token:
+            return None
+
+        try:
+            response = requests.put(
+                f"{self.base_url}/{pathname}",
+                data=data,
+                headers={
+                    'Authorization': f'Bearer {self.blob_token}',
+                    'Content-Type': content_type,
+                    'Content-Length': str(size if size is not None else len(data)),
+                    'x-add-random-suffix': '0'
+                },
+                timeout=timeout
+            )
+            if response.status_code == 200:
+                blob_data = response.json()
+                return {'url': blob_data['url'], 'pathname': blob_data['pathname']}
+
+            current_app.logger.error(
+                f"❌ UPLOAD ERROR: {response.status_code} - {response.text}")
+            return None
+        except Exception as e:
+            current_app.logger.error(f"❌ UPLOAD EXCEPTION: {str(e)}")
+            return None
+
     def delete_file(self, pathname):
         """Deletar arquivo do Vercel Blob"""
         if not self.blob_token or not pathname:
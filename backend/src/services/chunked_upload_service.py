@@ -0,0 +1,211 @@
+"""
+Upload de anexos em partes (retomável) - Sistema GEDO CIMCOP
+
+Cada parte é gravada no arquivo temporário (spool) da sessão na posição
+correspondente, e o SHA-256 é atualizado à medida que as partes chegam. O
+estado do hash fica em memória no worker que recebeu a parte; se a próxima
+parte cair em outro worker (ou após reinício), o hash é recalculado a partir
+do spool, que fica em um diretório compartilhado (CHUNKED_UPLOAD_DIR).
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class SpooledUpload:
+    """Conteúdo montado no spool, com a interface do UploadBuffer"""
+
+    def __init__(self, path, file_hash, size, header_size=1024):
+        self.path = path
+        self.file_hash = file_hash
+        self.size = size
+        self._header_size = header_size
+        self._data = None
+
+    @property
+    def header(self):
+        with open(self.path, 'rb') as f:
+            return f.read(self._header_size)
+
+    @property
+    def data(self):
+        # Lido sob demanda, só para a miniatura (arquivos até MAX_FILE_SIZE);
+        # a validação usa o caminho (PDF) ou stream()
+        if self._data is None:
+            with open(self.path, 'rb') as f:
+                self._data = f.read()
+        return self._data
+
+    def stream(self):
+        return open(self.path, 'rb')
+
+
+class ChunkedUploadService:
+    """Spool em disco e hash incremental das sessões de upload"""
+
+    def __init__(self):
+        self.directory = os.path.join(tempfile.gettempdir(), 'gedo-chunked-uploads')
+        self.chunk_size = 5 * 1024 * 1024
+        self.max_bytes = 200 * 1024 * 1024
+        self.ttl_hours = 24
+        self._hashers = {}  # upload_id -> (offset, sha256)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = app.config.get('CHUNKED_UPLOAD_DIR') or self.directory
+        self.chunk_size = app.config.get('CHUNKED_UPLOAD_CHUNK_MB', 5) * 1024 * 1024
+        self.max_bytes = app.config.get('CHUNKED_UPLOAD_MAX_MB', 200) * 1024 * 1024
+        self.ttl_hours = app.config.get('CHUNKED_UPLOAD_TTL_HOURS', self.ttl_hours)
+
+    def spool_path(self, upload_id):
+        return os.path.join(self.directory, f"{upload_id}.part")
+
+    def write_chunk(self, upload_id, offset, data):
+        """Grava a parte na posição `offset` e atualiza o hash"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.spool_path(upload_id)
+        hasher = self._hasher_at(upload_id, offset)
+
+        mode = 'r+b' if os.path.exists(path) else 'wb'
+        with open(path, mode) as f:
+            # Descarta restos de uma tentativa anterior interrompida
+            f.seek(offset)
+            f.truncate()
+            f.write(data)
+
+        hasher.update(data)
+        with self._lock:
+            self._hashers[upload_id] = (offset + len(data), hasher)
+
+    def finish_hash(self, upload_id, size):
+        """SHA-256 do conteúdo completo"""
+        return self._hasher_at(upload_id, size).hexdigest()
+
+    def _hasher_at(self, upload_id, offset):
+        """Estado do hash após `offset` bytes (recalculado do spool se preciso)"""
+        with self._lock:
+            entry = self._hashers.get(upload_id)
+        if entry and entry[0] == offset:
+            return entry[1].copy()
+
+        hasher = hashlib.sha256()
+        if offset:
+            logger.info(f"🔁 UPLOAD: Recalculando hash da sessão {upload_id} ({offset} bytes)")
+            remaining = offset
+            with open(self.spool_path(upload_id), 'rb') as f:
+                while remaining > 0:
+                    chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ValueError('Arquivo temporário incompleto')
+                    hasher.update(chunk)
+                    remaining -= len(chunk)
+        return hasher
+
+    def open_spool(self, upload_id, file_hash, size):
+        return SpooledUpload(self.spool_path(upload_id), file_hash, size)
+
+    def discard(self, upload_id):
+        """Remove o spool e o estado do hash da sessão"""
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+        try:
+            os.remove(self.spool_path(upload_id))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"❌ UPLOAD: Erro ao remover spool {upload_id}: {e}")
+
+    def hold(self, session, upload, anexo):
+        """Conclui a sessão com o anexo, que passa a ter uma referência dela
+
+        A referência impede que o conteúdo seja removido por uma liberação
+        concorrente enquanto o upload_id não é vinculado a um registro.
+        """
+        from models.anexo import Anexo
+
+        session.flush()  # anexo recém-criado precisa do id
+        Anexo.adicionar_referencia(anexo.id)
+        upload.status = 'completo'
+        upload.hash_sha256 = anexo.hash_sha256
+        upload.anexo_id = anexo.id
+
+    def release(self, session, upload):
+        """Remove a sessão e libera a referência que ela mantém no anexo
+
+        Usado quando o anexo é vinculado a um registro (que já tomou a sua
+        própria referência), no cancelamento e na expiração. Retorna os
+        arquivos a remover do storage depois do commit, se o anexo ficou sem
+        referências.
+        """
+        from models.anexo import Anexo
+
+        self.discard(upload.id)
+        anexo_id = upload.anexo_id if upload.status == 'completo' else None
+        session.delete(upload)
+        if not anexo_id:
+            return None
+        session.flush()  # a sessão sai antes do anexo (FK)
+        anexo = Anexo.remover_referencia(anexo_id)
+        return anexo.arquivos_armazenados() if anexo else None
+
+    def cleanup_expired(self, session, limit=100):
+        """Remove sessões expiradas e anexos abandonados, com seus arquivos
+
+        Sessões concluídas e não vinculadas liberam a referência ao anexo.
+        Anexos sem referências e sem nenhum detentor (por exemplo, de versões
+        anteriores à contagem pelas sessões) são removidos depois do TTL.
+        Faz o commit; os arquivos são removidos do storage em seguida.
+        """
+        from datetime import datetime, timedelta
+        from sqlalchemy import delete, exists
+        from models.anexo import Anexo
+        from models.registro import Registro
+        from models.registro_anexo import RegistroAnexo
+        from models.upload_session import UploadSession
+        from services.storage_service import storage_service
+
+        agora = datetime.utcnow()
+        arquivos = []
+        expiradas = session.query(UploadSession).filter(
+            UploadSession.expires_at < agora).limit(limit).all()
+        for upload in expiradas:
+            arquivos.append(self.release(session, upload))
+
+        sem_detentor = (
+            Anexo.ref_count <= 0,
+            ~exists().where(Registro.anexo_id == Anexo.id),
+            ~exists().where(RegistroAnexo.anexo_id == Anexo.id),
+            ~exists().where(UploadSession.anexo_id == Anexo.id)
+        )
+        candidatos = session.query(Anexo).filter(
+            Anexo.created_at < agora - timedelta(hours=self.ttl_hours), *sem_detentor
+        ).limit(limit).all()
+        abandonados = 0
+        for anexo in candidatos:
+            # DELETE condicional: uma referência tomada depois da consulta vence
+            result = session.execute(
+                delete(Anexo).where(Anexo.id == anexo.id, *sem_detentor)
+                .execution_options(synchronize_session=False))
+            if result.rowcount:
+                arquivos.append(anexo.arquivos_armazenados())
+                session.expunge(anexo)
+                abandonados += 1
+
+        if not expiradas and not abandonados:
+            return 0
+        session.commit()
+        for arquivos_anexo in arquivos:
+            storage_service.delete(arquivos_anexo)
+        logger.info(f"🧹 UPLOAD: {len(expiradas)} sessão(ões) expirada(s) e "
+                    f"{abandonados} anexo(s) abandonado(s) removido(s)")
+        return len(expiradas) + abandonados
+
+
+# Instância global
+chunked_upload_service = ChunkedUploadService()
@@ -0,0 +1,207 @@
+"""
+Cache das configurações do sistema - Sistema GEDO CIMCOP
+
+As configurações (tabela configuracoes) são carregadas uma vez em um
+snapshot somente leitura, com os valores já convertidos pelo tipo
+(converter_valor em models/configuracao.py). As personalizações de cada
+usuário (configuracoes_usuario) são carregadas na primeira leitura daquele
+usuário e sobrepostas ao snapshot.
+
+A versão fica no storage compartilhado do security_manager (memória, banco
+ou Redis), como em services/reference_cache.py, e é trocada por
+invalidate() depois do commit em atualizar/resetar configurações. Cada
+worker confere a versão no máximo a cada CONFIG_CACHE_CHECK_INTERVAL
+segundos; no worker que fez a alteração a troca é imediata.
+"""
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+CHAVE_VERSAO = 'configuracoes:versao'
+
+
+def _copia(valor):
+    # Valores json (dict/list) são copiados para o snapshot não ser alterado
+    return copy.deepcopy(valor) if isinstance(valor, (dict, list)) else valor
+
+
+class ConfigSnapshot:
+    """Configurações do sistema em uma versão (somente leitura)"""
+
+    __slots__ = ('versao', 'valores', 'tipos', '_entradas', '_derivados')
+
+    def __init__(self, versao, configuracoes):
+        entradas = tuple(MappingProxyType(config.to_dict()) for config in configuracoes)
+        self.versao = versao
+        self.valores = MappingProxyType({entrada['chave']: entrada['valor'] for entrada in entradas})
+        self.tipos = MappingProxyType({config.chave: config.tipo for config in configuracoes})
+        self._entradas = entradas
+        self._derivados = {}
+
+    def get(self, chave, default=None):
+        valor = self.valores.get(chave)
+        return default if valor is None else _copia(valor)
+
+    def derived(self, nome, builder):
+        """Valor calculado a partir do snapshot, montado uma vez por versão"""
+        if nome not in self._derivados:
+            self._derivados[nome] = builder(self)
+        return self._derivados[nome]
+
+    def entradas(self, somente_editaveis=False):
+        """Configurações no formato de Configuracao.to_dict() (cópias)"""
+        return [{chave: _copia(valor) for chave, valor in entrada.items()}
+                for entrada in self._entradas
+                if entrada['editavel_usuario'] or not somente_editaveis]
+
+
+class ConfigService:
+    """Snapshot das configurações do sistema com personalizações por usuário"""
+
+    def __init__(self, check_interval=5, max_users=1024, version_ttl=30 * 86400):
+        self.check_interval = check_interval
+        self.max_users = max_users
+        self.version_ttl = version_ttl
+        self._snapshot = None
+        self._usuarios = OrderedDict()  # user_id -> (versão, personalizações)
+        self._versao = None
+        self._versao_em = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.check_interval = app.config.get('CONFIG_CACHE_CHECK_INTERVAL', self.check_interval)
+
+    @property
+    def storage(self):
+        from utils.security import security_manager
+        return security_manager.storage
+
+    # ------------------------------------------------------------------
+    # Versão
+    # ------------------------------------------------------------------
+
+    def version(self):
+        """Versão atual, relida do storage a cada check_interval segundos"""
+        agora = time.monotonic()
+        if self._versao is not None and agora - self._versao_em < self.check_interval:
+            return self._versao
+
+        valor = self.storage.get(CHAVE_VERSAO)
+        if valor is None:
+            valor = time.time()
+            self.storage.set(CHAVE_VERSAO, valor, self.version_ttl)
+        self._versao, self._versao_em = f"{float(valor):.6f}", agora
+        return self._versao
+
+    def invalidate(self):
+        """Descarta snapshot e personalizações (chamar depois do commit)"""
+        valor = time.time()
+        try:
+            self.storage.set(CHAVE_VERSAO, valor, self.version_ttl)
+        except Exception as e:
+            logger.error(f"❌ CONFIG: Erro ao publicar nova versão: {str(e)}")
+        with self._lock:
+            self._versao, self._versao_em = f"{valor:.6f}", time.monotonic()
+            self._snapshot = None
+            self._usuarios.clear()
+        logger.info("🔄 CONFIG: Configurações invalidadas")
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+
+    def snapshot(self):
+        """Snapshot da versão atual (carregado do banco uma vez por versão)"""
+        versao = self.version()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.versao == versao:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.versao != versao:
+                from models.configuracao import Configuracao
+
+                snapshot = ConfigSnapshot(versao, Configuracao.query.order_by(Configuracao.id).all())
+                self._snapshot = snapshot
+                logger.info(f"⚙️ CONFIG: {len(snapshot.valores)} configurações carregadas")
+        return snapshot
+
+    def user_overrides(self, user_id):
+        """Personalizações do usuário, convertidas pelo tipo da configuração"""
+        snapshot = self.snapshot()
+        with self._lock:
+            entry = self._usuarios.get(user_id)
+            if entry and entry[0] == snapshot.versao:
+                self._usuarios.move_to_end(user_id)
+                return entry[1]
+
+        from models.configuracao import ConfiguracaoUsuario, converter_valor
+
+        overrides = MappingProxyType({
+            config.chave: converter_valor(snapshot.tipos.get(config.chave, 'string'), config.valor)
+            for config in ConfiguracaoUsuario.query.filter_by(user_id=user_id).all()
+        })
+        with self._lock:
+            self._usuarios[user_id] = (snapshot.versao, overrides)
+            self._usuarios.move_to_end(user_id)
+            while len(self._usuarios) > self.max_users:
+                self._usuarios.popitem(last=False)
+        return overrides
+
+    def get(self, chave, default=None, user_id=None):
+        """Valor tipado da configuração (personalizado se user_id tiver um)
+
+        Se as configurações não puderem ser lidas, retorna default.
+        """
+        try:
+            if user_id is not None:
+                overrides = self.user_overrides(user_id)
+                if overrides.get(chave) is not None:
+                    return _copia(overrides[chave])
+            return self.snapshot().get(chave, default)
+        except Exception as e:
+            logger.error(f"❌ CONFIG: Erro ao ler configuração {chave}: {str(e)}")
+            return default
+
+    # ------------------------------------------------------------------
+    # Configurações usadas fora da tela de configurações
+    # ------------------------------------------------------------------
+
+    def _derived(self, nome, builder, default):
+        try:
+            valor = self.snapshot().derived(nome, builder)
+        except Exception as e:
+            logger.error(f"❌ CONFIG: Erro ao ler configuração {nome}: {str(e)}")
+            return default
+        return default if valor is None else valor
+
+    def max_upload_bytes(self, default):
+        """max_tamanho_arquivo (MB) em bytes; default (bytes) se ausente ou inválido"""
+        def build(snapshot):
+            megabytes = snapshot.get('max_tamanho_arquivo')
+            if isinstance(megabytes, int) and megabytes > 0:
+                return megabytes * 1024 * 1024
+            return None
+
+        return self._derived('max_upload_bytes', build, default)
+
+    def allowed_extensions(self, default):
+        """tipos_arquivo_permitidos como conjunto de extensões; default se vazio"""
+        def build(snapshot):
+            valor = snapshot.get('tipos_arquivo_permitidos')
+            if not isinstance(valor, str):
+                return None
+            return frozenset(ext.strip().lower().lstrip('.')
+                             for ext in valor.split(',') if ext.strip()) or None
+
+        return self._derived('allowed_extensions', build, default)
+
+
+# Instância global
+config_service = ConfigService()
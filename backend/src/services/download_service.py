@@ -0,0 +1,228 @@
+"""
+Serviço de download de anexos - Sistema GEDO CIMCOP
+
+Modos (DOWNLOAD_MODE):
+- proxy: o worker Flask transmite o arquivo (comportamento original)
+- redirect: após autorizar, redireciona para uma URL assinada de curta
+  duração (sem DOWNLOAD_SIGNING_SECRET, recorre ao proxy)
+- accel: após autorizar, delega a transmissão ao nginx via X-Accel-Redirect
+
+No modo proxy, os blobs são servidos a partir do cache em disco
+(services/attachment_cache.py) com ETag, Range e respostas 304.
+
+Exemplo de configuração do nginx (accel e redirect assinado):
+
+    location /_protected/blob/ {
+        internal;
+        proxy_pass https://<store>.public.blob.vercel-storage.com/;
+    }
+    location /_protected/uploads/ {
+        internal;
+        alias /app/src/uploads/;
+    }
+    location /_protected/anexos/ {
+        # Só se LOCAL_STORAGE_DIR estiver fora de src/uploads
+        internal;
+        alias <LOCAL_STORAGE_DIR>/;
+    }
+    location /files/ {
+        secure_link $arg_md5,$arg_expires;
+        secure_link_md5 "$secure_link_expires$uri <DOWNLOAD_SIGNING_SECRET>";
+        if ($secure_link = "") { return 403; }
+        if ($secure_link = "0") { return 410; }
+        proxy_pass https://<store>.public.blob.vercel-storage.com/;
+    }
+"""
+import base64
+import hashlib
+import logging
+import mimetypes
+import time
+from urllib.parse import quote, urlencode, urlparse
+from flask import Response, current_app, redirect, send_file
+from services.attachment_cache import attachment_cache
+from services.storage_service import storage_service
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE_MAP = {
+    'pdf': 'application/pdf',
+    'doc': 'application/msword',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xls': 'application/vnd.ms-excel',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'ppt': 'application/vnd.ms-powerpoint',
+    'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+    'bmp': 'image/bmp',
+    'tiff': 'image/tiff',
+    'txt': 'text/plain',
+    'csv': 'text/csv',
+    'zip': 'application/zip',
+    'rar': 'application/x-rar-compressed',
+    '7z': 'application/x-7z-compressed',
+    'mp4': 'video/mp4',
+    'avi': 'video/x-msvideo',
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav'
+}
+
+
+def resolve_file_extension(registro):
+    """Extensão do anexo (formato salvo ou extensão do nome original)"""
+    if registro.formato_arquivo:
+        return registro.formato_arquivo.lower()
+    nome = registro.get_nome_arquivo_original()
+    if nome and '.' in nome:
+        return nome.rsplit('.', 1)[1].lower()
+    return None
+
+
+def resolve_content_type(registro, fallback='application/octet-stream'):
+    """Content-Type pela extensão do anexo"""
+    file_extension = resolve_file_extension(registro)
+    if file_extension in CONTENT_TYPE_MAP:
+        return CONTENT_TYPE_MAP[file_extension]
+    if file_extension:
+        guessed_type = mimetypes.guess_type(f"file.{file_extension}")[0]
+        if guessed_type:
+            return guessed_type
+    return fallback
+
+
+def resolve_download_name(registro):
+    """Nome do arquivo para download, sempre com a extensão correta"""
+    file_extension = resolve_file_extension(registro)
+    filename = registro.get_nome_arquivo_original()
+    if not filename:
+        return f"anexo_{registro.id}.{file_extension}" if file_extension else f"anexo_{registro.id}"
+
+    if file_extension and not filename.lower().endswith(f'.{file_extension}'):
+        if '.' not in filename:
+            return f"{filename}.{file_extension}"
+        return f"{filename.rsplit('.', 1)[0]}.{file_extension}"
+    return filename
+
+
+def content_disposition(filename):
+    """Content-Disposition com nome ASCII e variante UTF-8 (RFC 6266)"""
+    ascii_name = filename.encode('ascii', 'ignore').decode() or 'anexo'
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+
+class DownloadService:
+    """Decide como entregar o anexo depois que a requisição foi autorizada"""
+
+    def _config(self, key, default=None):
+        return current_app.config.get(key, default)
+
+    def signed_url(self, blob_pathname):
+        """URL assinada e com expiração (formato do secure_link do nginx)
+
+        Requer DOWNLOAD_SIGNED_BASE_URL e DOWNLOAD_SIGNING_SECRET.
+        """
+        base_url = self._config('DOWNLOAD_SIGNED_BASE_URL')
+        secret = self._config('DOWNLOAD_SIGNING_SECRET')
+        if not base_url or not secret:
+            return None
+
+        expires = int(time.time()) + int(self._config('DOWNLOAD_URL_TTL', 300))
+        # O $uri do nginx é decodificado: assina o caminho original e envia
+        # o caminho codificado na URL
+        uri = f"{urlparse(base_url).path.rstrip('/')}/{blob_pathname}"
+        digest = hashlib.md5(f"{expires}{uri} {secret}".encode()).digest()
+        signature = base64.urlsafe_b64encode(digest).decode().rstrip('=')
+        query = urlencode({'md5': signature, 'expires': expires, 'download': 1})
+        return f"{base_url.rstrip('/')}/{quote(blob_pathname)}?{query}"
+
+    def redirect_response(self, registro):
+        if not registro.blob_pathname:
+            # Arquivos locais seguem pelo send_file
+            return None
+
+        url = self.signed_url(registro.blob_pathname)
+        if not url:
+            # Sem assinatura configurada a URL do Blob seria pública e
+            # permanente: o download segue pelo proxy
+            logger.warning("⚠️ DOWNLOAD: DOWNLOAD_MODE=redirect sem DOWNLOAD_SIGNED_BASE_URL/"
+                           "DOWNLOAD_SIGNING_SECRET - usando proxy")
+            return None
+
+        logger.info(f"↪️ DOWNLOAD: Redirecionando registro {registro.id} para o storage")
+        response = redirect(url, code=302)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    def accel_response(self, registro):
+        if registro.blob_pathname:
+            prefix = self._config('DOWNLOAD_ACCEL_BLOB_PREFIX', '/_protected/blob')
+            internal_path = f"{prefix.rstrip('/')}/{registro.blob_pathname}"
+        elif registro.caminho_anexo:
+            local = storage_service.local_relative_path(registro.caminho_anexo)
+            if not local:
+                # Fora das pastas mapeadas no nginx: segue pelo proxy
+                return None
+            raiz, relative = local
+            if raiz == 'storage':
+                prefix = self._config('DOWNLOAD_ACCEL_STORAGE_PREFIX', '/_protected/anexos')
+            else:
+                prefix = self._config('DOWNLOAD_ACCEL_LOCAL_PREFIX', '/_protected/uploads')
+            internal_path = f"{prefix.rstrip('/')}/{relative}"
+        else:
+            return None
+
+        logger.info(f"🚀 DOWNLOAD: X-Accel-Redirect do registro {registro.id}")
+        response = Response(status=200)
+        response.headers['X-Accel-Redirect'] = quote(internal_path)
+        response.headers['Content-Type'] = resolve_content_type(registro)
+        response.headers['Content-Disposition'] = content_disposition(resolve_download_name(registro))
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+
+    def cached_response(self, registro):
+        """Serve o blob a partir do cache em disco (Range, ETag e 304)
+
+        O ETag é o SHA-256 do conteúdo, que é imutável para um mesmo
+        blob_pathname. Retorna None se o cache não puder ser usado.
+        """
+        if not registro.blob_url:
+            return None
+        path = attachment_cache.get_or_fetch(registro.blob_url, registro.blob_pathname)
+        if not path:
+            return None
+
+        anexo = registro.anexo
+        etag = anexo.hash_sha256 if anexo else True
+        last_modified = (anexo.created_at if anexo else None) or registro.created_at
+
+        response = send_file(
+            path,
+            mimetype=resolve_content_type(registro),
+            as_attachment=True,
+            download_name=resolve_download_name(registro),
+            conditional=True,
+            etag=etag,
+            last_modified=last_modified,
+            max_age=0
+        )
+        # Pode ficar no cache do navegador, mas sempre revalidado (304)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+
+    def direct_response(self, registro):
+        """Resposta sem transmitir bytes pelo worker, ou None para usar o proxy"""
+        mode = self._config('DOWNLOAD_MODE', 'proxy')
+        if mode == 'redirect':
+            return self.redirect_response(registro)
+        if mode == 'accel':
+            return self.accel_response(registro)
+        return None
+
+
+# Instância global
+download_service = DownloadService()
@@ -0,0 +1,335 @@
+"""
+Facetas de pesquisa por obra - Sistema GEDO CIMCOP
+
+O painel de filtros (/api/pesquisa/filtros) lê a tabela registro_facetas em
+vez de varrer registros com DISTINCT e MIN/MAX. A tabela é atualizada na
+mesma transação de cada INSERT/UPDATE/DELETE de registro (eventos do
+mapper), somando ou subtraindo 1 da contagem de cada valor; linhas que
+chegam a zero são removidas. As colunas usadas têm active_history em
+models/registro.py, para o valor anterior ser conhecido na atualização.
+Para recalcular tudo: python scripts/rebuild_facetas.py. Para administradores, as facetas de todas as
+obras são combinadas em memória.
+
+A pesquisa avançada também pode pedir contagens por faceta sobre o filtro
+atual (?facets=tipo,classificacao_grupo,obra,autor). Essas contagens vêm de
+uma única consulta com GROUPING SETS no Postgres (um GROUP BY por faceta nos
+demais bancos), na mesma transação da página de resultados, limitadas aos
+valores mais frequentes e guardadas por alguns segundos pela assinatura
+normalizada do filtro. O cache é invalidado pela geração geral de
+services/search_cache.py, trocada depois do commit de qualquer escrita de
+registro (em todos os workers).
+"""
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from sqlalchemy import event, func
+from sqlalchemy.orm.attributes import get_history
+
+logger = logging.getLogger(__name__)
+
+# Atributos do registro que alimentam as facetas (active_history=True no modelo)
+FACET_ATTRIBUTES = ('obra_id', 'tipo_registro', 'autor_id', 'classificacao_grupo',
+                    'data_registro', 'created_at')
+
+# Facetas de data (YYYY-MM-DD): o resumo traz só o intervalo (MIN/MAX)
+FACETAS_DATA = ('data_registro', 'criacao')
+
+
+def _dia(value):
+    if value is None:
+        return None
+    return value.isoformat()[:10] if hasattr(value, 'isoformat') else str(value)[:10]
+
+
+def facet_keys(values):
+    """Chaves (obra_id, faceta, valor) de um registro"""
+    obra_id = values.get('obra_id')
+    if obra_id is None:
+        return []
+    candidatos = (
+        ('tipo_registro', values.get('tipo_registro')),
+        ('autor', values.get('autor_id')),
+        ('classificacao_grupo', values.get('classificacao_grupo')),
+        ('data_registro', _dia(values.get('data_registro'))),
+        ('criacao', _dia(values.get('created_at'))),
+    )
+    return [(obra_id, faceta, str(valor)[:200])
+            for faceta, valor in candidatos if valor not in (None, '')]
+
+
+# Facetas aceitas em ?facets= e a coluna de registros correspondente
+FACETAS_PESQUISA = {
+    'tipo': 'tipo_registro',
+    'classificacao_grupo': 'classificacao_grupo',
+    'obra': 'obra_id',
+    'autor': 'autor_id',
+}
+
+
+def parse_facetas(value):
+    """Lista normalizada (sem repetição, ordem fixa) de ?facets=; None se houver inválida"""
+    pedidas = {item.strip() for item in (value or '').split(',') if item.strip()}
+    if pedidas - set(FACETAS_PESQUISA):
+        return None
+    return [faceta for faceta in FACETAS_PESQUISA if faceta in pedidas]
+
+
+class FacetasService:
+    """Manutenção incremental e leitura das facetas por obra"""
+
+    def __init__(self, limite=50, cache_ttl=60, max_entries=512):
+        self.limite = limite
+        self.cache_ttl = cache_ttl
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # assinatura -> (expira_em, geração, contagens)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        from models.registro import Registro
+
+        self.limite = app.config.get('FACET_COUNTS_LIMIT', self.limite)
+        self.cache_ttl = app.config.get('FACET_COUNTS_CACHE_TTL', self.cache_ttl)
+        event.listen(Registro, 'after_insert', self._after_insert)
+        event.listen(Registro, 'after_update', self._after_update)
+        event.listen(Registro, 'after_delete', self._after_delete)
+
+    # ------------------------------------------------------------------
+    # Eventos do mapper (executados dentro do flush, mesma transação)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _current_values(target):
+        values = {attr: getattr(target, attr) for attr in FACET_ATTRIBUTES}
+        if values['created_at'] is None:
+            values['created_at'] = datetime.utcnow()
+        return values
+
+    def _after_insert(self, mapper, connection, target):
+        self.apply(connection, Counter(facet_keys(self._current_values(target))))
+
+    def _after_delete(self, mapper, connection, target):
+        deltas = Counter()
+        deltas.subtract(facet_keys(self._current_values(target)))
+        self.apply(connection, deltas)
+
+    def _after_update(self, mapper, connection, target):
+        new_values = self._current_values(target)
+        old_values = dict(new_values)
+        changed = False
+        for attr in FACET_ATTRIBUTES:
+            history = get_history(target, attr)
+            if history.has_changes():
+                changed = True
+                old_values[attr] = history.deleted[0] if history.deleted else None
+        if not changed:
+            return
+
+        deltas = Counter(facet_keys(new_values))
+        deltas.subtract(facet_keys(old_values))
+        self.apply(connection, deltas)
+
+    def apply(self, connection, deltas):
+        """Soma os deltas às contagens (upsert) e remove as que zeraram"""
+        from models.registro_faceta import RegistroFaceta
+
+        table = RegistroFaceta.__table__
+        dialect = connection.dialect.name
+
+        for (obra_id, faceta, valor), delta in deltas.items():
+            if not delta:
+                continue
+            match = ((table.c.obra_id == obra_id) & (table.c.faceta == faceta) &
+                     (table.c.valor == valor))
+
+            if dialect in ('postgresql', 'sqlite'):
+                if dialect == 'postgresql':
+                    from sqlalchemy.dialects.postgresql import insert
+                else:
+                    from sqlalchemy.dialects.sqlite import insert
+                stmt = insert(table).values(
+                    obra_id=obra_id, faceta=faceta, valor=valor, contagem=delta)
+                connection.execute(stmt.on_conflict_do_update(
+                    index_elements=['obra_id', 'faceta', 'valor'],
+                    set_={'contagem': table.c.contagem + delta}))
+            else:
+                result = connection.execute(
+                    table.update().where(match).values(contagem=table.c.contagem + delta))
+                if result.rowcount == 0:
+                    connection.execute(table.insert().values(
+                        obra_id=obra_id, faceta=faceta, valor=valor, contagem=delta))
+
+            if delta < 0:
+                connection.execute(table.delete().where(match & (table.c.contagem <= 0)))
+
+    # ------------------------------------------------------------------
+    # Reconstrução e leitura
+    # ------------------------------------------------------------------
+
+    def rebuild(self, session):
+        """Recalcula todas as facetas a partir da tabela registros"""
+        from models.registro import Registro
+        from models.registro_faceta import RegistroFaceta
+
+        colunas = (
+            ('tipo_registro', Registro.tipo_registro),
+            ('autor', Registro.autor_id),
+            ('classificacao_grupo', Registro.classificacao_grupo),
+            ('data_registro', func.date(Registro.data_registro)),
+            ('criacao', func.date(Registro.created_at)),
+        )
+
+        session.query(RegistroFaceta).delete()
+        total = 0
+        for faceta, coluna in colunas:
+            linhas = session.query(Registro.obra_id, coluna, func.count(Registro.id))\
+                .filter(coluna.isnot(None))\
+                .group_by(Registro.obra_id, coluna).all()
+            for obra_id, valor, contagem in linhas:
+                valor = _dia(valor) if faceta in FACETAS_DATA else str(valor)
+                if valor:
+                    session.add(RegistroFaceta(obra_id, faceta, valor[:200], contagem))
+                    total += 1
+        session.commit()
+        logger.info(f"📊 FACETAS: {total} valores recalculados")
+        return total
+
+    def resumo(self, obra_ids=None):
+        """Facetas combinadas das obras informadas (None = todas)"""
+        from models.registro_faceta import RegistroFaceta
+        from models.user import User, db
+
+        def filtrar(query):
+            query = query.filter(RegistroFaceta.contagem > 0)
+            if obra_ids is not None:
+                query = query.filter(RegistroFaceta.obra_id.in_(obra_ids))
+            return query
+
+        valores = {}
+        for faceta, valor in filtrar(db.session.query(
+                RegistroFaceta.faceta, RegistroFaceta.valor)
+                .filter(RegistroFaceta.faceta.notin_(FACETAS_DATA))).distinct():
+            valores.setdefault(faceta, set()).add(valor)
+
+        # Datas ISO ordenam como texto: o intervalo sai do banco, sem ler cada dia
+        faixas = {faceta: (minimo, maximo) for faceta, minimo, maximo in filtrar(
+            db.session.query(RegistroFaceta.faceta, func.min(RegistroFaceta.valor),
+                             func.max(RegistroFaceta.valor))
+            .filter(RegistroFaceta.faceta.in_(FACETAS_DATA))
+        ).group_by(RegistroFaceta.faceta)}
+
+        autor_ids = [int(valor) for valor in valores.get('autor', ())]
+        autores = []
+        if autor_ids:
+            autores = [
+                {'id': autor_id, 'username': username, 'email': email}
+                for autor_id, username, email in db.session.query(
+                    User.id, User.username, User.email).filter(User.id.in_(autor_ids)).all()
+            ]
+
+        criacao_min, criacao_max = faixas.get('criacao', (None, None))
+        registro_min, registro_max = faixas.get('data_registro', (None, None))
+        return {
+            'tipos_registro': sorted(valores.get('tipo_registro', ())),
+            'grupos_classificacao': sorted(valores.get('classificacao_grupo', ())),
+            'autores': sorted(autores, key=lambda autor: autor['username'] or ''),
+            'faixas_data': {
+                'criacao_min': criacao_min,
+                'criacao_max': criacao_max,
+                'registro_min': registro_min,
+                'registro_max': registro_max
+            }
+        }
+
+    # ------------------------------------------------------------------
+    # Contagens sobre o filtro da pesquisa avançada
+    # ------------------------------------------------------------------
+
+    def contagens(self, query, facetas, assinatura):
+        """Contagens por faceta dos registros de query (cache pela assinatura)"""
+        if not facetas:
+            return {}
+
+        from services.search_cache import search_cache
+
+        chave = f"{assinatura}|{','.join(facetas)}"
+        agora = time.monotonic()
+        # Geração lida antes da consulta: uma escrita durante a contagem
+        # invalida o resultado guardado
+        geracao = search_cache.generation()
+        with self._lock:
+            entry = self._cache.get(chave)
+            if entry and entry[0] > agora and entry[1] == geracao:
+                self._cache.move_to_end(chave)
+                return entry[2]
+
+        resultado = self._rotular(self._contar(query.order_by(None), facetas))
+
+        with self._lock:
+            self._cache[chave] = (agora + self.cache_ttl, geracao, resultado)
+            self._cache.move_to_end(chave)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return resultado
+
+    def _contar(self, query, facetas):
+        """{faceta: Counter(valor -> contagem)} em uma ida ao banco quando possível"""
+        from models.registro import Registro
+        from models.user import db
+
+        colunas = [getattr(Registro, FACETAS_PESQUISA[faceta]) for faceta in facetas]
+        contagens = {faceta: Counter() for faceta in facetas}
+
+        if db.engine.dialect.name == 'postgresql' and len(facetas) > 1:
+            # GROUPING(coluna) = 0 indica o conjunto ao qual a linha pertence
+            linhas = query.with_entities(
+                *colunas, *[func.grouping(coluna) for coluna in colunas],
+                func.count(Registro.id)
+            ).group_by(func.grouping_sets(*colunas)).all()
+            total = len(facetas)
+            for linha in linhas:
+                for indice, faceta in enumerate(facetas):
+                    if linha[total + indice] == 0:
+                        contagens[faceta][linha[indice]] += linha[-1]
+                        break
+        else:
+            for faceta, coluna in zip(facetas, colunas):
+                for valor, contagem in query.with_entities(
+                        coluna, func.count(Registro.id)).group_by(coluna).all():
+                    contagens[faceta][valor] += contagem
+        return contagens
+
+    def _rotular(self, contagens):
+        """Mantém os valores mais frequentes e adiciona nomes de obras e autores"""
+        from models.obra import Obra
+        from models.user import User, db
+
+        resultado = {}
+        nomes = {}
+        for faceta, contador in contagens.items():
+            valores = sorted(contador.items(),
+                             key=lambda item: (-item[1], str(item[0])))
+            resultado[faceta] = {
+                'valores': [{'valor': valor, 'contagem': contagem}
+                            for valor, contagem in valores[:self.limite]],
+                'total_valores': len(valores),
+                'truncado': len(valores) > self.limite
+            }
+
+        for faceta, model, campo in (('obra', Obra, Obra.nome),
+                                     ('autor', User, User.username)):
+            if faceta not in resultado:
+                continue
+            ids = [item['valor'] for item in resultado[faceta]['valores']
+                   if item['valor'] is not None]
+            if ids:
+                nomes[faceta] = dict(db.session.query(model.id, campo)
+                                     .filter(model.id.in_(ids)).all())
+            for item in resultado[faceta]['valores']:
+                item['nome'] = nomes.get(faceta, {}).get(item['valor'])
+        return resultado
+
+
+# Instância global
+facetas_service = FacetasService()
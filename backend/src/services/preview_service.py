@@ -0,0 +1,195 @@
+"""
+Geração de miniaturas e pré-visualizações de anexos - Sistema GEDO CIMCOP
+
+Após o commit de um novo anexo, a miniatura (JPEG) é gerada em segundo plano:
+- imagens: redução a partir do cabeçalho (draft do JPEG) e thumbnail
+- PDFs: primeira página via PyMuPDF (opcional) ou pdftoppm (poppler-utils)
+
+A renderização roda no processo isolado da validação de arquivos (limite de
+tempo e memória); o pdftoppm tem um prazo menor que o do processo isolado,
+que ao estourar encerra também o pdftoppm (mesmo grupo de processos). A miniatura é gravada junto ao conteúdo original (Vercel
+Blob ou pasta local) e registrada no anexo.
+"""
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from sqlalchemy import event
+from utils.file_validation import run_isolated
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_SIZE = (320, 320)
+PREVIEW_QUALITY = 80
+PREVIEW_CONTENT_TYPE = 'image/jpeg'
+
+# Fração do PREVIEW_TIMEOUT dada ao pdftoppm (o resto cobre a inicialização
+# do processo isolado e a redução da imagem)
+PDFTOPPM_TIMEOUT_FRACTION = 0.75
+
+PREVIEW_FOLDER = os.path.join(os.path.dirname(
+    os.path.dirname(__file__)), 'uploads', 'previews')
+
+
+def render_image_preview(data):
+    """Miniatura JPEG de uma imagem (retorna (ok, bytes|motivo))"""
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(data)) as img:
+        # JPEG: decodifica direto em escala reduzida
+        img.draft('RGB', PREVIEW_SIZE)
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(PREVIEW_SIZE)
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        output = BytesIO()
+        img.save(output, 'JPEG', quality=PREVIEW_QUALITY, optimize=True)
+    return True, output.getvalue()
+
+
+def render_pdf_preview(data, timeout=15):
+    """Miniatura da primeira página do PDF (retorna (ok, bytes|motivo))"""
+    try:
+        import fitz  # PyMuPDF - dependência opcional
+    except ImportError:
+        fitz = None
+
+    if fitz is not None:
+        with fitz.open(stream=data, filetype='pdf') as doc:
+            page = doc.load_page(0)
+            zoom = PREVIEW_SIZE[0] / max(page.rect.width, page.rect.height, 1)
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom * 2, zoom * 2))
+            return render_image_preview(pixmap.tobytes('png'))
+
+    if shutil.which('pdftoppm'):
+        try:
+            result = subprocess.run(
+                ['pdftoppm', '-f', '1', '-l', '1', '-singlefile',
+                 '-scale-to', str(PREVIEW_SIZE[0] * 2), '-png', '-'],
+                input=data, capture_output=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return False, f'pdftoppm excedeu {timeout}s'
+        if result.returncode == 0 and result.stdout:
+            return render_image_preview(result.stdout)
+        return False, 'pdftoppm falhou'
+
+    return False, 'nenhum renderizador de PDF disponível'
+
+
+def render_preview(data, content_type, timeout=15):
+    if content_type == 'application/pdf':
+        return render_pdf_preview(data, timeout=timeout)
+    if content_type and content_type.startswith('image/'):
+        return render_image_preview(data)
+    return False, 'tipo sem pré-visualização'
+
+
+class PreviewService:
+    """Fila de geração de miniaturas em segundo plano"""
+
+    def __init__(self, max_workers=2, max_pending=20):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = 20
+        self.memory_mb = 256
+        self.app = None
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self.app = app
+        self.max_workers = app.config.get('PREVIEW_WORKERS', self.max_workers)
+        self.max_pending = app.config.get('PREVIEW_MAX_PENDING', self.max_pending)
+        self.timeout = app.config.get('PREVIEW_TIMEOUT', self.timeout)
+        self.memory_mb = app.config.get('FILE_VALIDATION_MEMORY_MB', self.memory_mb)
+
+        # Jobs só são enviados depois que o anexo foi gravado de fato
+        event.listen(db.session, 'after_commit', self._on_commit)
+        event.listen(db.session, 'after_rollback', self._on_rollback)
+
+    def supports(self, content_type):
+        return content_type == 'application/pdf' or (
+            content_type or '').startswith('image/')
+
+    def schedule(self, session, anexo_id, data, content_type):
+        """Agenda a miniatura para depois do commit da sessão atual"""
+        if not self.app or not self.supports(content_type):
+            return
+        session.info.setdefault('preview_jobs', []).append(
+            (anexo_id, data, content_type))
+
+    def _on_commit(self, session):
+        for job in session.info.pop('preview_jobs', []):
+            self._submit(*job)
+
+    def _on_rollback(self, session):
+        session.info.pop('preview_jobs', None)
+
+    def _submit(self, anexo_id, data, content_type):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                logger.warning(f"⚠️ PREVIEW: Fila cheia - anexo {anexo_id} sem miniatura")
+                return
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='gedo-preview')
+        self._executor.submit(self._run, anexo_id, data, content_type)
+
+    def _run(self, anexo_id, data, content_type):
+        try:
+            with self.app.app_context():
+                self.generate(anexo_id, data, content_type)
+        except Exception as e:
+            logger.error(f"❌ PREVIEW: Erro no anexo {anexo_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def generate(self, anexo_id, data, content_type):
+        """Renderiza, armazena e registra a miniatura do anexo"""
+        from models.anexo import Anexo
+        from models.user import db
+        from services.blob_service import blob_service
+
+        anexo = db.session.get(Anexo, anexo_id)
+        if not anexo or anexo.tem_preview():
+            return False
+
+        ok, result = run_isolated(
+            partial(render_preview, content_type=content_type,
+                    timeout=max(1, int(self.timeout * PDFTOPPM_TIMEOUT_FRACTION))), data,
+            timeout=self.timeout, memory_mb=self.memory_mb)
+        if not ok:
+            logger.info(f"ℹ️ PREVIEW: Anexo {anexo_id} sem miniatura ({result})")
+            return False
+
+        pathname = f"previews/{anexo.hash_sha256}.jpg"
+        blob_data = None
+        if anexo.blob_pathname:
+            blob_data = blob_service.upload_data(result, pathname, PREVIEW_CONTENT_TYPE)
+
+        if blob_data:
+            anexo.preview_blob_url = blob_data['url']
+            anexo.preview_blob_pathname = blob_data['pathname']
+        else:
+            os.makedirs(PREVIEW_FOLDER, exist_ok=True)
+            path = os.path.join(PREVIEW_FOLDER, f"{anexo.hash_sha256}.jpg")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(result)
+            os.replace(tmp_path, path)
+            anexo.preview_caminho = path
+
+        db.session.commit()
+        logger.info(f"🖼️ PREVIEW: Miniatura gerada para o anexo {anexo_id} ({len(result)} bytes)")
+        return True
+
+
+# Instância global
+preview_service = PreviewService()
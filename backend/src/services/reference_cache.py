@@ -0,0 +1,117 @@
+"""
+Cache de dados de referência (tipos de registro, classificações e obras)
+
+Cada grupo tem uma versão guardada no storage compartilhado do
+security_manager (memória, banco ou Redis - RATE_LIMIT_BACKEND), trocada
+pelas rotas de criação/edição/exclusão. As respostas são montadas uma vez
+por versão em cada worker e levam um ETag forte derivado das versões: o
+cliente revalida com If-None-Match e recebe 304 sem que nada seja
+consultado no banco.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request
+
+logger = logging.getLogger(__name__)
+
+GRUPOS = ('tipos_registro', 'classificacoes', 'obras')
+
+
+def user_scope(user):
+    """Escopo das respostas que dependem das obras visíveis ao usuário"""
+    if user.role == 'administrador':
+        return 'admin'
+    return f"obra:{user.obra_id}"
+
+
+class ReferenceCache:
+    """Respostas de catálogo versionadas, com ETag/304"""
+
+    def __init__(self, max_entries=256, version_ttl=30 * 86400):
+        self.max_entries = max_entries
+        self.version_ttl = version_ttl
+        self._entries = OrderedDict()  # (chave, escopo) -> (versão, corpo)
+        self._lock = threading.Lock()
+
+    @property
+    def storage(self):
+        from utils.security import security_manager
+        return security_manager.storage
+
+    def version(self, grupo):
+        """Versão atual do grupo (criada na primeira leitura)"""
+        value = self.storage.get(f"refdata:{grupo}")
+        if value is None:
+            value = time.time()
+            self.storage.set(f"refdata:{grupo}", value, self.version_ttl)
+        return f"{float(value):.6f}"
+
+    def bump(self, *grupos):
+        """Invalida os grupos (chamar depois do commit)"""
+        now = time.time()
+        for grupo in grupos:
+            self.storage.set(f"refdata:{grupo}", now, self.version_ttl)
+        logger.info(f"🔄 REFDATA: Nova versão de {', '.join(grupos)}")
+
+    def get(self, key, grupos, builder, scope=''):
+        """Valor montado por builder(), reaproveitado enquanto a versão não mudar"""
+        version = '|'.join(self.version(grupo) for grupo in grupos)
+        return self._get_or_build(key, scope, version, builder), version
+
+    def _get_or_build(self, key, scope, version, builder):
+        entry_key = (key, scope)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry and entry[0] == version:
+                self._entries.move_to_end(entry_key)
+                return entry[1]
+
+        value = builder()
+        with self._lock:
+            self._entries[entry_key] = (version, value)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def etag_for(self, key, scope, version):
+        return hashlib.sha256(f"{key}|{scope}|{version}".encode()).hexdigest()[:32]
+
+    def response(self, key, grupos, builder, scope='', mimetype='application/json',
+                 headers=None):
+        """Resposta cacheada com ETag forte; 304 se o cliente já tem a versão
+
+        builder() retorna o payload (serializado como JSON) ou bytes quando
+        mimetype não é JSON.
+        """
+        version = '|'.join(self.version(grupo) for grupo in grupos)
+        etag = self.etag_for(key, scope, version)
+
+        if etag in request.if_none_match:
+            response = current_app.response_class(status=304)
+        else:
+            def build_body():
+                payload = builder()
+                if mimetype == 'application/json':
+                    return current_app.json.dumps(payload).encode()
+                return payload
+
+            body = self._get_or_build(key, scope, version, build_body)
+            response = current_app.response_class(body, mimetype=mimetype)
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        for name, value in (headers or {}).items():
+            response.headers[name] = value
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Instância global
+reference_cache = ReferenceCache()
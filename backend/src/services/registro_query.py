@@ -0,0 +1,192 @@
+"""
+Filtros de registros - Sistema GEDO CIMCOP
+
+Especificação única dos filtros usados pela pesquisa avançada, exportação
+(Excel e ZIP), listagem de registros e dashboard. Os parâmetros são
+validados uma vez (RegistroQuerySpec.from_args) e viram cláusulas
+SQLAlchemy aplicáveis a qualquer consulta sobre a tabela registros.
+
+Convenções de datas, iguais em todas as rotas (limites inclusivos):
+- data_inicio / data_fim: data de criação (created_at)
+- data_registro_inicio / data_registro_fim: data do registro
+
+cache_key() identifica o resultado, já com o escopo de obra do usuário
+aplicado, e serve de chave para os caches de ids e de facetas. INDEX_HINTS
+indica o índice que atende cada filtro e ordenação. Os índices são criados
+por migrate_registro_indices() em main.py.
+"""
+import hashlib
+import json
+from datetime import datetime, time
+from sqlalchemy import or_
+from models.registro import Registro
+
+# Ordenações aceitas; id desempata para paginação estável
+ORDENACOES = {
+    'data_desc': (Registro.created_at.desc(), Registro.id.desc()),
+    'data_asc': (Registro.created_at.asc(), Registro.id.asc()),
+    'titulo_asc': (Registro.titulo.asc(), Registro.id.asc()),
+    'titulo_desc': (Registro.titulo.desc(), Registro.id.desc()),
+    'data_registro_asc': (Registro.data_registro.asc(), Registro.id.asc()),
+    'data_registro_desc': (Registro.data_registro.desc(), Registro.id.desc()),
+}
+ORDENACAO_PADRAO = 'data_desc'
+
+# Índices da tabela registros: nome -> colunas
+INDICES = {
+    'ix_registros_obra_created_at': ('obra_id', 'created_at'),
+    'ix_registros_obra_data_registro': ('obra_id', 'data_registro'),
+    'ix_registros_obra_tipo_registro': ('obra_id', 'tipo_registro'),
+    'ix_registros_obra_tipo_registro_id': ('obra_id', 'tipo_registro_id'),
+    'ix_registros_obra_classificacao_grupo': ('obra_id', 'classificacao_grupo'),
+    'ix_registros_autor_id': ('autor_id',),
+    'ix_registros_created_at': ('created_at',),
+    'ix_registros_data_registro': ('data_registro',),
+}
+
+# Filtro ou ordenação -> índice que o atende
+INDEX_HINTS = {
+    'obra_id': 'ix_registros_obra_created_at',
+    'tipo_registro': 'ix_registros_obra_tipo_registro',
+    'tipo_registro_id': 'ix_registros_obra_tipo_registro_id',
+    'classificacao_grupo': 'ix_registros_obra_classificacao_grupo',
+    'autor_id': 'ix_registros_autor_id',
+    'data_inicio': 'ix_registros_created_at',
+    'data_fim': 'ix_registros_created_at',
+    'data_registro_inicio': 'ix_registros_obra_data_registro',
+    'data_registro_fim': 'ix_registros_obra_data_registro',
+    'data_desc': 'ix_registros_created_at',
+    'data_asc': 'ix_registros_created_at',
+    'data_registro_desc': 'ix_registros_data_registro',
+    'data_registro_asc': 'ix_registros_data_registro',
+}
+
+CAMPOS_TEXTO = ('palavra_chave', 'tipo_registro', 'classificacao_grupo', 'codigo_numero')
+CAMPOS_INTEIROS = ('obra_id', 'tipo_registro_id', 'autor_id')
+CAMPOS_DATA = ('data_inicio', 'data_fim', 'data_registro_inicio', 'data_registro_fim')
+
+
+class FiltroInvalido(ValueError):
+    """Parâmetro de filtro inválido (a mensagem vai para a resposta 400)"""
+
+
+def _inteiro(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _data(nome, value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise FiltroInvalido(f'Formato de {nome} inválido (use YYYY-MM-DD)')
+
+
+class RegistroQuerySpec:
+    """Filtros validados de uma consulta de registros"""
+
+    def __init__(self, obra_id=None, palavra_chave='', tipo_registro='', tipo_registro_id=None,
+                 classificacao_grupo='', codigo_numero='', autor_id=None, data_inicio=None,
+                 data_fim=None, data_registro_inicio=None, data_registro_fim=None,
+                 ordenacao=ORDENACAO_PADRAO):
+        self.obra_id = obra_id
+        self.palavra_chave = palavra_chave
+        self.tipo_registro = tipo_registro
+        self.tipo_registro_id = tipo_registro_id
+        self.classificacao_grupo = classificacao_grupo
+        self.codigo_numero = codigo_numero
+        self.autor_id = autor_id
+        self.data_inicio = data_inicio
+        self.data_fim = data_fim
+        self.data_registro_inicio = data_registro_inicio
+        self.data_registro_fim = data_registro_fim
+        self.ordenacao = ordenacao if ordenacao in ORDENACOES else ORDENACAO_PADRAO
+
+    @classmethod
+    def from_args(cls, args, user, aliases=None):
+        """Valida parâmetros da query string ou do JSON e aplica o escopo do usuário
+
+        aliases renomeia parâmetros de rotas que usam outros nomes.
+        Levanta FiltroInvalido com a mensagem para o cliente.
+        """
+        aliases = aliases or {}
+        valores = {aliases.get(nome, nome): valor for nome, valor in (args or {}).items()}
+        valor = valores.get
+
+        kwargs = {nome: str(valor(nome) or '').strip() for nome in CAMPOS_TEXTO}
+        kwargs.update({nome: _inteiro(valor(nome)) for nome in CAMPOS_INTEIROS})
+        kwargs.update({nome: _data(nome, valor(nome)) for nome in CAMPOS_DATA})
+        kwargs['ordenacao'] = valor('ordenacao') or ORDENACAO_PADRAO
+
+        # Usuário padrão só enxerga a própria obra
+        if user.role == 'usuario_padrao':
+            kwargs['obra_id'] = user.obra_id
+        return cls(**kwargs)
+
+    def clauses(self):
+        """Cláusulas WHERE dos filtros ativos"""
+        clauses = []
+        if self.obra_id:
+            clauses.append(Registro.obra_id == self.obra_id)
+        if self.palavra_chave:
+            clauses.append(or_(
+                Registro.titulo.ilike(f'%{self.palavra_chave}%'),
+                Registro.descricao.ilike(f'%{self.palavra_chave}%')
+            ))
+        if self.tipo_registro:
+            clauses.append(Registro.tipo_registro == self.tipo_registro)
+        if self.tipo_registro_id:
+            clauses.append(Registro.tipo_registro_id == self.tipo_registro_id)
+        if self.classificacao_grupo:
+            clauses.append(Registro.classificacao_grupo == self.classificacao_grupo)
+        if self.codigo_numero:
+            clauses.append(Registro.codigo_numero.ilike(f'%{self.codigo_numero}%'))
+        if self.autor_id:
+            clauses.append(Registro.autor_id == self.autor_id)
+
+        for coluna, inicio, fim in (
+                (Registro.created_at, self.data_inicio, self.data_fim),
+                (Registro.data_registro, self.data_registro_inicio, self.data_registro_fim)):
+            if inicio:
+                clauses.append(coluna >= datetime.combine(inicio, time.min))
+            if fim:
+                clauses.append(coluna <= datetime.combine(fim, time(23, 59, 59)))
+        return clauses
+
+    def order_by(self):
+        return ORDENACOES[self.ordenacao]
+
+    def apply(self, query):
+        """Aplica os filtros a uma consulta qualquer sobre registros (sem ordenação)"""
+        return query.filter(*self.clauses())
+
+    def query(self, base=None):
+        """Consulta de registros filtrada e ordenada"""
+        return self.apply(base if base is not None else Registro.query).order_by(*self.order_by())
+
+    def to_dict(self):
+        dados = {nome: getattr(self, nome) for nome in
+                 ('obra_id',) + CAMPOS_TEXTO + CAMPOS_INTEIROS[1:] + CAMPOS_DATA + ('ordenacao',)}
+        for nome in CAMPOS_DATA:
+            dados[nome] = dados[nome].isoformat() if dados[nome] else None
+        return dados
+
+    def cache_key(self, include_order=True):
+        """Hash estável do resultado (mesmos filtros = mesma chave, em qualquer rota)"""
+        dados = {nome: valor for nome, valor in self.to_dict().items()
+                 if valor not in (None, '')}
+        if not include_order:
+            dados.pop('ordenacao', None)
+        payload = json.dumps(dados, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def index_hints(self):
+        """Índices que atendem os filtros ativos e a ordenação"""
+        ativos = [nome for nome, valor in self.to_dict().items()
+                  if valor not in (None, '') and nome != 'ordenacao']
+        ativos.append(self.ordenacao)
+        return sorted({INDEX_HINTS[nome] for nome in ativos if nome in INDEX_HINTS})
@@ -0,0 +1,131 @@
+"""
+Cache de resultados da pesquisa avançada - Sistema GEDO CIMCOP
+
+Guarda, por alguns segundos, a lista ordenada de ids que um filtro retornou
+(chave: RegistroQuerySpec.cache_key(), que já inclui a obra visível ao
+usuário). Trocar de página apenas fatia a lista e busca os registros da
+página pela chave primária, sem repetir o COUNT e a varredura com os filtros.
+
+Cada obra tem um contador de geração no storage compartilhado do
+security_manager (memória, banco ou Redis), trocado depois do commit de
+qualquer escrita em registros da obra; entradas de uma geração anterior são
+descartadas. Filtros sem obra (administradores) usam o contador geral,
+trocado a cada escrita.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import get_history
+
+logger = logging.getLogger(__name__)
+
+TODAS_AS_OBRAS = '*'
+
+
+class SearchResultCache:
+    """Listas de ids por filtro, invalidadas pela geração da obra"""
+
+    def __init__(self, ttl=30, max_ids=5000, max_entries=256, generation_ttl=86400):
+        self.ttl = ttl
+        self.max_ids = max_ids
+        self.max_entries = max_entries
+        self.generation_ttl = generation_ttl
+        self._entries = OrderedDict()  # chave -> (expira_em, geração, ids)
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self.ttl = app.config.get('SEARCH_CACHE_TTL', self.ttl)
+        self.max_ids = app.config.get('SEARCH_CACHE_MAX_IDS', self.max_ids)
+        self.max_entries = app.config.get('SEARCH_CACHE_MAX_ENTRIES', self.max_entries)
+
+        # Obras alteradas são anotadas no flush e invalidadas após o commit
+        event.listen(db.session, 'after_flush', self._on_flush)
+        event.listen(db.session, 'after_commit', self._on_commit)
+        event.listen(db.session, 'after_rollback', self._on_rollback)
+
+    @property
+    def storage(self):
+        from utils.security import security_manager
+        return security_manager.storage
+
+    # ------------------------------------------------------------------
+    # Gerações por obra
+    # ------------------------------------------------------------------
+
+    def generation(self, obra_id=None):
+        """Geração atual da obra (None = contador geral)"""
+        key = f"registros:geracao:{obra_id if obra_id is not None else TODAS_AS_OBRAS}"
+        value = self.storage.get(key)
+        if value is None:
+            value = time.time()
+            self.storage.set(key, value, self.generation_ttl)
+        return f"{float(value):.6f}"
+
+    def bump(self, obra_ids):
+        now = time.time()
+        for obra_id in set(obra_ids) | {TODAS_AS_OBRAS}:
+            self.storage.set(f"registros:geracao:{obra_id}", now, self.generation_ttl)
+
+    def _on_flush(self, session, flush_context):
+        from models.registro import Registro
+
+        obras = session.info.setdefault('registro_obras_alteradas', set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if not isinstance(obj, Registro):
+                continue
+            if obj.obra_id is not None:
+                obras.add(obj.obra_id)
+            # Registro movido de obra: a obra anterior também muda
+            obras.update(valor for valor in get_history(obj, 'obra_id').deleted
+                         if valor is not None)
+
+    def _on_commit(self, session):
+        obras = session.info.pop('registro_obras_alteradas', None)
+        if not obras:
+            return
+        try:
+            self.bump(obras)
+        except Exception as e:
+            # Sem invalidação o TTL curto limita resultados desatualizados
+            logger.error(f"❌ SEARCH CACHE: Erro ao invalidar obras {sorted(obras)}: {str(e)}")
+
+    def _on_rollback(self, session):
+        session.info.pop('registro_obras_alteradas', None)
+
+    # ------------------------------------------------------------------
+    # Listas de ids
+    # ------------------------------------------------------------------
+
+    def ids(self, key, obra_id, builder):
+        """Ids ordenados do filtro; None se passarem de max_ids
+
+        builder(limite) executa a consulta e retorna no máximo limite ids.
+        Filtros grandes demais também ficam marcados no cache, para que as
+        próximas páginas sigam direto para a paginação no banco.
+        """
+        generation = self.generation(obra_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now and entry[1] == generation:
+                self._entries.move_to_end(key)
+                return entry[2]
+
+        ids = builder(self.max_ids + 1)
+        ids = tuple(ids) if len(ids) <= self.max_ids else None
+        with self._lock:
+            self._entries[key] = (now + self.ttl, generation, ids)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return ids
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Instância global
+search_cache = SearchResultCache()
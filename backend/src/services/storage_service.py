@@ -0,0 +1,186 @@
+"""
+Armazenamento de anexos - Sistema GEDO CIMCOP
+
+Interface única para gravar e remover o conteúdo dos anexos, com dois
+backends:
+- blob: Vercel Blob (BLOB_READ_WRITE_TOKEN)
+- local: pasta local com subpastas pelo prefixo do SHA-256
+  (uploads/anexos/ab/cd/<hash>-<id>.<ext>) e escrita atômica (temp + rename)
+
+Cada gravação local tem nome próprio, como no Blob: a deduplicação é feita
+pela tabela anexos, e a remoção do arquivo de um anexo sem referências
+nunca atinge o arquivo gravado por um upload concorrente do mesmo conteúdo.
+
+STORAGE_BACKEND escolhe o backend: auto (Blob se configurado, senão local,
+com fallback local se o Blob falhar), blob ou local. O backend local também
+serve de substituto do Blob em desenvolvimento e testes.
+
+Os dados gravados retornam como os campos de arquivo do anexo
+(blob_url/blob_pathname ou caminho_anexo).
+"""
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from services.attachment_cache import attachment_cache
+from services.blob_service import blob_service
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_ROOT = os.path.join(os.path.dirname(
+    os.path.dirname(__file__)), 'uploads')
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def file_extension(filename):
+    if filename and '.' in filename:
+        return filename.rsplit('.', 1)[1].lower()
+    return None
+
+
+class BlobStorage:
+    """Conteúdo no Vercel Blob"""
+    name = 'blob'
+
+    def available(self):
+        return bool(blob_service.blob_token)
+
+    def save(self, source, file_hash, filename, content_type=None, size=None):
+        extension = file_extension(filename)
+        pathname = f"uploads/{uuid.uuid4()}.{extension}" if extension else f"uploads/{uuid.uuid4()}"
+        if size is None:
+            size = len(source)
+        # Timeout proporcional ao tamanho (mínimo de 60s)
+        timeout = max(60, size // (256 * 1024))
+        blob_data = blob_service.upload_data(
+            source, pathname, content_type or 'application/octet-stream',
+            size=size, timeout=timeout)
+        if not blob_data:
+            return None
+        return {'blob_url': blob_data['url'], 'blob_pathname': blob_data['pathname']}
+
+    def delete(self, pathname):
+        blob_service.delete_file(pathname)
+        attachment_cache.invalidate(pathname)
+
+
+class LocalStorage:
+    """Conteúdo em disco, endereçado pelo hash"""
+    name = 'local'
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(UPLOAD_ROOT, 'anexos')
+
+    def available(self):
+        return True
+
+    def path_for(self, file_hash, filename=None):
+        extension = file_extension(filename)
+        name = f"{file_hash}-{uuid.uuid4().hex[:12]}"
+        if extension:
+            name = f"{name}.{extension}"
+        return os.path.join(self.root, file_hash[:2], file_hash[2:4], name)
+
+    def save(self, source, file_hash, filename, content_type=None, size=None):
+        path = self.path_for(file_hash, filename)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if isinstance(source, (bytes, bytearray, memoryview)):
+                    f.write(source)
+                else:
+                    shutil.copyfileobj(source, f, COPY_CHUNK_SIZE)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return {'caminho_anexo': path}
+
+    def delete(self, path):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+class StorageService:
+    """Seleciona o backend e aplica o fallback local"""
+
+    def __init__(self):
+        self.mode = 'auto'
+        self.blob = BlobStorage()
+        self.local = LocalStorage()
+
+    def init_app(self, app):
+        self.mode = (app.config.get('STORAGE_BACKEND') or 'auto').lower()
+        if app.config.get('LOCAL_STORAGE_DIR'):
+            self.local = LocalStorage(app.config['LOCAL_STORAGE_DIR'])
+
+    def backends(self):
+        if self.mode == 'local':
+            return [self.local]
+        if self.mode == 'blob':
+            return [self.blob]
+        return [self.blob, self.local]
+
+    def save(self, source, file_hash, filename, content_type=None, size=None):
+        """Grava o conteúdo (bytes ou arquivo aberto) e retorna sua localização"""
+        for backend in self.backends():
+            if not backend.available():
+                continue
+            if hasattr(source, 'seek'):
+                source.seek(0)
+            try:
+                stored = backend.save(source, file_hash, filename,
+                                      content_type=content_type, size=size)
+            except Exception as e:
+                logger.error(f"❌ STORAGE: Erro no backend {backend.name}: {str(e)}")
+                stored = None
+            if stored:
+                logger.info(f"✅ STORAGE: Conteúdo {file_hash[:16]}... salvo ({backend.name})")
+                return stored
+            logger.warning(f"⚠️ STORAGE: Falha no backend {backend.name}")
+        return None
+
+    def delete(self, stored):
+        """Remove o conteúdo e a miniatura (erros apenas logados)"""
+        if not stored:
+            return
+        for blob_key, local_key in (('blob_pathname', 'caminho_anexo'),
+                                    ('preview_blob_pathname', 'preview_caminho')):
+            try:
+                if stored.get(blob_key):
+                    self.blob.delete(stored[blob_key])
+                elif stored.get(local_key):
+                    self.local.delete(stored[local_key])
+            except Exception as e:
+                logger.error(f"❌ STORAGE: Erro ao remover arquivo: {str(e)}")
+
+    def same_location(self, stored, anexo):
+        """Se os dados gravados apontam para o mesmo arquivo do anexo"""
+        return bool(
+            (stored.get('blob_pathname') and stored.get('blob_pathname') == anexo.blob_pathname) or
+            (stored.get('caminho_anexo') and stored.get('caminho_anexo') == anexo.caminho_anexo))
+
+    def local_relative_path(self, path):
+        """(raiz, caminho relativo) do arquivo local para o X-Accel-Redirect
+
+        raiz é 'uploads' para a pasta de uploads e 'storage' para o
+        LOCAL_STORAGE_DIR fora dela; None se o arquivo não estiver em nenhuma.
+        """
+        absolute = os.path.abspath(path)
+        for raiz, base in (('uploads', UPLOAD_ROOT), ('storage', self.local.root)):
+            base = os.path.abspath(base)
+            if absolute.startswith(base + os.sep):
+                return raiz, os.path.relpath(absolute, base).replace(os.sep, '/')
+        return None
+
+
+# Instância global
+storage_service = StorageService()
@@ -0,0 +1,130 @@
+"""
+Download em lote de anexos em ZIP - Sistema GEDO CIMCOP
+
+O ZIP é montado sob demanda e transmitido enquanto é gerado: nada é
+acumulado em memória ou em disco além de um pequeno buffer de saída. Os
+anexos são buscados em paralelo (concorrência limitada) e gravados no
+arquivo na ordem solicitada.
+"""
+import logging
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+import requests
+from services.attachment_cache import attachment_cache
+from services.download_service import resolve_download_name
+
+logger = logging.getLogger(__name__)
+
+ZIP_CHUNK_SIZE = 64 * 1024
+
+
+class _StreamBuffer:
+    """Destino do ZipFile sem seek: os bytes escritos são drenados pelo gerador"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def build_zip_entries(registros):
+    """Extrai (na requisição) os dados necessários para montar o ZIP"""
+    entries = []
+    for registro in registros:
+        if not (registro.blob_url or registro.caminho_anexo):
+            continue
+        date_time = (registro.created_at or datetime.utcnow()).timetuple()[:6]
+        # Anexo principal seguido dos anexos adicionais do registro
+        arquivos = [(registro, f"{registro.id}_")]
+        arquivos += [(extra, f"{registro.id}_{extra.ordem}_")
+                     for extra in getattr(registro, 'anexos_adicionais', [])]
+        for arquivo, prefixo in arquivos:
+            if not (arquivo.blob_url or arquivo.caminho_anexo):
+                continue
+            filename = os.path.basename(resolve_download_name(arquivo)) or f"anexo_{arquivo.id}"
+            entries.append({
+                'registro_id': registro.id,
+                'arcname': f"{prefixo}{filename}",
+                'blob_url': arquivo.blob_url,
+                'blob_pathname': arquivo.blob_pathname,
+                'caminho_anexo': arquivo.caminho_anexo,
+                'date_time': date_time
+            })
+    return entries
+
+
+def _open_entry(entry, timeout):
+    """Abre o conteúdo do anexo (executado no pool de threads)"""
+    if entry['blob_url']:
+        path = attachment_cache.get_or_fetch(entry['blob_url'], entry['blob_pathname'])
+        if path:
+            return open(path, 'rb')
+        response = requests.get(entry['blob_url'], timeout=timeout)
+        response.raise_for_status()
+        return BytesIO(response.content)
+    return open(entry['caminho_anexo'], 'rb')
+
+
+def stream_zip(entries, max_workers=4, timeout=60):
+    """Gera o ZIP em blocos, com no máximo max_workers buscas simultâneas"""
+    output = _StreamBuffer()
+    erros = []
+    pending = deque()
+    entries_iter = iter(entries)
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gedo-zip')
+
+    def submit_next():
+        entry = next(entries_iter, None)
+        if entry is not None:
+            pending.append((entry, pool.submit(_open_entry, entry, timeout)))
+
+    try:
+        for _ in range(max_workers):
+            submit_next()
+
+        with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            while pending:
+                entry, future = pending.popleft()
+                submit_next()
+
+                try:
+                    source = future.result()
+                except Exception as e:
+                    logger.error(f"❌ ZIP: Falha no anexo do registro {entry['registro_id']}: {e}")
+                    erros.append(f"{entry['arcname']}: não foi possível obter o arquivo")
+                    continue
+
+                zinfo = zipfile.ZipInfo(entry['arcname'], date_time=entry['date_time'])
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                with source, zf.open(zinfo, 'w', force_zip64=True) as dest:
+                    for chunk in iter(lambda: source.read(ZIP_CHUNK_SIZE), b''):
+                        dest.write(chunk)
+                        data = output.drain()
+                        if data:
+                            yield data
+                yield output.drain()
+
+            if erros:
+                zf.writestr('ERROS.txt', '\n'.join(erros))
+
+        yield output.drain()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        # Fechar arquivos já abertos caso o cliente tenha desistido
+        for _entry, future in pending:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                future.result().close()
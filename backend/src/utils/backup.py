@@ -1,13 +1,175 @@
+"""
+Backup do sistema - Sistema GEDO CIMCOP
+
+Cada execução grava uma pasta backups/<id>/ com:
+- database/<tabela>.csv.gz: dump lógico de cada tabela em CSV comprimido,
+  gerado em streaming (COPY ... TO STDOUT no Postgres, leitura em lotes nos
+  demais bancos), todas as tabelas no mesmo snapshot;
+- manifest.json: tabelas (linhas, bytes, SHA-256 do arquivo) e o índice de
+  anexos. É gravado por último: pastas sem manifesto são execuções
+  interrompidas. Se algum anexo não pôde ser copiado, o manifesto é gravado
+  com status "parcial" e a lista das falhas; backups parciais não servem de
+  base para o incremental nem contam como o backup mais recente na retenção.
+
+Os anexos ficam em um repositório compartilhado entre execuções,
+backups/objects/ab/<sha256>, endereçado pelo conteúdo. A cada execução só
+são copiados os anexos que não estavam no manifesto anterior: tempo e
+espaço crescem com o que mudou, não com o total armazenado.
+
+A restauração (restore_backup) confere o SHA-256 de cada arquivo contra o
+manifesto antes de alterar qualquer coisa. No Postgres as tabelas são
+carregadas com COPY FROM em paralelo (por nível de dependência das FKs),
+com os índices secundários removidos antes e recriados depois da carga. Os
+anexos ausentes no storage são regravados com concorrência limitada. O
+modo dry_run só verifica a integridade e estima o tempo.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
 import os
 import shutil
-import sqlite3
-import zipfile
-from datetime import datetime, timedelta
-import logging
-import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import requests
 
 logger = logging.getLogger(__name__)
 
+MANIFEST_VERSION = 2
+STATUS_COMPLETO = 'completo'
+STATUS_PARCIAL = 'parcial'
+COPY_CHUNK_SIZE = 1024 * 1024
+SQL_BATCH_SIZE = 1000
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class HashingWriter:
+    """Arquivo de saída que calcula SHA-256 e tamanho do que foi gravado"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+
+def csv_field(value):
+    """Campo no CSV do COPY: NULL sem aspas, texto sempre entre aspas"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\x' + bytes(value).hex()
+    if isinstance(value, datetime):
+        text = value.isoformat(sep=' ')
+    elif isinstance(value, date):
+        text = value.isoformat()
+    elif isinstance(value, (dict, list)):
+        text = json.dumps(value, ensure_ascii=False)
+    else:
+        text = str(value)
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _csv_value(chars, quoted):
+    text = ''.join(chars)
+    return None if not quoted and text == '' else text
+
+
+def iter_csv_records(stream):
+    """Registros do CSV do COPY (campo vazio sem aspas = NULL)"""
+    record, field, quoted, in_quotes = [], [], False, False
+    for line in stream:
+        i, n = 0, len(line)
+        while i < n:
+            ch = line[i]
+            if in_quotes:
+                if ch == '"':
+                    if i + 1 < n and line[i + 1] == '"':
+                        field.append('"')
+                        i += 1
+                    else:
+                        in_quotes = False
+                else:
+                    field.append(ch)
+            elif ch == '"':
+                in_quotes = quoted = True
+            elif ch == ',':
+                record.append(_csv_value(field, quoted))
+                field, quoted = [], False
+            elif ch in '\r\n':
+                if ch == '\r' and i + 1 < n and line[i + 1] == '\n':
+                    i += 1
+                record.append(_csv_value(field, quoted))
+                yield record
+                record, field, quoted = [], [], False
+            else:
+                field.append(ch)
+            i += 1
+    if field or record or quoted:
+        record.append(_csv_value(field, quoted))
+        yield record
+
+
+def _parse_datetime(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        # Frações de segundo com menos de 6 dígitos (saída do Postgres)
+        base, _, fraction = value.partition('.')
+        return datetime.fromisoformat(f"{base}.{fraction[:6].ljust(6, '0')}")
+
+
+def parse_csv_value(column, value):
+    """Converte o texto do CSV para o tipo Python da coluna"""
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is bool:
+        return value.lower() in ('t', 'true', '1')
+    if python_type in (int, float, Decimal):
+        return python_type(value)
+    if python_type is datetime:
+        return _parse_datetime(value)
+    if python_type is date:
+        return date.fromisoformat(value[:10])
+    if python_type is bytes:
+        return bytes.fromhex(value[2:]) if value.startswith('\\x') else value.encode('utf-8')
+    if python_type in (dict, list):
+        return json.loads(value)
+    return value
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def backup_completo(manifest):
+    """Se o backup tem todos os anexos (manifestos antigos não têm status)"""
+    return bool(manifest) and manifest.get('status', STATUS_COMPLETO) == STATUS_COMPLETO
+
 
 class BackupManager:
     """Gerenciador de backup do sistema"""
@@ -16,6 +178,11 @@ class BackupManager:
         self.app = app
         self.backup_dir = 'backups'
         self.retention_days = 30
+        self.workers = 4
+        self.compression_level = 6
+        # Taxas de referência (MB/s por worker) para a estimativa do restore
+        self.restore_db_rate = 20
+        self.restore_files_rate = 10
 
         if app:
             self.init_app(app)
@@ -25,118 +192,700 @@ class BackupManager:
         self.app = app
         self.backup_dir = app.config.get('BACKUP_DIR', 'backups')
         self.retention_days = app.config.get('BACKUP_RETENTION_DAYS', 30)
+        self.workers = app.config.get('BACKUP_WORKERS', self.workers)
+        self.compression_level = app.config.get('BACKUP_COMPRESSION_LEVEL', self.compression_level)
+        self.restore_db_rate = app.config.get('RESTORE_DB_MB_PER_SEC', self.restore_db_rate)
+        self.restore_files_rate = app.config.get('RESTORE_FILES_MB_PER_SEC', self.restore_files_rate)
 
         # Criar diretório de backup se não existir
         os.makedirs(self.backup_dir, exist_ok=True)
 
-    def create_database_backup(self):
-        """Cria backup do banco de dados"""
+    @property
+    def objects_dir(self):
+        return os.path.join(self.backup_dir, 'objects')
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    # ------------------------------------------------------------------
+    # Execução completa
+    # ------------------------------------------------------------------
+
+    def create_full_backup(self):
+        """Cria backup do banco e dos anexos novos desde o último backup completo
+
+        Retorna o manifesto gravado (ou None em caso de erro). Se algum anexo
+        falhou, o manifesto tem status "parcial" (ver backup_completo).
+        """
+        backup_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+        backup_path = os.path.join(self.backup_dir, backup_id)
+        inicio = datetime.now()
+
         try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_filename = f'database_backup_{timestamp}.db'
-            backup_path = os.path.join(self.backup_dir, backup_filename)
-
-            # Para SQLite, simplesmente copiar o arquivo
-            db_path = 'src/database/app.db'
-            if os.path.exists(db_path):
-                shutil.copy2(db_path, backup_path)
-                logger.info(f"Backup do banco criado: {backup_path}")
-                return backup_path
-            else:
-                logger.error(f"Arquivo do banco não encontrado: {db_path}")
-                return None
+            os.makedirs(backup_path)
+            anterior = self.latest_manifest()
+
+            manifest = {
+                'version': MANIFEST_VERSION,
+                'id': backup_id,
+                'type': 'full_backup',
+                'backup_date': inicio.isoformat(),
+                'previous': anterior['id'] if anterior else None,
+            }
+            manifest['database'] = self.create_database_backup(backup_path)
+            manifest['files'], manifest['files_stats'] = self.create_files_backup(anterior)
+            falhas = manifest['files_stats'].pop('falhas')
+            manifest['status'] = STATUS_PARCIAL if falhas else STATUS_COMPLETO
+            if falhas:
+                manifest['falhas'] = falhas
+            manifest['duration_seconds'] = round((datetime.now() - inicio).total_seconds(), 1)
+
+            self._write_manifest(backup_path, manifest)
+            stats = manifest['files_stats']
+            if falhas:
+                logger.error(f"❌ BACKUP {backup_id}: PARCIAL - {len(falhas)} anexo(s) não copiado(s)")
+            logger.info(
+                f"✅ BACKUP {backup_id}: {len(manifest['database']['tables'])} tabelas, "
+                f"{stats['novos']} anexos novos ({stats['bytes_novos']} bytes), "
+                f"{stats['reaproveitados']} reaproveitados em {manifest['duration_seconds']}s")
+            return manifest
 
         except Exception as e:
-            logger.error(f"Erro ao criar backup do banco: {e}")
+            logger.error(f"❌ BACKUP {backup_id}: Erro ao criar backup: {e}")
+            shutil.rmtree(backup_path, ignore_errors=True)
             return None
 
-    def create_files_backup(self):
-        """Cria backup dos arquivos de upload"""
+    def _write_manifest(self, backup_path, manifest):
+        tmp_path = os.path.join(backup_path, 'manifest.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(backup_path, 'manifest.json'))
+
+    def read_manifest(self, backup_id):
+        path = os.path.join(self.backup_dir, backup_id, 'manifest.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def backup_ids(self):
+        """Ids dos backups completos, do mais antigo ao mais recente"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.backup_dir)
+            if os.path.exists(os.path.join(self.backup_dir, name, 'manifest.json')))
+
+    def latest_manifest(self):
+        """Manifesto do backup completo mais recente (base do incremental)"""
+        for backup_id in reversed(self.backup_ids()):
+            manifest = self.read_manifest(backup_id)
+            if backup_completo(manifest):
+                return manifest
+        return None
+
+    # ------------------------------------------------------------------
+    # Banco de dados
+    # ------------------------------------------------------------------
+
+    def create_database_backup(self, backup_path):
+        """Dump lógico de todas as tabelas (CSV gzip, um arquivo por tabela)"""
+        from models.user import db
+
+        database_dir = os.path.join(backup_path, 'database')
+        os.makedirs(database_dir, exist_ok=True)
+        engine = db.engine
+        tables = db.metadata.sorted_tables
+
+        result = {'dialect': engine.dialect.name, 'format': 'csv+gzip', 'tables': {}}
+        postgres = engine.dialect.name == 'postgresql'
+        options = {'isolation_level': 'REPEATABLE READ'} if postgres else {}
+
+        # Uma única transação: todas as tabelas no mesmo snapshot
+        with engine.connect().execution_options(**options) as connection, connection.begin():
+            cursor = connection.connection.cursor() if postgres else None
+            for table in tables:
+                if postgres:
+                    dump = lambda out, t=table: self._dump_postgres(cursor, t, out)
+                else:
+                    dump = lambda out, t=table: self._dump_rows(connection, t, out)
+                result['tables'][table.name] = self._dump_table(database_dir, table, dump)
+
+        logger.info(f"💾 BACKUP: {len(tables)} tabelas exportadas ({engine.dialect.name})")
+        return result
+
+    def _dump_table(self, database_dir, table, dump):
+        filename = f"{table.name}.csv.gz"
+        path = os.path.join(database_dir, filename)
+        with open(path, 'wb') as raw:
+            writer = HashingWriter(raw)
+            with gzip.GzipFile(fileobj=writer, mode='wb',
+                               compresslevel=self.compression_level, mtime=0) as out:
+                rows = dump(out)
+        return {
+            'file': f"database/{filename}",
+            'rows': rows,
+            'bytes': writer.size,
+            'sha256': writer.sha256.hexdigest(),
+            'columns': [column.name for column in table.columns],
+        }
+
+    def _dump_postgres(self, cursor, table, out):
+        """COPY TO STDOUT direto para o arquivo comprimido"""
+        from models.user import db
+
+        preparer = db.engine.dialect.identifier_preparer
+        columns = ', '.join(preparer.quote(column.name) for column in table.columns)
+        # Consulta em vez da tabela: COPY TO não aceita tabelas particionadas (audit_logs)
+        cursor.copy_expert(
+            f"COPY (SELECT {columns} FROM {preparer.format_table(table)}) TO STDOUT "
+            f"WITH (FORMAT csv, HEADER true)", out)
+        return cursor.rowcount if cursor.rowcount >= 0 else None
+
+    def _dump_rows(self, connection, table, out):
+        """Leitura em lotes no mesmo formato CSV do COPY"""
+        out.write((','.join(column.name for column in table.columns) + '\n').encode('utf-8'))
+        rows = 0
+        result = connection.execution_options(stream_results=True).execute(table.select())
+        for batch in result.partitions(SQL_BATCH_SIZE):
+            out.write(''.join(
+                ','.join(csv_field(value) for value in row) + '\n' for row in batch
+            ).encode('utf-8'))
+            rows += len(batch)
+        return rows
+
+    # ------------------------------------------------------------------
+    # Anexos (incremental por hash)
+    # ------------------------------------------------------------------
+
+    def attachment_sources(self):
+        """Conteúdos a preservar: anexos deduplicados e registros antigos sem anexo_id"""
+        from sqlalchemy import or_
+        from models.anexo import Anexo
+        from models.registro import Registro
+        from models.user import db
+
+        sources = {}
+        for anexo in db.session.query(Anexo.hash_sha256, Anexo.blob_url, Anexo.caminho_anexo,
+                                      Anexo.tamanho_arquivo).all():
+            if anexo.blob_url or anexo.caminho_anexo:
+                sources[anexo.hash_sha256] = {
+                    'sha256': anexo.hash_sha256,
+                    'blob_url': anexo.blob_url,
+                    'caminho': anexo.caminho_anexo,
+                    'size': anexo.tamanho_arquivo,
+                }
+
+        legados = db.session.query(Registro.id, Registro.blob_url, Registro.caminho_anexo)\
+            .filter(Registro.anexo_id.is_(None),
+                    or_(Registro.blob_url.isnot(None), Registro.caminho_anexo.isnot(None))).all()
+        for registro in legados:
+            # Hash desconhecido até a cópia: chave pela localização
+            location = registro.blob_url or registro.caminho_anexo
+            sources[f"loc:{hashlib.sha256(location.encode()).hexdigest()}"] = {
+                'sha256': None,
+                'blob_url': registro.blob_url,
+                'caminho': registro.caminho_anexo,
+                'size': None,
+            }
+        return sources
+
+    def create_files_backup(self, anterior=None):
+        """Copia para o repositório de objetos apenas anexos ausentes no manifesto anterior
+
+        Retorna (índice de anexos, estatísticas). estatísticas['falhas'] lista
+        as chaves dos anexos que não puderam ser copiados.
+        """
+        anteriores = (anterior or {}).get('files', {})
+        files = {}
+        pendentes = []
+        for key, source in self.attachment_sources().items():
+            entry = anteriores.get(key)
+            if entry and entry.get('sha256') and os.path.exists(self.object_path(entry['sha256'])):
+                files[key] = entry
+            else:
+                pendentes.append((key, source))
+
+        stats = {'total': len(files) + len(pendentes), 'reaproveitados': len(files),
+                 'novos': 0, 'bytes_novos': 0, 'erros': 0, 'falhas': []}
+        if pendentes:
+            with ThreadPoolExecutor(max_workers=self.workers,
+                                    thread_name_prefix='gedo-backup') as executor:
+                for key, entry in zip(
+                        (key for key, _ in pendentes),
+                        executor.map(lambda item: self._copy_attachment(item[1]), pendentes)):
+                    if entry is None:
+                        stats['erros'] += 1
+                        stats['falhas'].append(key)
+                        continue
+                    files[key] = entry
+                    if entry.pop('novo'):
+                        stats['novos'] += 1
+                        stats['bytes_novos'] += entry['size']
+                    else:
+                        stats['reaproveitados'] += 1
+
+        logger.info(f"📎 BACKUP: {stats['novos']} anexos copiados, "
+                    f"{stats['reaproveitados']} reaproveitados, {stats['erros']} erros")
+        return files, stats
+
+    def _open_source(self, source):
+        if source['caminho']:
+            path = source['caminho']
+            if not os.path.isabs(path) and not os.path.exists(path):
+                path = os.path.join(SRC_DIR, path)
+            if os.path.exists(path):
+                return open(path, 'rb'), None
+            if not source['blob_url']:
+                raise FileNotFoundError(path)
+        response = requests.get(source['blob_url'], headers={'User-Agent': 'GEDO-CIMCOP/1.0'},
+                                stream=True, timeout=120)
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return response.raw, response
+
+    def _copy_attachment(self, source):
+        """Grava o conteúdo em objects/ (escrita atômica) verificando o hash"""
+        location = source['blob_url'] or source['caminho']
+        tmp_path = None
         try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_filename = f'files_backup_{timestamp}.zip'
-            backup_path = os.path.join(self.backup_dir, backup_filename)
-
-            uploads_dir = 'src/uploads'
-            if os.path.exists(uploads_dir):
-                with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    for root, dirs, files in os.walk(uploads_dir):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            arcname = os.path.relpath(file_path, uploads_dir)
-                            zipf.write(file_path, arcname)
-
-                logger.info(f"Backup dos arquivos criado: {backup_path}")
-                return backup_path
+            os.makedirs(self.objects_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, suffix='.part')
+            stream, response = self._open_source(source)
+            try:
+                with os.fdopen(fd, 'wb') as raw:
+                    writer = HashingWriter(raw)
+                    shutil.copyfileobj(stream, writer, COPY_CHUNK_SIZE)
+            finally:
+                stream.close()
+                if response is not None:
+                    response.close()
+
+            sha256 = writer.sha256.hexdigest()
+            if source['sha256'] and sha256 != source['sha256']:
+                raise ValueError(f"hash divergente ({sha256[:16]}...)")
+
+            path = self.object_path(sha256)
+            novo = not os.path.exists(path)
+            if novo:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
             else:
-                logger.warning(
-                    f"Diretório de uploads não encontrado: {uploads_dir}")
-                return None
+                os.remove(tmp_path)
+            tmp_path = None
+            return {'sha256': sha256, 'size': writer.size, 'source': location, 'novo': novo}
 
         except Exception as e:
-            logger.error(f"Erro ao criar backup dos arquivos: {e}")
+            logger.error(f"❌ BACKUP: Erro ao copiar anexo {location}: {e}")
+            return None
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # ------------------------------------------------------------------
+    # Verificação e restauração
+    # ------------------------------------------------------------------
+
+    def verify_backup(self, backup_id, database=True, files=True):
+        """Confere o SHA-256 de cada arquivo do backup contra o manifesto"""
+        manifest = self.read_manifest(backup_id)
+        if not manifest:
+            raise FileNotFoundError(f"Backup {backup_id} não encontrado")
+        backup_path = os.path.join(self.backup_dir, backup_id)
+
+        report = {
+            'backup': backup_id,
+            'status': manifest.get('status', STATUS_COMPLETO),
+            'tabelas': {'verificadas': 0, 'erros': []},
+            'anexos': {'verificados': 0, 'erros': []},
+            'bytes': {'banco': 0, 'anexos': 0},
+        }
+
+        def check(path, sha256):
+            if not os.path.exists(path):
+                return 'arquivo ausente'
+            if file_sha256(path) != sha256:
+                return 'SHA-256 divergente'
             return None
 
-    def create_full_backup(self):
-        """Cria backup completo (banco + arquivos)"""
+        if database:
+            for name, entry in manifest['database']['tables'].items():
+                erro = check(os.path.join(backup_path, entry['file']), entry['sha256'])
+                if erro:
+                    report['tabelas']['erros'].append({'tabela': name, 'erro': erro})
+                report['tabelas']['verificadas'] += 1
+                report['bytes']['banco'] += entry['bytes']
+
+        if files:
+            objetos = {entry['sha256']: entry['size']
+                       for entry in manifest.get('files', {}).values()}
+            with ThreadPoolExecutor(max_workers=self.workers,
+                                    thread_name_prefix='gedo-restore') as executor:
+                resultados = executor.map(
+                    lambda sha256: check(self.object_path(sha256), sha256), objetos)
+                for sha256, erro in zip(objetos, resultados):
+                    if erro:
+                        report['anexos']['erros'].append({'sha256': sha256, 'erro': erro})
+                    report['anexos']['verificados'] += 1
+                    report['bytes']['anexos'] += objetos[sha256]
+
+        report['ok'] = not report['tabelas']['erros'] and not report['anexos']['erros']
+        report['estimativa_segundos'] = self.estimate_restore_seconds(manifest, report['bytes'])
+        return report
+
+    def estimate_restore_seconds(self, manifest, bytes_info):
+        """Estimativa pelas taxas de referência (RESTORE_DB_MB_PER_SEC / RESTORE_FILES_MB_PER_SEC)"""
+        mb = 1024 * 1024
+        paralelo_banco = max(1, min(self.workers, len(manifest['database']['tables'])))
+        banco = bytes_info['banco'] / mb / (self.restore_db_rate * paralelo_banco)
+        anexos = bytes_info['anexos'] / mb / (self.restore_files_rate * self.workers)
+        # Reconstrução dos índices adiados: proporcional ao volume do banco
+        return round(banco * 1.5 + anexos, 1)
+
+    def restore_backup(self, backup_id, dry_run=False, database=True, files=True):
+        """Restaura banco e/ou anexos de um backup após verificar a integridade
+
+        O conteúdo atual das tabelas é substituído: executar com a aplicação
+        parada. Em dry_run apenas verifica os arquivos e estima o tempo.
+        Retorna o relatório da verificação/restauração.
+        """
+        inicio = datetime.now()
+        report = self.verify_backup(backup_id, database=database, files=files)
+        if not report['ok']:
+            logger.error(f"❌ RESTORE {backup_id}: Backup com arquivos inválidos - nada foi alterado")
+            return report
+        if dry_run:
+            logger.info(f"🔎 RESTORE {backup_id}: Integridade OK, estimativa de "
+                        f"{report['estimativa_segundos']}s")
+            return report
+
+        manifest = self.read_manifest(backup_id)
+        if not backup_completo(manifest):
+            logger.warning(f"⚠️ RESTORE {backup_id}: Backup parcial - "
+                           f"{len(manifest.get('falhas', []))} anexo(s) ausente(s) no backup")
+        backup_path = os.path.join(self.backup_dir, backup_id)
+        if database:
+            resultado = self.restore_database(backup_path, manifest)
+            report['tabelas'].update(resultado)
+            report['tabelas']['restauradas'] = len(resultado['carregadas'])
+            if resultado['falhas']:
+                report['ok'] = False
+                logger.error(f"❌ RESTORE {backup_id}: Banco restaurado parcialmente - "
+                             f"anexos não restaurados")
+                return report
+        if files:
+            report['anexos'].update(self.restore_files(manifest))
+
+        report['duracao_segundos'] = round((datetime.now() - inicio).total_seconds(), 1)
+        logger.info(f"✅ RESTORE {backup_id}: Concluído em {report['duracao_segundos']}s")
+        return report
+
+    def _restore_tables(self, manifest):
+        from models.user import db
+
+        tables = [table for table in db.metadata.sorted_tables
+                  if table.name in manifest['database']['tables']]
+        for table in tables:
+            columns = set(manifest['database']['tables'][table.name]['columns'])
+            faltando = columns - {column.name for column in table.columns}
+            if faltando:
+                raise ValueError(f"Tabela {table.name} sem as colunas {sorted(faltando)}")
+        return tables
+
+    def restore_database(self, backup_path, manifest):
+        """Substitui o conteúdo das tabelas pelo dump do backup
+
+        Retorna {'carregadas': [...], 'falhas': {tabela: erro}, 'nao_carregadas':
+        [...]}. Tabelas em nao_carregadas ficaram vazias (truncadas sem carga).
+        """
+        from models.user import db
+
+        tables = self._restore_tables(manifest)
+        if db.engine.dialect.name == 'postgresql':
+            resultado = self._restore_postgres(backup_path, manifest, tables)
+        else:
+            resultado = self._restore_rows(backup_path, manifest, tables)
+        if resultado['falhas']:
+            logger.error(f"❌ RESTORE: {len(resultado['carregadas'])} de {len(tables)} tabelas "
+                         f"carregadas; falhas: {sorted(resultado['falhas'])}; "
+                         f"vazias: {resultado['nao_carregadas']}")
+        else:
+            logger.info(f"💾 RESTORE: {len(tables)} tabelas restauradas")
+        return resultado
+
+    @staticmethod
+    def _fk_levels(tables):
+        """Tabelas agrupadas por dependência: cada nível só referencia os anteriores"""
+        nivel = {}
+        for table in tables:  # sorted_tables: dependências vêm antes
+            deps = [nivel[fk.column.table.name] for fk in table.foreign_keys
+                    if fk.column.table is not table and fk.column.table.name in nivel]
+            nivel[table.name] = max(deps, default=-1) + 1
+        niveis = {}
+        for table in tables:
+            niveis.setdefault(nivel[table.name], []).append(table)
+        return [niveis[indice] for indice in sorted(niveis)]
+
+    def _restore_postgres(self, backup_path, manifest, tables):
+        """TRUNCATE, COPY FROM em paralelo por nível de FK e índices recriados no final
+
+        Se a carga de uma tabela falhar, os níveis seguintes não são carregados;
+        os índices são recriados mesmo assim e o retorno lista as tabelas
+        carregadas, as que falharam e as que ficaram vazias.
+        """
+        from sqlalchemy import Integer, text
+        from models.user import db
+
+        engine = db.engine
+        preparer = engine.dialect.identifier_preparer
+
+        with engine.begin() as connection:
+            # Índices secundários (não ligados a PK/UNIQUE) são recriados após a carga
+            indices = connection.execute(text("""
+                SELECT i.indexname, i.indexdef FROM pg_indexes i
+                WHERE i.schemaname = current_schema() AND i.tablename = ANY(:tabelas)
+                AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname)
+            """), {'tabelas': [table.name for table in tables]}).all()
+            connection.execute(text(
+                f"TRUNCATE {', '.join(preparer.format_table(table) for table in tables)} "
+                f"RESTART IDENTITY CASCADE"))
+            for nome, _ in indices:
+                connection.execute(text(f"DROP INDEX IF EXISTS {preparer.quote(nome)}"))
+
+        def copy_in(table):
+            entry = manifest['database']['tables'][table.name]
+            columns = ', '.join(preparer.quote(column) for column in entry['columns'])
+            connection = engine.raw_connection()
+            try:
+                with gzip.open(os.path.join(backup_path, entry['file']), 'rb') as source:
+                    connection.cursor().copy_expert(
+                        f"COPY {preparer.format_table(table)} ({columns}) FROM STDIN "
+                        f"WITH (FORMAT csv, HEADER true)", source, size=COPY_CHUNK_SIZE)
+                connection.commit()
+                return None
+            except Exception as e:
+                logger.error(f"❌ RESTORE: Erro ao carregar {table.name}: {e}")
+                return str(e)
+            finally:
+                connection.close()
+
+        def run_parallel(func, items):
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(items))),
+                                    thread_name_prefix='gedo-restore') as executor:
+                return list(executor.map(func, items))
+
+        carregadas, falhas = [], {}
         try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_filename = f'full_backup_{timestamp}.zip'
-            backup_path = os.path.join(self.backup_dir, backup_filename)
-
-            with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                # Backup do banco
-                db_path = 'src/database/app.db'
-                if os.path.exists(db_path):
-                    zipf.write(db_path, 'database/app.db')
-
-                # Backup dos uploads
-                uploads_dir = 'src/uploads'
-                if os.path.exists(uploads_dir):
-                    for root, dirs, files in os.walk(uploads_dir):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            arcname = os.path.join(
-                                'uploads', os.path.relpath(file_path, uploads_dir))
-                            zipf.write(file_path, arcname)
-
-                # Backup das configurações
-                config_data = {
-                    'backup_date': datetime.now().isoformat(),
-                    'version': '1.0.0',
-                    'type': 'full_backup'
-                }
-                zipf.writestr('backup_info.json',
-                              json.dumps(config_data, indent=2))
+            for nivel in self._fk_levels(tables):
+                for table, erro in zip(nivel, run_parallel(copy_in, nivel)):
+                    if erro:
+                        falhas[table.name] = erro
+                    else:
+                        carregadas.append(table.name)
+                if falhas:
+                    # Os níveis seguintes referenciam as tabelas que falharam
+                    break
+
+            with engine.begin() as connection:
+                for table in tables:
+                    # Sequências das chaves inteiras (NULL quando a coluna não tem sequência)
+                    for column in table.primary_key.columns:
+                        if not isinstance(column.type, Integer):
+                            continue
+                        connection.execute(text(
+                            f"SELECT setval(pg_get_serial_sequence(:tabela, :coluna), "
+                            f"COALESCE(MAX({preparer.quote(column.name)}), 0) + 1, false) "
+                            f"FROM {preparer.format_table(table)}"),
+                            {'tabela': table.name, 'coluna': column.name})
+        finally:
+            # Índices removidos são recriados mesmo se a carga falhou
+            indices_com_erro = self._recreate_indexes(engine, indices, run_parallel)
+
+        with engine.begin() as connection:
+            for table in tables:
+                if table.name in carregadas:
+                    connection.execute(text(f"ANALYZE {preparer.format_table(table)}"))
+
+        return {'carregadas': carregadas, 'falhas': falhas,
+                'nao_carregadas': [table.name for table in tables
+                                   if table.name not in carregadas],
+                'indices_com_erro': indices_com_erro}
+
+    @staticmethod
+    def _recreate_indexes(engine, indices, run_parallel):
+        """Recria os índices removidos antes da carga
+
+        Erros são logados, não propagados; retorna os nomes dos que falharam.
+        """
+        from sqlalchemy import text
+
+        def create_index(indice):
+            # Índice de tabela particionada sai como "ON ONLY", que não cobre as partições
+            try:
+                with engine.begin() as connection:
+                    connection.execute(text(indice[1].replace(' ON ONLY ', ' ON ', 1)))
+                return None
+            except Exception as e:
+                logger.error(f"❌ RESTORE: Erro ao recriar o índice {indice[0]}: {e}")
+                return indice[0]
+
+        if not indices:
+            return []
+        erros = [nome for nome in run_parallel(create_index, indices) if nome]
+        logger.info(f"🗂️ RESTORE: {len(indices) - len(erros)} de {len(indices)} índices recriados")
+        return erros
+
+    def _restore_rows(self, backup_path, manifest, tables):
+        """Restauração genérica (SQLite): INSERT em lotes em uma única transação
 
-            logger.info(f"Backup completo criado: {backup_path}")
-            return backup_path
+        Tudo ou nada: em caso de erro as tabelas ficam como estavam.
+        """
+        from models.user import db
 
+        try:
+            self._insert_rows(db.engine, backup_path, manifest, tables)
         except Exception as e:
-            logger.error(f"Erro ao criar backup completo: {e}")
+            logger.error(f"❌ RESTORE: Erro na carga - transação desfeita: {e}")
+            return {'carregadas': [], 'falhas': {'transacao': str(e)}, 'nao_carregadas': []}
+        return {'carregadas': [table.name for table in tables], 'falhas': {},
+                'nao_carregadas': []}
+
+    def _insert_rows(self, engine, backup_path, manifest, tables):
+        with engine.begin() as connection:
+            for table in reversed(tables):
+                connection.execute(table.delete())
+            for table in tables:
+                entry = manifest['database']['tables'][table.name]
+                with gzip.open(os.path.join(backup_path, entry['file']), 'rt',
+                               encoding='utf-8', newline='') as source:
+                    records = iter_csv_records(source)
+                    header = next(records, None)
+                    if header is None:
+                        continue
+                    batch = []
+                    for record in records:
+                        batch.append({name: parse_csv_value(table.columns[name], value)
+                                      for name, value in zip(header, record)})
+                        if len(batch) >= SQL_BATCH_SIZE:
+                            connection.execute(table.insert(), batch)
+                            batch = []
+                    if batch:
+                        connection.execute(table.insert(), batch)
+
+    def restore_files(self, manifest):
+        """Regrava no storage os anexos ausentes e atualiza as referências
+
+        Cada anexo é conferido na localização original; os que faltarem são
+        enviados de novo pelo storage_service (BACKUP_WORKERS em paralelo) e
+        as linhas que apontavam para a localização antiga passam a apontar
+        para a nova.
+        """
+        from models.anexo import Anexo
+        from models.registro import Registro
+        from models.user import db
+
+        entries = list(manifest.get('files', {}).values())
+
+        def rehydrate(entry):
+            with self.app.app_context():
+                return entry, self._rehydrate(entry)
+
+        stats = {'presentes': 0, 'regravados': 0, 'falhas': 0}
+        novos_locais = []
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix='gedo-restore') as executor:
+            for entry, resultado in executor.map(rehydrate, entries):
+                if resultado is None:
+                    stats['falhas'] += 1
+                elif resultado is True:
+                    stats['presentes'] += 1
+                else:
+                    stats['regravados'] += 1
+                    novos_locais.append((entry['source'], resultado))
+
+        for origem, stored in novos_locais:
+            values = {
+                'blob_url': stored.get('blob_url'),
+                'blob_pathname': stored.get('blob_pathname'),
+                'caminho_anexo': stored.get('caminho_anexo'),
+            }
+            for model in (Anexo, Registro):
+                model.query.filter(
+                    (model.blob_url == origem) | (model.caminho_anexo == origem)
+                ).update(values, synchronize_session=False)
+        db.session.commit()
+
+        logger.info(f"📎 RESTORE: {stats['regravados']} anexos regravados, "
+                    f"{stats['presentes']} já presentes, {stats['falhas']} falhas")
+        return stats
+
+    def _rehydrate(self, entry):
+        """True se o conteúdo já está no lugar; dados gravados se regravou; None se falhou"""
+        from services.storage_service import storage_service
+
+        source = entry['source']
+        try:
+            if source.startswith(('http://', 'https://')):
+                response = requests.head(source, timeout=30)
+                if response.status_code == 200:
+                    return True
+            elif os.path.exists(source) and os.path.getsize(source) == entry['size']:
+                return True
+
+            filename = os.path.basename(source)
+            with open(self.object_path(entry['sha256']), 'rb') as f:
+                return storage_service.save(f, entry['sha256'], filename,
+                                            content_type=mimetypes.guess_type(filename)[0],
+                                            size=entry['size'])
+        except Exception as e:
+            logger.error(f"❌ RESTORE: Erro ao regravar anexo {source}: {e}")
             return None
 
+    # ------------------------------------------------------------------
+    # Retenção e consulta
+    # ------------------------------------------------------------------
+
     def cleanup_old_backups(self):
-        """Remove backups antigos baseado na política de retenção"""
+        """Remove backups antigos e objetos não referenciados pelos restantes
+
+        O backup completo mais recente (e qualquer um posterior a ele) é
+        sempre mantido.
+        """
         try:
             cutoff_date = datetime.now() - timedelta(days=self.retention_days)
+            ids = self.backup_ids()
+            ultimo = self.latest_manifest()
+            if ultimo:
+                ids = ids[:ids.index(ultimo['id'])]
             removed_count = 0
 
-            for filename in os.listdir(self.backup_dir):
-                file_path = os.path.join(self.backup_dir, filename)
-
-                if os.path.isfile(file_path):
-                    file_time = datetime.fromtimestamp(
-                        os.path.getctime(file_path))
-
-                    if file_time < cutoff_date:
-                        os.remove(file_path)
-                        removed_count += 1
-                        logger.info(f"Backup antigo removido: {filename}")
-
-            if removed_count > 0:
+            for backup_id in ids:
+                backup_time = datetime.strptime(backup_id, '%Y%m%d_%H%M%S')
+                if backup_time < cutoff_date:
+                    shutil.rmtree(os.path.join(self.backup_dir, backup_id))
+                    removed_count += 1
+                    logger.info(f"Backup antigo removido: {backup_id}")
+
+            referenciados = set()
+            for backup_id in self.backup_ids():
+                manifest = self.read_manifest(backup_id) or {}
+                referenciados.update(
+                    entry['sha256'] for entry in manifest.get('files', {}).values())
+
+            removed_objects = 0
+            if os.path.isdir(self.objects_dir):
+                for root, dirs, files in os.walk(self.objects_dir):
+                    for name in files:
+                        if name not in referenciados and not name.endswith('.part'):
+                            os.remove(os.path.join(root, name))
+                            removed_objects += 1
+
+            if removed_count > 0 or removed_objects > 0:
                 logger.info(
-                    f"Limpeza concluída: {removed_count} backups antigos removidos")
+                    f"Limpeza concluída: {removed_count} backups antigos e "
+                    f"{removed_objects} anexos sem referência removidos")
 
             return removed_count
 
@@ -145,103 +894,39 @@ class BackupManager:
             return 0
 
     def list_backups(self):
-        """Lista todos os backups disponíveis"""
+        """Lista todos os backups disponíveis (mais recente primeiro)"""
         try:
-            backups = []
-
-            for filename in os.listdir(self.backup_dir):
-                file_path = os.path.join(self.backup_dir, filename)
-
-                if os.path.isfile(file_path):
-                    stat = os.stat(file_path)
-                    backups.append({
-                        'filename': filename,
-                        'size': stat.st_size,
-                        'created': datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                        'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
-                    })
-
-            # Ordenar por data de criação (mais recente primeiro)
-            backups.sort(key=lambda x: x['created'], reverse=True)
-
-            return backups
+            return [self.get_backup_info(backup_id)
+                    for backup_id in reversed(self.backup_ids())]
 
         except Exception as e:
             logger.error(f"Erro ao listar backups: {e}")
             return []
 
-    def restore_database(self, backup_filename):
-        """Restaura banco de dados a partir de backup"""
-        try:
-            backup_path = os.path.join(self.backup_dir, backup_filename)
-
-            if not os.path.exists(backup_path):
-                logger.error(
-                    f"Arquivo de backup não encontrado: {backup_path}")
-                return False
-
-            db_path = 'src/database/app.db'
-
-            # Fazer backup do banco atual antes de restaurar
-            if os.path.exists(db_path):
-                backup_current = f"{db_path}.backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                shutil.copy2(db_path, backup_current)
-                logger.info(f"Backup do banco atual criado: {backup_current}")
-
-            # Restaurar o backup
-            shutil.copy2(backup_path, db_path)
-            logger.info(f"Banco restaurado a partir de: {backup_filename}")
-
-            return True
-
-        except Exception as e:
-            logger.error(f"Erro ao restaurar banco: {e}")
-            return False
-
-    def get_backup_info(self, backup_filename):
-        """Obtém informações detalhadas sobre um backup"""
+    def get_backup_info(self, backup_id):
+        """Obtém informações resumidas de um backup a partir do manifesto"""
         try:
-            backup_path = os.path.join(self.backup_dir, backup_filename)
-
-            if not os.path.exists(backup_path):
+            manifest = self.read_manifest(backup_id)
+            if not manifest:
                 return None
 
-            stat = os.stat(backup_path)
-            info = {
-                'filename': backup_filename,
-                'size': stat.st_size,
-                'size_mb': round(stat.st_size / (1024 * 1024), 2),
-                'created': datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                'modified': datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                'type': 'unknown'
+            tables = manifest.get('database', {}).get('tables', {})
+            database_bytes = sum(table['bytes'] for table in tables.values())
+            return {
+                'id': backup_id,
+                'type': manifest.get('type'),
+                'status': manifest.get('status', STATUS_COMPLETO),
+                'created': manifest.get('backup_date'),
+                'previous': manifest.get('previous'),
+                'dialect': manifest.get('database', {}).get('dialect'),
+                'tables_count': len(tables),
+                'rows': sum(table['rows'] or 0 for table in tables.values()),
+                'database_size_mb': round(database_bytes / (1024 * 1024), 2),
+                'files_count': len(manifest.get('files', {})),
+                'files_stats': manifest.get('files_stats'),
+                'duration_seconds': manifest.get('duration_seconds'),
             }
 
-            # Determinar tipo do backup pelo nome
-            if 'database_backup' in backup_filename:
-                info['type'] = 'database'
-            elif 'files_backup' in backup_filename:
-                info['type'] = 'files'
-            elif 'full_backup' in backup_filename:
-                info['type'] = 'full'
-
-            # Se for um arquivo ZIP, tentar ler informações adicionais
-            if backup_filename.endswith('.zip'):
-                try:
-                    with zipfile.ZipFile(backup_path, 'r') as zipf:
-                        info['files_count'] = len(zipf.namelist())
-
-                        # Tentar ler backup_info.json se existir
-                        if 'backup_info.json' in zipf.namelist():
-                            backup_info_data = zipf.read('backup_info.json')
-                            backup_info = json.loads(
-                                backup_info_data.decode('utf-8'))
-                            info.update(backup_info)
-
-                except Exception as e:
-                    logger.warning(f"Erro ao ler informações do ZIP: {e}")
-
-            return info
-
         except Exception as e:
             logger.error(f"Erro ao obter informações do backup: {e}")
             return None
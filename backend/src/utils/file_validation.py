@@ -0,0 +1,304 @@
+"""
+Validação de conteúdo de anexos com custo limitado - Sistema GEDO CIMCOP
+
+Os validadores pesados (análise de PDF) rodam em um processo separado com
+timeout rígido e limites de CPU/memória: um arquivo malicioso ou muito
+pesado encerra apenas o processo de validação, nunca a requisição.
+Imagens são validadas só pelo cabeçalho, sem decodificar pixels.
+
+O processo separado é um interpretador novo (python -m utils.file_validation)
+iniciado por subprocess, e não um fork do worker: o worker tem threads e
+pode já ocupar centenas de MB, que o filho herdaria.
+"""
+import json
+import logging
+import mmap
+import os
+import pickle
+import re
+import signal
+import subprocess
+import sys
+from contextlib import contextmanager
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+PDF_HEADER_WINDOW = 1024
+PDF_TAIL_WINDOW = 2048
+PDF_XREF_WINDOW = 4096
+
+MAX_IMAGE_DIMENSION = 10000
+
+# Formatos do Pillow aceitos para cada tipo detectado por magic bytes
+IMAGE_FORMATS = {
+    'image/jpeg': {'JPEG', 'MPO'},
+    'image/png': {'PNG'},
+    'image/gif': {'GIF'},
+}
+
+# Bytes por pixel de cada modo (para estimar a memória da decodificação)
+_MODE_BYTES = {'1': 1, 'L': 1, 'P': 1, 'LA': 2, 'PA': 2, 'I;16': 2,
+               'RGB': 3, 'YCbCr': 3, 'LAB': 3, 'HSV': 3,
+               'RGBA': 4, 'RGBa': 4, 'RGBX': 4, 'CMYK': 4, 'I': 4, 'F': 4}
+
+# Diretório src/, para o processo isolado importar os módulos da aplicação
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_STARTXREF_RE = re.compile(rb'startxref\s+(\d+)')
+_XREF_STREAM_RE = re.compile(rb'\d+\s+\d+\s+obj')
+
+
+def check_pdf_structure(data):
+    """Verificação estrutural do PDF: cabeçalho, startxref, xref e trailer
+
+    Examina apenas janelas fixas no início e no fim do arquivo (custo
+    independente do número de páginas). Retorna (ok, motivo).
+    """
+    if b'%PDF-' not in data[:PDF_HEADER_WINDOW]:
+        return False, 'cabeçalho %PDF ausente'
+
+    tail = data[-PDF_TAIL_WINDOW:]
+    if b'%%EOF' not in tail:
+        return False, 'marcador %%EOF ausente (arquivo truncado)'
+
+    matches = _STARTXREF_RE.findall(tail)
+    if not matches:
+        return False, 'startxref ausente'
+
+    offset = int(matches[-1])
+    if offset >= len(data):
+        return False, 'startxref aponta para fora do arquivo'
+
+    section = data[offset:offset + PDF_XREF_WINDOW].lstrip()
+    if section.startswith(b'xref'):
+        # Tabela xref clássica: o trailer vem depois dela
+        trailer_pos = data.find(b'trailer', offset)
+        if trailer_pos == -1 or b'/Root' not in data[trailer_pos:trailer_pos + PDF_XREF_WINDOW]:
+            return False, 'trailer sem /Root'
+    elif _XREF_STREAM_RE.match(section):
+        # PDF 1.5+: xref em stream, o dicionário faz o papel do trailer
+        if b'/XRef' not in section or b'/Root' not in section:
+            return False, 'stream xref inválido'
+    else:
+        return False, 'tabela xref não encontrada no offset do startxref'
+
+    return True, None
+
+
+def count_pdf_pages(stream):
+    """Conta as páginas pela árvore de páginas, sem extrair texto"""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(stream, strict=False)
+    return len(reader.pages)
+
+
+@contextmanager
+def open_pdf(source):
+    """(conteúdo, stream) de um PDF em bytes ou no caminho `source`
+
+    O arquivo em disco é mapeado somente leitura: as janelas da verificação
+    estrutural são lidas sem copiar o arquivo inteiro para a memória.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        yield source, BytesIO(source)
+        return
+    with open(source, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b'', f
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data, f
+
+
+def validate_pdf_document(source):
+    """Validação completa do PDF (executada dentro do processo isolado)"""
+    with open_pdf(source) as (data, stream):
+        ok, reason = check_pdf_structure(data)
+        if not ok:
+            return False, reason
+        if count_pdf_pages(stream) == 0:
+            return False, 'PDF sem páginas'
+    return True, None
+
+
+def _current_vsz():
+    """Tamanho virtual atual do processo em bytes (None fora do Linux)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _set_limit(resource, kind, limit):
+    # Nunca acima do limite rígido já imposto ao processo (ulimit do container)
+    _, hard = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(kind, (limit, limit))
+
+
+def _apply_limits(cpu_seconds, memory_mb, mapped_bytes=0):
+    """Limites de recursos do processo de validação (somente POSIX)
+
+    O limite de memória é relativo ao tamanho virtual que o processo já tem
+    (interpretador, módulos e o conteúdo recebido), mais o arquivo que será
+    mapeado (mapped_bytes): memory_mb é o orçamento da análise em si.
+    """
+    try:
+        import resource
+    except ImportError:
+        return
+
+    if cpu_seconds:
+        _set_limit(resource, resource.RLIMIT_CPU, cpu_seconds)
+    vsz = _current_vsz()
+    if memory_mb and vsz is not None:
+        _set_limit(resource, resource.RLIMIT_AS, vsz + mapped_bytes + memory_mb * 1024 * 1024)
+
+
+def _isolated_main():
+    """Ponto de entrada do processo isolado
+
+    Lê de stdin a requisição (pickle gerado por run_isolated) e escreve em
+    stdout um cabeçalho JSON e, se o resultado for binário, os bytes em
+    seguida. A resposta não usa pickle: o processo analisa arquivos não
+    confiáveis e o worker não deve desserializar nada vindo dele.
+    """
+    output = sys.stdout.buffer
+    sys.stdout = sys.stderr  # prints de bibliotecas não corrompem a resposta
+
+    func, data, cpu_seconds, memory_mb = pickle.load(sys.stdin.buffer)
+    try:
+        # data é o conteúdo (bytes) ou o caminho de um arquivo em disco
+        mapped_bytes = os.path.getsize(data) if isinstance(data, str) else 0
+        _apply_limits(cpu_seconds, memory_mb, mapped_bytes)
+        ok, result = func(data)
+    except MemoryError:
+        ok, result = False, 'limite de memória da validação excedido'
+    except Exception as e:
+        ok, result = False, f'arquivo ilegível ({type(e).__name__})'
+
+    binary = isinstance(result, (bytes, bytearray))
+    header = {'ok': bool(ok), 'motivo': None if binary else result, 'binario': binary}
+    output.write(json.dumps(header).encode() + b'\n')
+    if binary:
+        output.write(result)
+    output.flush()
+
+
+def _parse_result(output):
+    header, _, payload = output.partition(b'\n')
+    try:
+        result = json.loads(header)
+    except ValueError:
+        # Processo morto pelo limite de CPU/memória antes de responder
+        return False, 'validação interrompida por limite de recursos'
+    if result.get('binario'):
+        return bool(result.get('ok')), payload
+    return bool(result.get('ok')), result.get('motivo')
+
+
+def _kill_group(process):
+    """Encerra o processo isolado e os que ele criou (ex.: pdftoppm)"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (OSError, AttributeError):
+        process.kill()
+
+
+def run_isolated(func, data, timeout=5, cpu_seconds=None, memory_mb=None):
+    """Executa func(data) em processo separado com timeout rígido
+
+    func deve ser uma função de módulo (ou partial) que retorne (ok, motivo)
+    ou (ok, bytes). O processo roda em uma sessão própria: se o prazo
+    estourar, ele e seus subprocessos são finalizados e a validação falha.
+    """
+    request = pickle.dumps((func, data, cpu_seconds or int(timeout) + 1, memory_mb),
+                           protocol=pickle.HIGHEST_PROTOCOL)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [SRC_DIR, env.get('PYTHONPATH')]))
+
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'utils.file_validation'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        env=env, start_new_session=True)
+    try:
+        output, _ = process.communicate(request, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.warning(f"⏱️ Validação excedeu {timeout}s - processo encerrado")
+        _kill_group(process)
+        process.communicate()
+        return False, f'tempo limite de validação excedido ({timeout}s)'
+    except BaseException:
+        _kill_group(process)
+        process.wait()
+        raise
+    return _parse_result(output)
+
+
+def validate_pdf(source, timeout=5, memory_mb=256):
+    """Valida o PDF com orçamento de tempo/memória em processo isolado
+
+    source é o conteúdo (bytes) ou o caminho do arquivo; pelo caminho, o
+    processo isolado lê o arquivo direto do disco. Se não for possível criar
+    o processo, recorre apenas à verificação estrutural (barata) no próprio
+    processo.
+    """
+    try:
+        return run_isolated(validate_pdf_document, source,
+                            timeout=timeout, memory_mb=memory_mb)
+    except OSError as e:
+        logger.error(f"❌ Não foi possível isolar a validação de PDF: {e}")
+        with open_pdf(source) as (data, _):
+            return check_pdf_structure(data)
+
+
+def validate_image(stream, file_type, max_dimension=MAX_IMAGE_DIMENSION, memory_mb=256):
+    """Valida a imagem lendo apenas o cabeçalho (formato e dimensões)
+
+    Imagens acima das dimensões máximas, de Image.MAX_IMAGE_PIXELS ou cuja
+    decodificação estimada ultrapasse memory_mb são rejeitadas antes de
+    qualquer trabalho sobre os pixels. Retorna (ok, motivo).
+    """
+    from PIL import Image
+
+    try:
+        img = Image.open(stream)
+    except Image.DecompressionBombError:
+        return False, 'imagem excede Image.MAX_IMAGE_PIXELS'
+    except Exception as e:
+        return False, f'cabeçalho de imagem inválido ({type(e).__name__})'
+
+    with img:
+        allowed_formats = IMAGE_FORMATS.get(file_type)
+        if allowed_formats is not None and img.format not in allowed_formats:
+            return False, f'formato {img.format} não corresponde a {file_type}'
+
+        width, height = img.size
+        if width <= 0 or height <= 0:
+            return False, 'dimensões inválidas'
+        if width > max_dimension or height > max_dimension:
+            return False, f'dimensões {width}x{height} acima de {max_dimension}px'
+        # Entre 1x e 2x MAX_IMAGE_PIXELS o Pillow só emite um aviso: a rejeição
+        # é explícita (os filtros de avisos são globais, não por thread)
+        if Image.MAX_IMAGE_PIXELS and width * height > Image.MAX_IMAGE_PIXELS:
+            return False, 'imagem excede Image.MAX_IMAGE_PIXELS'
+
+        estimated_bytes = width * height * _MODE_BYTES.get(img.mode, 4)
+        if memory_mb and estimated_bytes > memory_mb * 1024 * 1024:
+            return False, f'decodificação estimada acima de {memory_mb}MB'
+
+        try:
+            # Confere a integridade dos blocos sem decodificar a imagem
+            img.verify()
+        except Exception as e:
+            return False, f'imagem corrompida ({type(e).__name__})'
+
+    return True, None
+
+
+if __name__ == '__main__':
+    _isolated_main()
@@ -0,0 +1,84 @@
+"""
+Monitor de queries SQL - Sistema GEDO CIMCOP
+Registra queries lentas e uma amostra das demais para análise offline,
+substituindo o SQLALCHEMY_RECORD_QUERIES em produção.
+"""
+import logging
+import random
+import time
+from flask import has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Logger separado para a amostragem (pode ser direcionado a outro handler)
+sample_logger = logging.getLogger(f"{__name__}.sample")
+
+MAX_STATEMENT_LENGTH = 500
+
+
+def _get_endpoint():
+    """Obtém o endpoint da requisição atual (se houver)"""
+    if has_request_context():
+        return request.endpoint or request.path
+    return 'sem_requisicao'
+
+
+def _compact_statement(statement):
+    """Compacta o SQL em uma linha e limita o tamanho"""
+    statement = ' '.join(statement.split())
+    if len(statement) > MAX_STATEMENT_LENGTH:
+        return statement[:MAX_STATEMENT_LENGTH - 3] + '...'
+    return statement
+
+
+def init_query_monitor(app, db):
+    """Registra os eventos de cursor no engine da aplicação"""
+    if not app.config.get('QUERY_MONITOR_ENABLED', True):
+        logger.info("ℹ️ Monitor de queries desabilitado")
+        return False
+
+    threshold = app.config.get('SLOW_QUERY_THRESHOLD_MS', 500) / 1000.0
+    sample_rate = app.config.get('QUERY_SAMPLE_PERCENT', 0) / 100.0
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append((time.perf_counter(), context))
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start_times = conn.info.get('query_start_time')
+        if not start_times:
+            return
+
+        elapsed = time.perf_counter() - start_times.pop()[0]
+
+        # Parâmetros nunca são logados (podem conter dados sensíveis)
+        if elapsed >= threshold:
+            logger.warning(
+                f"🐢 SLOW QUERY: {elapsed * 1000:.1f}ms endpoint={_get_endpoint()} "
+                f"sql={_compact_statement(statement)}")
+        elif sample_rate and random.random() < sample_rate:
+            sample_logger.info(
+                f"QUERY SAMPLE: {elapsed * 1000:.1f}ms endpoint={_get_endpoint()} "
+                f"sql={_compact_statement(statement)}")
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(exception_context):
+        # Query com erro não chega ao after_cursor_execute: descartar o início
+        # dela para as próximas medições não ficarem desalinhadas. Só o início
+        # da mesma execução é descartado (erros antes do before_cursor_execute
+        # ou depois do after_cursor_execute não deixam início pendente)
+        conn = exception_context.connection
+        if conn is None:
+            return
+        start_times = conn.info.get('query_start_time')
+        if start_times and start_times[-1][1] is exception_context.execution_context:
+            start_times.pop()
+
+    logger.info(
+        f"🔎 Monitor de queries ativo (limite: {threshold * 1000:.0f}ms, amostragem: {sample_rate * 100:.1f}%)")
+    return True
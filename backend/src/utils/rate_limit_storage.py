@@ -0,0 +1,389 @@
+"""
+Armazenamento de contadores de rate limiting e bloqueios - Sistema GEDO CIMCOP
+
+Backends disponíveis (RATE_LIMIT_BACKEND):
+- memory: janela deslizante em memória, limitada por LRU (desenvolvimento/testes, um único worker)
+- database: tabela rate_limit_counters (SQLite/PostgreSQL), compartilhada entre workers
+- redis: Redis (REDIS_URL), compartilhado entre workers
+
+Os backends compartilhados usam contadores de janela fixa: a chave do contador
+inclui o índice da janela atual e expira junto com ela.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitStorage:
+    """Interface base dos backends de armazenamento"""
+
+    def __init__(self, sweep_interval=300):
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.time()
+
+    @staticmethod
+    def window_key(key, window_seconds, now=None):
+        """Retorna a chave do contador da janela atual e o fim da janela"""
+        now = now if now is not None else time.time()
+        window_index = int(now // window_seconds)
+        return f"{key}:{window_index}", (window_index + 1) * window_seconds
+
+    def incr(self, key, window_seconds, amount=1):
+        """Incrementa o contador da janela atual e retorna o novo valor"""
+        raise NotImplementedError
+
+    def get_count(self, key, window_seconds):
+        """Retorna o valor do contador da janela atual"""
+        raise NotImplementedError
+
+    def reset(self, key, window_seconds):
+        """Zera o contador da janela atual"""
+        bucket_key, _ = self.window_key(key, window_seconds)
+        self.delete(bucket_key)
+
+    def get(self, key):
+        """Retorna um valor simples (ou None se ausente/expirado)"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        """Define um valor simples com expiração em segundos"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove um valor"""
+        raise NotImplementedError
+
+    def sweep(self):
+        """Remove entradas expiradas e retorna a quantidade removida"""
+        return 0
+
+    def _maybe_sweep(self):
+        """Executa a limpeza se o intervalo já passou"""
+        now = time.time()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        try:
+            removed = self.sweep()
+            if removed:
+                logger.info(f"🧹 Rate limit: {removed} entradas expiradas removidas")
+        except Exception as e:
+            logger.error(f"Erro na limpeza do rate limit: {e}")
+
+
+class SlidingWindowCounter:
+    """Contador de janela deslizante com dois baldes (janela atual e anterior)
+
+    A estimativa pondera o balde anterior pela fração da janela ainda
+    coberta, então leitura e atualização têm custo constante e memória
+    fixa, independentemente do volume de tentativas.
+    """
+    __slots__ = ('window_seconds', 'window_index', 'current', 'previous')
+
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        self.window_index = None
+        self.current = 0
+        self.previous = 0
+
+    def _rotate(self, now):
+        window_index = int(now // self.window_seconds)
+        if window_index == self.window_index:
+            return
+        if self.window_index is not None and window_index == self.window_index + 1:
+            self.previous = self.current
+        else:
+            self.previous = 0
+        self.current = 0
+        self.window_index = window_index
+
+    def add(self, amount, now):
+        self._rotate(now)
+        self.current += amount
+        return self.estimate(now)
+
+    def estimate(self, now):
+        self._rotate(now)
+        elapsed = (now % self.window_seconds) / self.window_seconds
+        return self.current + self.previous * (1 - elapsed)
+
+    def expires_at(self):
+        """O balde atual ainda pesa durante toda a janela seguinte"""
+        return (self.window_index + 2) * self.window_seconds
+
+
+class MemoryStorage(RateLimitStorage):
+    """Backend em memória (por processo) - usado em desenvolvimento e testes
+
+    Limitado a max_entries chaves com remoção LRU; as entradas expiradas são
+    removidas por uma thread de limpeza em segundo plano (start_sweeper), de
+    modo que as requisições nunca pagam pela varredura.
+    """
+
+    def __init__(self, sweep_interval=300, max_entries=100000):
+        super().__init__(sweep_interval)
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # chave -> [valor, expira_em]
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stop_event = threading.Event()
+
+    def _get_live(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def _store(self, key, value, expires_at):
+        self._data[key] = [value, expires_at]
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def incr(self, key, window_seconds, amount=1):
+        now = time.time()
+        counter_key = f"{key}:sw{window_seconds}"
+        with self._lock:
+            entry = self._get_live(counter_key, now)
+            counter = entry[0] if entry else SlidingWindowCounter(window_seconds)
+            value = counter.add(amount, now)
+            self._store(counter_key, counter, counter.expires_at())
+        return int(value)
+
+    def get_count(self, key, window_seconds):
+        now = time.time()
+        with self._lock:
+            entry = self._get_live(f"{key}:sw{window_seconds}", now)
+            return int(entry[0].estimate(now)) if entry else 0
+
+    def reset(self, key, window_seconds):
+        self.delete(f"{key}:sw{window_seconds}")
+
+    def get(self, key):
+        with self._lock:
+            entry = self._get_live(key, time.time())
+            return entry[0] if entry else None
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._store(key, value, time.time() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def sweep(self, batch_size=1000):
+        """Remove expiradas em lotes, liberando o lock entre eles"""
+        now = time.time()
+        with self._lock:
+            keys = list(self._data.keys())
+
+        removed = 0
+        for start in range(0, len(keys), batch_size):
+            with self._lock:
+                for key in keys[start:start + batch_size]:
+                    entry = self._data.get(key)
+                    if entry is not None and entry[1] <= now:
+                        del self._data[key]
+                        removed += 1
+        return removed
+
+    def start_sweeper(self):
+        """Inicia a thread de limpeza em segundo plano (idempotente)"""
+        if self._sweeper and self._sweeper.is_alive():
+            return
+
+        def run():
+            while not self._stop_event.wait(self.sweep_interval):
+                self._last_sweep = 0
+                self._maybe_sweep()
+
+        self._stop_event.clear()
+        self._sweeper = threading.Thread(
+            target=run, name='rate-limit-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop_event.set()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DatabaseStorage(RateLimitStorage):
+    """Backend em banco de dados (tabela rate_limit_counters)
+
+    Usa conexões próprias (fora da db.session) para não interferir nas
+    transações da requisição. Em caso de erro no banco, falha aberta.
+    """
+
+    def __init__(self, sweep_interval=300):
+        super().__init__(sweep_interval)
+
+    @staticmethod
+    def _table():
+        from models.rate_limit import RateLimitCounter
+        return RateLimitCounter.__table__
+
+    @staticmethod
+    def _engine():
+        from models.user import db
+        return db.engine
+
+    def _upsert(self, key, amount, expires_at, increment):
+        """Incrementa (ou define) o valor da chave, criando a linha se necessário"""
+        from sqlalchemy import select
+        from sqlalchemy.exc import IntegrityError
+
+        table = self._table()
+        new_value = table.c.valor + amount if increment else amount
+
+        for _ in range(2):
+            try:
+                with self._engine().begin() as conn:
+                    result = conn.execute(
+                        table.update()
+                        .where(table.c.chave == key)
+                        .values(valor=new_value, expira_em=expires_at))
+                    if result.rowcount == 0:
+                        conn.execute(table.insert().values(
+                            chave=key, valor=amount, expira_em=expires_at))
+                        return amount
+                    return conn.execute(
+                        select(table.c.valor).where(table.c.chave == key)).scalar()
+            except IntegrityError:
+                # Outro worker inseriu a mesma chave - tentar o UPDATE novamente
+                continue
+        return amount
+
+    def incr(self, key, window_seconds, amount=1):
+        bucket_key, expires_at = self.window_key(key, window_seconds)
+        self._maybe_sweep()
+        try:
+            return int(self._upsert(bucket_key, amount, expires_at, increment=True))
+        except Exception as e:
+            logger.error(f"Erro no rate limit (banco): {e}")
+            return 0
+
+    def get_count(self, key, window_seconds):
+        bucket_key, _ = self.window_key(key, window_seconds)
+        value = self.get(bucket_key)
+        return int(value) if value is not None else 0
+
+    def get(self, key):
+        from sqlalchemy import select
+
+        table = self._table()
+        try:
+            with self._engine().connect() as conn:
+                row = conn.execute(
+                    select(table.c.valor, table.c.expira_em)
+                    .where(table.c.chave == key)).first()
+        except Exception as e:
+            logger.error(f"Erro ao ler rate limit (banco): {e}")
+            return None
+
+        if row is None or row.expira_em <= time.time():
+            return None
+        return row.valor
+
+    def set(self, key, value, ttl):
+        self._maybe_sweep()
+        try:
+            self._upsert(key, value, time.time() + ttl, increment=False)
+        except Exception as e:
+            logger.error(f"Erro ao gravar rate limit (banco): {e}")
+
+    def delete(self, key):
+        table = self._table()
+        try:
+            with self._engine().begin() as conn:
+                conn.execute(table.delete().where(table.c.chave == key))
+        except Exception as e:
+            logger.error(f"Erro ao remover rate limit (banco): {e}")
+
+    def sweep(self):
+        table = self._table()
+        with self._engine().begin() as conn:
+            result = conn.execute(
+                table.delete().where(table.c.expira_em <= time.time()))
+        return result.rowcount or 0
+
+
+class RedisStorage(RateLimitStorage):
+    """Backend Redis - as chaves expiram sozinhas (sem limpeza periódica)"""
+
+    def __init__(self, url, prefix='gedo:ratelimit:'):
+        super().__init__()
+        import redis  # Dependência opcional
+        self._redis_error = redis.RedisError
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def incr(self, key, window_seconds, amount=1):
+        bucket_key, expires_at = self.window_key(key, window_seconds)
+        full_key = self.prefix + bucket_key
+        try:
+            pipe = self.client.pipeline()
+            pipe.incrby(full_key, amount)
+            pipe.expireat(full_key, int(expires_at) + 1)
+            value, _ = pipe.execute()
+            return int(value)
+        except self._redis_error as e:
+            logger.error(f"Erro no rate limit (redis): {e}")
+            return 0
+
+    def get_count(self, key, window_seconds):
+        bucket_key, _ = self.window_key(key, window_seconds)
+        value = self.get(bucket_key)
+        return int(value) if value is not None else 0
+
+    def get(self, key):
+        try:
+            value = self.client.get(self.prefix + key)
+        except self._redis_error as e:
+            logger.error(f"Erro ao ler rate limit (redis): {e}")
+            return None
+        return float(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        try:
+            self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+        except self._redis_error as e:
+            logger.error(f"Erro ao gravar rate limit (redis): {e}")
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + key)
+        except self._redis_error as e:
+            logger.error(f"Erro ao remover rate limit (redis): {e}")
+
+
+def create_storage(app):
+    """Cria o backend configurado em RATE_LIMIT_BACKEND"""
+    backend = app.config.get('RATE_LIMIT_BACKEND', 'memory')
+    sweep_interval = app.config.get('RATE_LIMIT_SWEEP_INTERVAL', 300)
+    max_entries = app.config.get('RATE_LIMIT_MAX_ENTRIES', 100000)
+
+    if backend == 'redis':
+        try:
+            storage = RedisStorage(app.config.get('REDIS_URL'))
+            logger.info("🛡️ Rate limit usando Redis")
+            return storage
+        except Exception as e:
+            logger.error(
+                f"❌ Não foi possível usar Redis para rate limit ({e}) - usando memória")
+    elif backend == 'database':
+        logger.info("🛡️ Rate limit usando banco de dados")
+        return DatabaseStorage(sweep_interval=sweep_interval)
+
+    storage = MemoryStorage(sweep_interval=sweep_interval, max_entries=max_entries)
+    storage.start_sweeper()
+    return storage
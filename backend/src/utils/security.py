@@ -1,27 +1,28 @@
 import hashlib
-import secrets
 import time
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify
 import logging
 import re
-from collections import defaultdict
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from flask import current_app
 import json
+import threading
+from collections import OrderedDict
+from utils.rate_limit_storage import MemoryStorage, create_storage
 
 logger = logging.getLogger(__name__)
 
+_csrf_cache_lock = threading.Lock()
+
 
 class SecurityManager:
     """Gerenciador de segurança robusto"""
 
-    def __init__(self):
-        self.failed_attempts = defaultdict(list)
-        self.blocked_ips = {}
-        self.progressive_blocks = defaultdict(
-            int)  # Contador de bloqueios por IP
+    def __init__(self, storage=None):
+        # Estado compartilhado entre workers (ver utils/rate_limit_storage.py)
+        self.storage = storage or MemoryStorage()
 
         # Configurações mais rigorosas
         self.max_attempts = 3  # Máximo 3 tentativas
@@ -31,6 +32,12 @@ class SecurityManager:
 
         # Bloqueios progressivos: 15min, 1h, 6h, 24h, 7 dias
         self.progressive_durations = [900, 3600, 21600, 86400, 604800]
+        # Por quanto tempo o contador de bloqueios progressivos é lembrado
+        self.progressive_memory = 604800 * 8  # 8 semanas
+
+    def init_app(self, app):
+        """Configura o backend de armazenamento a partir da aplicação"""
+        self.storage = create_storage(app)
 
     def get_client_identifier(self):
         """Obtém identificador único do cliente"""
@@ -47,24 +54,16 @@ class SecurityManager:
         if not identifier:
             identifier = self.get_client_identifier()
 
-        current_time = time.time()
-
-        # Remove tentativas antigas
-        self.failed_attempts[identifier] = [
-            attempt_time for attempt_time in self.failed_attempts[identifier]
-            if current_time - attempt_time < self.window_duration
-        ]
-
-        # Adiciona a nova tentativa
-        self.failed_attempts[identifier].append(current_time)
+        attempts = self.storage.incr(
+            f"failed:{identifier}", self.window_duration)
 
         # Verifica se deve bloquear
-        if len(self.failed_attempts[identifier]) >= self.max_attempts:
-            self._apply_progressive_block(identifier, current_time)
+        if attempts >= self.max_attempts:
+            self._apply_progressive_block(identifier, time.time())
 
     def _apply_progressive_block(self, identifier, current_time):
         """Aplica bloqueio progressivo"""
-        block_count = self.progressive_blocks[identifier]
+        block_count = int(self.storage.get(f"progressive:{identifier}") or 0)
 
         if block_count < len(self.progressive_durations):
             block_duration = self.progressive_durations[block_count]
@@ -72,30 +71,31 @@ class SecurityManager:
             # Bloqueio permanente após muitas tentativas
             block_duration = 604800 * 4  # 4 semanas
 
-        self.blocked_ips[identifier] = current_time + block_duration
-        self.progressive_blocks[identifier] += 1
+        self.storage.set(f"blocked:{identifier}",
+                         current_time + block_duration, block_duration)
+        self.storage.set(f"progressive:{identifier}",
+                         block_count + 1, self.progressive_memory)
 
         # Log de segurança
         logger.warning(f"IP/Cliente bloqueado progressivamente: {identifier[:20]}... "
                        f"Bloqueio #{block_count + 1}, Duração: {block_duration/60:.0f} minutos")
 
         # Limpar tentativas após bloqueio
-        self.failed_attempts[identifier] = []
+        self.storage.reset(f"failed:{identifier}", self.window_duration)
 
     def is_blocked(self, identifier=None):
         """Verifica se um cliente está bloqueado"""
         if not identifier:
             identifier = self.get_client_identifier()
 
-        if identifier not in self.blocked_ips:
+        block_end_time = self.storage.get(f"blocked:{identifier}")
+        if block_end_time is None:
             return False, None
 
         current_time = time.time()
-        block_end_time = self.blocked_ips[identifier]
-
         if current_time > block_end_time:
             # Bloqueio expirou
-            del self.blocked_ips[identifier]
+            self.storage.delete(f"blocked:{identifier}")
             return False, None
 
         # Calcular tempo restante
@@ -107,8 +107,7 @@ class SecurityManager:
         if not identifier:
             identifier = self.get_client_identifier()
 
-        if identifier in self.failed_attempts:
-            del self.failed_attempts[identifier]
+        self.storage.reset(f"failed:{identifier}", self.window_duration)
 
         # NÃO limpar bloqueios ativos ou contador progressivo
         logger.info(f"Tentativas falhadas limpas para: {identifier[:20]}...")
@@ -119,8 +118,10 @@ class SecurityManager:
             identifier = self.get_client_identifier()
 
         is_blocked, remaining_time = self.is_blocked(identifier)
-        failed_count = len(self.failed_attempts.get(identifier, []))
-        progressive_count = self.progressive_blocks.get(identifier, 0)
+        failed_count = self.storage.get_count(
+            f"failed:{identifier}", self.window_duration)
+        progressive_count = int(
+            self.storage.get(f"progressive:{identifier}") or 0)
 
         return {
             'is_blocked': is_blocked,
@@ -160,27 +161,36 @@ def security_check_decorator(f):
     return decorated_function
 
 
-def audit_log(action, user_id=None, details=None):
-    """Registra eventos de auditoria com informações de segurança"""
+def audit_log(action, user_id=None, details=None, table_name=None, record_id=None,
+              old_values=None, username=None, obra_id=None, include_security_status=False):
+    """Registra evento de auditoria (gravado em lote por services/audit_service.py)
+
+    include_security_status adiciona o estado de bloqueio do cliente aos
+    detalhes (consulta o storage de rate limiting; usar só em eventos de
+    segurança).
+    """
     try:
-        # Obter informações de segurança
-        security_status = security_manager.get_security_status()
+        from services.audit_service import audit_service
+
+        details = sanitize_log_data(details or {})
+        if include_security_status:
+            details['security_status'] = security_manager.get_security_status()
 
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
+        event = {
+            'timestamp': datetime.utcnow(),
             'action': action,
             'user_id': user_id,
-            'client_id': security_manager.get_client_identifier()[:20] + '...',
-            'ip': request.remote_addr if request else 'unknown',
-            'user_agent_hash': hashlib.sha256(request.headers.get('User-Agent', '').encode()).hexdigest()[:16] if request else 'unknown',
-            'security_status': security_status,
-            'details': sanitize_log_data(details or {}),
-            'request_id': secrets.token_hex(8)
+            'username': username,
+            'table_name': table_name,
+            'record_id': record_id,
+            'obra_id': obra_id,
+            'old_values': json.dumps(sanitize_log_data(old_values), default=str) if old_values else None,
+            'new_values': json.dumps(details, default=str) if details else None,
+            'ip_address': (request.remote_addr or '')[:45] if request else None,
+            'user_agent': request.headers.get('User-Agent', '')[:500] if request else None,
         }
-
-        # Log estruturado
-        logger.info(f"AUDIT: {json.dumps(log_entry, default=str)}")
-        return log_entry
+        audit_service.enqueue(event)
+        return event
     except Exception as e:
         logger.error(f"Erro ao registrar log de auditoria: {e}")
         return None
@@ -216,22 +226,17 @@ def sanitize_log_data(data):
 def rate_limit(max_requests=3, window_minutes=5):
     """Decorator para rate limiting específico por endpoint"""
     def decorator(f):
-        endpoint_attempts = defaultdict(list)
-
         @wraps(f)
         def wrapper(*args, **kwargs):
             identifier = security_manager.get_client_identifier()
-            current_time = time.time()
             window_seconds = window_minutes * 60
 
-            # Limpar tentativas antigas
-            endpoint_attempts[identifier] = [
-                attempt_time for attempt_time in endpoint_attempts[identifier]
-                if current_time - attempt_time < window_seconds
-            ]
+            # Contador compartilhado entre workers (janela fixa)
+            attempts = security_manager.storage.incr(
+                f"endpoint:{f.__name__}:{identifier}", window_seconds)
 
             # Verificar limite
-            if len(endpoint_attempts[identifier]) >= max_requests:
+            if attempts > max_requests:
                 logger.warning(
                     f"Rate limit excedido para endpoint {f.__name__}: {identifier[:20]}...")
                 return jsonify({
@@ -239,9 +244,6 @@ def rate_limit(max_requests=3, window_minutes=5):
                     'error_code': 'ENDPOINT_RATE_LIMITED'
                 }), 429
 
-            # Registrar tentativa
-            endpoint_attempts[identifier].append(current_time)
-
             return f(*args, **kwargs)
         return wrapper
     return decorator
@@ -287,17 +289,108 @@ def validate_password_strength(password):
     return True, "Senha válida"
 
 
+class CsrfMetrics:
+    """Métricas agregadas da verificação de CSRF (por processo)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.checks = 0
+        self.cache_hits = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+
+    def record(self, elapsed, valid, cache_hit):
+        with self._lock:
+            self.checks += 1
+            self.total_seconds += elapsed
+            if cache_hit:
+                self.cache_hits += 1
+            if not valid:
+                self.failures += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checks': self.checks,
+                'cache_hits': self.cache_hits,
+                'failures': self.failures,
+                'total_ms': round(self.total_seconds * 1000, 3),
+                'avg_ms': round(self.total_seconds * 1000 / self.checks, 4) if self.checks else 0
+            }
+
+
+# Instância global
+csrf_metrics = CsrfMetrics()
+
+
+def _get_csrf_serializer():
+    """Serializer CSRF construído uma única vez por aplicação"""
+    serializer = current_app.extensions.get('gedo_csrf_serializer')
+    if serializer is None:
+        serializer = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
+        current_app.extensions['gedo_csrf_serializer'] = serializer
+    return serializer
+
+
+def _get_csrf_cache():
+    """Cache LRU (por aplicação) de tokens já verificados: token -> expiração"""
+    cache = current_app.extensions.get('gedo_csrf_cache')
+    if cache is None:
+        cache = OrderedDict()
+        current_app.extensions['gedo_csrf_cache'] = cache
+    return cache
+
+
 def generate_csrf_token():
     """Gera token CSRF seguro"""
-    s = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
-    return s.dumps('csrf', salt='csrf-token')
+    return _get_csrf_serializer().dumps('csrf', salt='csrf-token')
 
 
 def validate_csrf_token(token, max_age=3600):
-    """Valida token CSRF"""
-    s = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
+    """Valida token CSRF
+
+    Tokens válidos ficam memorizados por CSRF_CACHE_TTL segundos (nunca além
+    da própria expiração), evitando refazer o HMAC a cada mutação da sessão.
+    """
+    started = time.perf_counter()
+    valid, cache_hit = _validate_csrf_token(token, max_age)
+    csrf_metrics.record(time.perf_counter() - started, valid, cache_hit)
+    return valid
+
+
+def _validate_csrf_token(token, max_age):
+    cache = _get_csrf_cache()
+    cache_key = (token, max_age)
+    now = time.time()
+
+    with _csrf_cache_lock:
+        expires_at = cache.get(cache_key)
+        if expires_at is not None:
+            if expires_at > now:
+                cache.move_to_end(cache_key)
+                return True, True
+            del cache[cache_key]
+
     try:
-        data = s.loads(token, salt='csrf-token', max_age=max_age)
-        return data == 'csrf'
+        data, issued_at = _get_csrf_serializer().loads(
+            token, salt='csrf-token', max_age=max_age, return_timestamp=True)
     except (BadSignature, SignatureExpired):
-        return False
+        return False, False
+
+    if data != 'csrf':
+        return False, False
+
+    ttl = current_app.config.get('CSRF_CACHE_TTL', 300)
+    max_entries = current_app.config.get('CSRF_CACHE_MAX_ENTRIES', 1024)
+    expires_at = min(issued_at.timestamp() + max_age, now + ttl)
+
+    with _csrf_cache_lock:
+        cache[cache_key] = expires_at
+        cache.move_to_end(cache_key)
+        while len(cache) > max_entries:
+            cache.popitem(last=False)
+
+    return True, False
@@ -0,0 +1,64 @@
+"""
+Testes do monitor de queries (utils/query_monitor.py)
+
+Rodar a partir de backend/:
+    python -m unittest discover -s tests
+
+Usa SQLite em memória e um app Flask mínimo (requer SQLAlchemy e Flask);
+sem as dependências os testes são ignorados.
+"""
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+# ✅ Mesmo ajuste de sys.path dos scripts: importar módulos de src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+try:
+    import sqlalchemy
+    from flask import Flask
+    from utils.query_monitor import init_query_monitor
+except ImportError:
+    sqlalchemy = None
+
+
+@unittest.skipIf(sqlalchemy is None, 'SQLAlchemy/Flask não instalados')
+class QueryMonitorErroTest(unittest.TestCase):
+    """Erros do banco continuam chegando ao chamador com o monitor ativo"""
+
+    def setUp(self):
+        self.engine = sqlalchemy.create_engine('sqlite://')
+        self.addCleanup(self.engine.dispose)
+        metadata = sqlalchemy.MetaData()
+        self.tabela = sqlalchemy.Table(
+            'chaves', metadata,
+            sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True),
+            sqlalchemy.Column('chave', sqlalchemy.String(50), nullable=False, unique=True))
+        metadata.create_all(self.engine)
+
+        app = Flask(__name__)
+        app.config['QUERY_SAMPLE_PERCENT'] = 100
+        self.assertTrue(init_query_monitor(app, SimpleNamespace(engine=self.engine)))
+
+    def test_violacao_de_unique_continua_integrity_error(self):
+        with self.engine.connect() as conn:
+            conn.execute(self.tabela.insert().values(chave='a'))
+            with self.assertRaises(sqlalchemy.exc.IntegrityError):
+                conn.execute(self.tabela.insert().values(chave='a'))
+            conn.rollback()
+
+            # Início da query com erro descartado: nada pendente na conexão
+            self.assertEqual(conn.info.get('query_start_time'), [])
+            self.assertEqual(conn.execute(sqlalchemy.select(sqlalchemy.func.count())
+                                          .select_from(self.tabela)).scalar(), 0)
+
+    def test_sql_invalido_continua_operational_error(self):
+        with self.engine.connect() as conn:
+            with self.assertRaises(sqlalchemy.exc.OperationalError):
+                conn.exec_driver_sql('SELECT * FROM tabela_inexistente')
+            self.assertEqual(conn.info.get('query_start_time'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
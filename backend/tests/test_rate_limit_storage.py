@@ -0,0 +1,206 @@
+"""
+Testes dos backends de rate limiting (utils/rate_limit_storage.py)
+
+Rodar a partir de backend/:
+    python -m unittest discover -s tests
+
+O backend em memória não tem dependências; o de banco usa SQLite em memória
+(requer SQLAlchemy) e os testes de bloqueio usam o SecurityManager (requer
+Flask). Os testes sem a dependência instalada são ignorados.
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+# ✅ Mesmo ajuste de sys.path dos scripts: importar módulos de src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from utils.rate_limit_storage import DatabaseStorage, MemoryStorage
+
+try:
+    import sqlalchemy
+    from sqlalchemy.pool import StaticPool
+except ImportError:
+    sqlalchemy = None
+
+try:
+    from utils.security import SecurityManager
+except ImportError:
+    SecurityManager = None
+
+JANELA = 60
+INICIO = 1_700_000_040.0  # início exato de uma janela de 60s
+
+
+class Relogio:
+    """time.time() controlado pelo teste"""
+
+    def __init__(self, agora=INICIO):
+        self.agora = agora
+
+    def __call__(self):
+        return self.agora
+
+    def avancar(self, segundos):
+        self.agora += segundos
+
+
+class StorageSemanticsMixin:
+    """Semântica comum de get/set/delete e contadores (todo backend deve cumprir)"""
+
+    def criar_storage(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.relogio = Relogio()
+        patcher = mock.patch('time.time', self.relogio)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.storage = self.criar_storage()
+
+    def test_incr_conta_na_janela(self):
+        for esperado in (1, 2, 3):
+            self.assertEqual(self.storage.incr('failed:a', JANELA), esperado)
+        self.assertEqual(self.storage.get_count('failed:a', JANELA), 3)
+        self.assertEqual(self.storage.get_count('failed:b', JANELA), 0)
+
+    def test_reset_zera_contador(self):
+        self.storage.incr('failed:a', JANELA, amount=5)
+        self.storage.reset('failed:a', JANELA)
+        self.assertEqual(self.storage.get_count('failed:a', JANELA), 0)
+        self.assertEqual(self.storage.incr('failed:a', JANELA), 1)
+
+    def test_contador_zera_depois_de_duas_janelas(self):
+        self.storage.incr('failed:a', JANELA, amount=3)
+        self.relogio.avancar(2 * JANELA)
+        self.assertEqual(self.storage.get_count('failed:a', JANELA), 0)
+
+    def test_set_get_respeita_ttl(self):
+        self.storage.set('blocked:a', INICIO + 900, 900)
+        self.assertEqual(self.storage.get('blocked:a'), INICIO + 900)
+        self.relogio.avancar(899)
+        self.assertEqual(self.storage.get('blocked:a'), INICIO + 900)
+        self.relogio.avancar(2)
+        self.assertIsNone(self.storage.get('blocked:a'))
+
+    def test_set_sobrescreve_e_delete_remove(self):
+        self.storage.set('progressive:a', 1, 3600)
+        self.storage.set('progressive:a', 2, 3600)
+        self.assertEqual(self.storage.get('progressive:a'), 2)
+        self.storage.delete('progressive:a')
+        self.assertIsNone(self.storage.get('progressive:a'))
+
+
+class MemoryStorageTest(StorageSemanticsMixin, unittest.TestCase):
+
+    def criar_storage(self):
+        return MemoryStorage(max_entries=100)
+
+    def test_janela_deslizante_pondera_janela_anterior(self):
+        self.storage.incr('failed:a', JANELA, amount=4)
+        # Metade da janela seguinte: a anterior ainda pesa 50%
+        self.relogio.avancar(JANELA + JANELA / 2)
+        self.assertEqual(self.storage.get_count('failed:a', JANELA), 2)
+        self.assertEqual(self.storage.incr('failed:a', JANELA), 3)
+
+    def test_limite_de_entradas_remove_a_mais_antiga(self):
+        storage = MemoryStorage(max_entries=3)
+        for indice in range(4):
+            storage.set(f"chave:{indice}", indice, 60)
+        self.assertEqual(len(storage), 3)
+        self.assertIsNone(storage.get('chave:0'))
+        self.assertEqual(storage.get('chave:3'), 3)
+
+    def test_sweep_remove_expiradas(self):
+        self.storage.set('curta', 1, 10)
+        self.storage.set('longa', 1, 1000)
+        self.relogio.avancar(11)
+        self.assertEqual(self.storage.sweep(), 1)
+        self.assertEqual(len(self.storage), 1)
+
+
+@unittest.skipIf(sqlalchemy is None, 'SQLAlchemy não instalado')
+class DatabaseStorageTest(StorageSemanticsMixin, unittest.TestCase):
+
+    def criar_storage(self):
+        # Mesma estrutura de models/rate_limit.py, sem depender do Flask-SQLAlchemy
+        metadata = sqlalchemy.MetaData()
+        tabela = sqlalchemy.Table(
+            'rate_limit_counters', metadata,
+            sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True),
+            sqlalchemy.Column('chave', sqlalchemy.String(255), nullable=False, unique=True),
+            sqlalchemy.Column('valor', sqlalchemy.Float, nullable=False, default=0),
+            sqlalchemy.Column('expira_em', sqlalchemy.Float, nullable=False, index=True))
+        engine = sqlalchemy.create_engine('sqlite://', poolclass=StaticPool,
+                                          connect_args={'check_same_thread': False})
+        metadata.create_all(engine)
+        self.addCleanup(engine.dispose)
+
+        storage = DatabaseStorage(sweep_interval=10 ** 9)
+        storage._engine = lambda: engine
+        storage._table = lambda: tabela
+        return storage
+
+    def test_janela_fixa_recomeca_na_janela_seguinte(self):
+        self.storage.incr('failed:a', JANELA, amount=4)
+        self.relogio.avancar(JANELA - 1)
+        self.assertEqual(self.storage.get_count('failed:a', JANELA), 4)
+        self.relogio.avancar(1)
+        self.assertEqual(self.storage.get_count('failed:a', JANELA), 0)
+        self.assertEqual(self.storage.incr('failed:a', JANELA), 1)
+
+    def test_sweep_remove_expiradas(self):
+        self.storage.set('curta', 1, 10)
+        self.storage.set('longa', 1, 1000)
+        self.relogio.avancar(11)
+        self.assertEqual(self.storage.sweep(), 1)
+        self.assertEqual(self.storage.get('longa'), 1)
+
+
+@unittest.skipIf(SecurityManager is None, 'Flask não instalado')
+class BloqueioProgressivoTest(unittest.TestCase):
+    """Bloqueios do SecurityManager sobre o backend em memória"""
+
+    def setUp(self):
+        self.relogio = Relogio()
+        patcher = mock.patch('time.time', self.relogio)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = SecurityManager(storage=MemoryStorage())
+
+    def falhar(self, vezes):
+        for _ in range(vezes):
+            self.manager.register_failed_attempt('cliente')
+
+    def test_bloqueia_ao_atingir_o_limite(self):
+        self.falhar(self.manager.max_attempts - 1)
+        self.assertEqual(self.manager.is_blocked('cliente'), (False, None))
+
+        self.falhar(1)
+        bloqueado, restante = self.manager.is_blocked('cliente')
+        self.assertTrue(bloqueado)
+        self.assertEqual(restante, self.manager.progressive_durations[0])
+
+        status = self.manager.get_security_status('cliente')
+        self.assertEqual(status['failed_attempts'], 0)
+        self.assertEqual(status['progressive_blocks'], 1)
+
+    def test_bloqueio_expira_e_o_seguinte_e_mais_longo(self):
+        self.falhar(self.manager.max_attempts)
+        self.relogio.avancar(self.manager.progressive_durations[0] + 1)
+        self.assertEqual(self.manager.is_blocked('cliente'), (False, None))
+
+        self.falhar(self.manager.max_attempts)
+        bloqueado, restante = self.manager.is_blocked('cliente')
+        self.assertTrue(bloqueado)
+        self.assertEqual(restante, self.manager.progressive_durations[1])
+
+    def test_login_bem_sucedido_nao_remove_bloqueio(self):
+        self.falhar(self.manager.max_attempts)
+        self.manager.clear_failed_attempts('cliente')
+        self.assertTrue(self.manager.is_blocked('cliente')[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -109,6 +109,8 @@ const ImportacaoLote = ({ onClose, onSuccess }) => {
                 anexo_path: response.data.anexo_path,
                 blob_url: response.data.blob_url,
                 blob_pathname: response.data.blob_pathname,
+                anexo_id: response.data.anexo_id,
+                upload_id: response.data.upload_id,
                 nome_arquivo_original: response.data.nome_arquivo_original,
                 formato_arquivo: response.data.formato_arquivo,
                 tamanho_arquivo: response.data.tamanho_arquivo,
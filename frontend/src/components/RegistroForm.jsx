@@ -26,7 +26,7 @@ export default function RegistroForm() {
     data_registro: "",
     codigo_numero: "",
     descricao: "",
-    anexo: null,
+    anexos: [],
     obra_id: "",
     classificacao_grupo: "",
     classificacao_subgrupo: "",
@@ -103,7 +103,7 @@ export default function RegistroForm() {
   const handleChange = (e) => {
     const { name, value, files } = e.target
     if (name === "anexo") {
-      setFormData({ ...formData, anexo: files[0] })
+      setFormData({ ...formData, anexos: Array.from(files) })
     } else {
       setFormData({ ...formData, [name]: value })
     }
@@ -159,10 +159,8 @@ export default function RegistroForm() {
     if (formData.classificacao_grupo) data.append("classificacao_grupo", formData.classificacao_grupo)
     if (formData.classificacao_subgrupo) data.append("classificacao_subgrupo", formData.classificacao_subgrupo)
 
-    // Anexo (opcional)
-    if (formData.anexo) {
-      data.append("anexo", formData.anexo)
-    }
+    // Anexos (opcionais) - o primeiro é o anexo principal do registro
+    formData.anexos.forEach((arquivo) => data.append("anexo", arquivo))
 
     // Debug: Mostrar o que está sendo enviado
     console.log("📎 Dados sendo enviados:")
@@ -184,7 +182,7 @@ export default function RegistroForm() {
         data_registro: "",
         codigo_numero: "",
         descricao: "",
-        anexo: null,
+        anexos: [],
         obra_id: user?.role === "administrador" ? "" : user?.obra_id?.toString() || "",
         classificacao_grupo: "",
         classificacao_subgrupo: "",
@@ -453,15 +451,16 @@ export default function RegistroForm() {
                   <input
                     type="file"
                     name="anexo"
+                    multiple
                     onChange={handleChange}
                     className="w-full text-sm text-gray-600 file:mr-4 file:py-3 file:px-6 file:rounded-md file:border-0 file:text-sm file:font-medium file:bg-blue-50 file:text-blue-700 hover:file:bg-blue-100"
                   />
-                  {formData.anexo && (
-                    <div className="mt-3 flex items-center space-x-2 text-sm text-gray-600">
+                  {formData.anexos.map((arquivo) => (
+                    <div key={arquivo.name} className="mt-3 flex items-center space-x-2 text-sm text-gray-600">
                       <CheckCircle className="h-4 w-4 text-green-500" />
-                      <span>Arquivo selecionado: {formData.anexo.name}</span>
+                      <span>Arquivo selecionado: {arquivo.name}</span>
                     </div>
-                  )}
+                  ))}
                   <p className="text-xs text-gray-500 mt-3">
                     Tipos aceitos: PDF, DOC, DOCX, XLS, XLSX, TXT, PNG, JPG, JPEG, GIF
                   </p>
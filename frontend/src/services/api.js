@@ -113,6 +113,8 @@ export const pesquisaAPI = {
   getFiltros: () => api.get("/pesquisa/filtros"),
   pesquisar: (params) => api.get("/pesquisa/", { params }),
   exportar: (filtros) => api.post("/pesquisa/exportar", filtros, { responseType: "blob" }),
+  // Filtros da pesquisa ou { ids: [...] }
+  baixarAnexosZip: (payload) => api.post("/pesquisa/anexos-zip", payload, { responseType: "blob" }),
   visualizar: (id) => api.get(`/pesquisa/${id}/visualizar`),
 }
 
@@ -165,6 +167,31 @@ export const registrosAPI = {
   },
 }
 
+// Upload retomável em partes (arquivos grandes)
+export const uploadsAPI = {
+  iniciar: (arquivo) =>
+    api.post("/uploads/", { nome_arquivo: arquivo.name, tamanho: arquivo.size, mimetype: arquivo.type }),
+  status: (uploadId) => api.get(`/uploads/${uploadId}`),
+  enviarParte: (uploadId, indice, parte) =>
+    api.put(`/uploads/${uploadId}/chunks/${indice}`, parte, {
+      headers: { "Content-Type": "application/octet-stream" },
+      timeout: 120000,
+    }),
+  concluir: (uploadId) => api.post(`/uploads/${uploadId}/complete`, null, { timeout: 300000 }),
+  cancelar: (uploadId) => api.delete(`/uploads/${uploadId}`),
+  // Envia o arquivo retomando da próxima parte pendente; retorna o upload_id concluído
+  enviarArquivo: async (arquivo, uploadId = null, onProgress = null) => {
+    const sessao = uploadId ? (await uploadsAPI.status(uploadId)).data : (await uploadsAPI.iniciar(arquivo)).data
+    for (let indice = sessao.proximo_chunk ?? sessao.total_chunks; indice < sessao.total_chunks; indice++) {
+      const inicio = indice * sessao.chunk_size
+      await uploadsAPI.enviarParte(sessao.upload_id, indice, arquivo.slice(inicio, inicio + sessao.chunk_size))
+      if (onProgress) onProgress((indice + 1) / sessao.total_chunks, sessao.upload_id)
+    }
+    const concluido = await uploadsAPI.concluir(sessao.upload_id)
+    return concluido.data.upload_id
+  },
+}
+
 // APIs de Obras
 export const obrasAPI = {
   listar: () => api.get("/obras/"),